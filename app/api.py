@@ -0,0 +1,167 @@
+"""
+This module defines the JSON API served by the Flask server of the web-app, next to
+the Dash UI. It calls the service layer directly and returns compact JSON:
+    GET  /api/similar/<movie_id>?k=10              similar movies of a movie
+    POST /api/similar  {"movie_ids": [...], "k": 10}  similar movies of many movies
+    GET  /api/top?type=movie&genre=Drama&year=2000  most popular IMDb titles
+    GET  /api/resolve?title=godfathr&k=5           movie ids of an approximate title
+    POST /api/resolve  {"titles": [...], "k": 1}     movie ids of many approximate titles
+"""
+import numpy as np
+from flask import Blueprint, jsonify, request
+
+from app.app import DATA
+from app import imdb_service
+from app import netflix_service as nmr
+
+DEFAULT_K = 10
+MAX_BATCH = 1000
+RESOLVE_K = 1
+SCORE_DECIMALS = 4
+DEFAULT_TYPE = 'movie'
+TOP_COLUMNS = {'tconst': 'tconst', 'primaryTitle': 'title', 'startYear': 'year',
+               'weightedAverage': 'weightedAverage'}
+
+API = Blueprint('api', __name__, url_prefix='/api')
+
+
+def error(message, status=400):
+    """
+    Returns: JSON response with the error message and the HTTP status
+    """
+    return jsonify({'error': message}), status
+
+
+def get_k(value):
+    """
+    It validates the number of similar movies asked for
+    Args:
+        value: value of the k parameter, or None
+    Returns: k as a positive int, or None if it is not valid
+    """
+    if value is None:
+        return DEFAULT_K
+    if isinstance(value, bool):
+        return None
+    try:
+        k = int(value)
+    except (TypeError, ValueError):
+        return None
+    return k if k > 0 else None
+
+
+def resolve(title, k):
+    """
+    It resolves an approximate title to the closest movies
+    Args:
+        title: free-text title
+        k: maximum number of movies
+    Returns: List of dictionaries with the id, title and score of the movies
+    """
+    return [{'id': movie_id, 'title': display, 'score': round(score, SCORE_DECIMALS)}
+            for movie_id, display, score in nmr.resolve_titles(DATA.fuzzy_titles, title, k)]
+
+
+def similar_movies(movie_ids, k):
+    """
+    It reads the k most similar movies of several indexed movies at once
+    Args:
+        movie_ids: list of indexed movie ids
+        k: number of similar movies per movie
+    Returns: Dictionary from each movie id (str) to its similar movie ids and scores
+    """
+    neighbour_ids, scores = nmr.get_neighbours(DATA.dict_rec, movie_ids)
+    return {str(movie_id): {
+        'ids': np.asarray(ids[:k]).tolist(),
+        'scores': np.round(np.asarray(score[:k], dtype=np.float64), SCORE_DECIMALS).tolist()}
+            for movie_id, ids, score in zip(movie_ids, neighbour_ids, scores)}
+
+
+@API.route('/similar/<int:movie_id>')
+def similar(movie_id):
+    """
+    Returns: JSON with the ids and scores of the k movies most similar to movie_id
+    """
+    k = get_k(request.args.get('k'))
+    if k is None:
+        return error('k must be a positive integer')
+    if movie_id not in DATA.dict_rec:
+        return error('Unknown movie id: %d' % movie_id, 404)
+    result = similar_movies([movie_id], k)[str(movie_id)]
+    return jsonify(dict(movie_id=movie_id, **result))
+
+
+@API.route('/similar', methods=['POST'])
+def similar_batch():
+    """
+    Returns: JSON with the similar movies of every known movie id of the request,
+    and the list of the unknown movie ids
+    """
+    body = request.get_json(silent=True) or {}
+    movie_ids = body.get('movie_ids')
+    k = get_k(body.get('k'))
+    # bool is a subclass of int, but JSON true and false are not movie ids.
+    if not isinstance(movie_ids, list) or not all(
+            isinstance(movie_id, int) and not isinstance(movie_id, bool)
+            for movie_id in movie_ids):
+        return error('movie_ids must be a list of integers')
+    if len(movie_ids) > MAX_BATCH:
+        return error('At most %d movie ids per request' % MAX_BATCH)
+    if k is None:
+        return error('k must be a positive integer')
+    movie_ids = list(dict.fromkeys(movie_ids))
+    known = [movie_id for movie_id in movie_ids if movie_id in DATA.dict_rec]
+    missing = [movie_id for movie_id in movie_ids if movie_id not in DATA.dict_rec]
+    results = similar_movies(known, k) if known else {}
+    return jsonify({'results': results, 'missing': missing})
+
+
+@API.route('/resolve')
+def resolve_title():
+    """
+    Returns: JSON with the k movies whose title is the closest to the title parameter
+    """
+    title = request.args.get('title', '')
+    k = get_k(request.args.get('k', RESOLVE_K))
+    if not title.strip():
+        return error('title must not be empty')
+    if k is None:
+        return error('k must be a positive integer')
+    return jsonify({'title': title, 'results': resolve(title, k)})
+
+
+@API.route('/resolve', methods=['POST'])
+def resolve_batch():
+    """
+    Returns: JSON with the k closest movies of every title of the request, in order
+    """
+    body = request.get_json(silent=True) or {}
+    titles = body.get('titles')
+    k = get_k(body.get('k', RESOLVE_K))
+    if not isinstance(titles, list) or not all(isinstance(title, str) for title in titles):
+        return error('titles must be a list of strings')
+    if len(titles) > MAX_BATCH:
+        return error('At most %d titles per request' % MAX_BATCH)
+    if k is None:
+        return error('k must be a positive integer')
+    return jsonify({'results': [resolve(title, k) for title in titles]})
+
+
+@API.route('/top')
+def top():
+    """
+    Returns: JSON with the most popular IMDb titles of a title type, optionally
+    filtered by genre and year, sorted by descending weighted average
+    """
+    year = request.args.get('year')
+    if year is not None:
+        try:
+            year = int(year)
+        except ValueError:
+            return error('year must be an integer')
+    top_df = imdb_service.filter_facets(DATA.facet_index, DATA.imdb_df,
+                                        request.args.get('type', DEFAULT_TYPE),
+                                        request.args.get('genre') or None, year)
+    columns = {name: top_df[column].tolist() for column, name in TOP_COLUMNS.items()}
+    results = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    return jsonify({'results': results})
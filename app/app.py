@@ -2,33 +2,78 @@
 This is the main file that hosts the web-app. It has dash app initialization and callouts.
 """
 import os
+from functools import lru_cache
 import dash
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
+from flask import Response
 
 from app import netflix_service as nmr
 from app import imdb_service
+from app.data_registry import DataRegistry
+from app import metrics
+from app.response_cache import ResponseCache
 from app.web import layout
 
-# Loading the necessary files: movies_df, imdf_df, dict_rec
+# Registering the necessary files, loaded on first use: movies_df, imdf_df, dict_rec
 DATA_FOLDER = 'data'
 BINGEWATCH_FOLDER = 'app'
 PRE_PROCESSED_DIR = 'pre_processed'
 DATASET_DIR = 'dataset'
 MOVIES_FILE = 'movie_titles.csv'
-IMDB_FILE = 'imdb_df.csv'
+IMDB_FILE = 'imdb_df.pkl'
 GENRE_FILE = 'set_genres.pkl'
-DICT_REC = 'dict_recommendations.pkl'
+GENRE_VOCAB_FILE = 'genre_vocabulary.pkl'
+DICT_REC = 'recommendations.idx'
+EMBEDDINGS_FILE = 'item_embeddings.idx'
+# Set to 'embeddings' to recommend from the latent-factor model.
+RECOMMENDER_MODEL = os.environ.get('RECOMMENDER_MODEL', 'cosine')
 
 DATA_DIR = os.path.join(BINGEWATCH_FOLDER, DATA_FOLDER)
 MOVIES_FILE_PATH = os.path.join(DATA_DIR, DATASET_DIR, MOVIES_FILE)
 IMDB_PATH = os.path.join(DATA_DIR, DATASET_DIR, IMDB_FILE)
 GENRES_PATH = os.path.join(DATA_DIR, PRE_PROCESSED_DIR, GENRE_FILE)
+GENRE_VOCAB_PATH = os.path.join(DATA_DIR, PRE_PROCESSED_DIR, GENRE_VOCAB_FILE)
 DICT_REC_PATH = os.path.join(DATA_DIR, PRE_PROCESSED_DIR, DICT_REC)
+EMBEDDINGS_PATH = os.path.join(DATA_DIR, PRE_PROCESSED_DIR, EMBEDDINGS_FILE)
+REC_CACHE_SIZE = 1024
+RESPONSE_CACHE_SIZE = 4096
+RESPONSE_CACHE_DISK_SIZE = 65536
+# Directory of the on-disk tier of the response cache, shared by the server workers.
+RESPONSE_CACHE_DIR = os.environ.get('RESPONSE_CACHE_DIR')
+
+DATA = DataRegistry()
+DATA.register('imdb_df', imdb_service.load_data, IMDB_PATH)
+DATA.register('movies_df', nmr.reading_movie_title_csv, MOVIES_FILE_PATH)
+DATA.register('genres', imdb_service.load_genres, GENRES_PATH)
+DATA.register('genre_vocab', imdb_service.load_genre_vocabulary, GENRE_VOCAB_PATH)
+DATA.register('facet_index', lambda: imdb_service.build_facet_index(
+    DATA.imdb_df, genres_vocab=DATA.genre_vocab))
+if RECOMMENDER_MODEL == 'embeddings':
+    DATA.register('dict_rec', nmr.EmbeddingIndex, EMBEDDINGS_PATH)
+else:
+    DATA.register('dict_rec', nmr.recommendation_for_movies, DICT_REC_PATH)
+DATA.register('title_index', lambda: nmr.build_title_index(DATA.movies_df))
+DATA.register('title_search', lambda: nmr.build_title_search(DATA.movies_df['Display']))
+DATA.register('fuzzy_titles', lambda: nmr.build_fuzzy_title_index(DATA.movies_df))
+
+
+def reload_data():
+    """
+    It drops the loaded data and everything memoized from it, so that they are
+    loaded again from the new data files
+    """
+    DATA.clear()
+    cached_recommendation.cache_clear()
+    choice_based_recommendation.choice_based_recommendation_layout.cache_clear()
+    filter_based_recommendation.tab2_layout.cache_clear()
+
 
-IMDB_DF = imdb_service.load_data(IMDB_PATH)
-MOVIES_DF = nmr.reading_movie_title_csv(MOVIES_FILE_PATH)
-GENRES = imdb_service.load_genres(GENRES_PATH)
-DICT_REC = nmr.recommendation_for_movies(DICT_REC_PATH)
+# Serialized callback responses, invalidated when any of the data files changes.
+RESPONSES = ResponseCache(RESPONSE_CACHE_SIZE, [MOVIES_FILE_PATH, IMDB_PATH, GENRES_PATH,
+                                                GENRE_VOCAB_PATH, DICT_REC_PATH,
+                                                EMBEDDINGS_PATH], RESPONSE_CACHE_DIR,
+                          RESPONSE_CACHE_DISK_SIZE, on_change=reload_data)
 
 EXTERNAL_STYLESHEETS = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 app = dash.Dash(__name__, external_stylesheets=EXTERNAL_STYLESHEETS)
@@ -38,44 +83,118 @@ app.layout = layout()
 
 ## Late Import to avoid circular import
 from app.web import choice_based_recommendation, filter_based_recommendation
+from app.api import API
+
+app.server.register_blueprint(API)
 
 
 @app.callback(Output('tabs-content-display', 'children'),
               [Input('tabs-example', 'value')])
+@metrics.timed('render_content')
 def render_content(tab):
     """
     This function displays tabs based on user selection of tab
     """
     if tab == 'tab-2':
-        return filter_based_recommendation.TAB2_LAYOUT
-    return choice_based_recommendation.CHOICE_BASED_RECOMMENDATION_LAYOUT
+        return filter_based_recommendation.tab2_layout()
+    return choice_based_recommendation.choice_based_recommendation_layout()
 
 
 ## Tab-1: Choice Based Recommendation
-@app.callback(Output('my-table', 'children'), [Input('movie_list_input', 'value')])
-def update_table(selected_movie):
+@lru_cache(maxsize=REC_CACHE_SIZE)
+@metrics.timed('cached_recommendation')
+def cached_recommendation(movie_ids):
     """
-    It returns the html table of top 10 movies
+    It returns the top 10 movies recommended for a tuple of seed movie ids. The
+    result is memoized in a bounded LRU cache; cached_recommendation.cache_info()
+    gives the hit and miss counts. The returned dataframe is shared and must not be
+    modified.
     Args:
-        selected_movie: user input of movie title
-    Returns: Html table of 10 movies
+        movie_ids: sorted tuple of movie ids resolved from the user selection
+    Returns: Dataframe of the 10 recommended movies
+    """
+    if len(movie_ids) == 1:
+        return nmr.movie_id_based_recommendation(movie_ids[0], DATA.movies_df,
+                                                 DATA.dict_rec, DATA.title_index)
+    return nmr.movies_based_recommendation(list(movie_ids), DATA.movies_df, DATA.dict_rec,
+                                           DATA.title_index)
+
+
+@app.callback(Output('movie_list_input', 'options'),
+              [Input('movie_list_input', 'search_value')],
+              [State('movie_list_input', 'value')])
+@metrics.timed('update_movie_options')
+def update_movie_options(search_value, selected_movies):
     """
-    movie_list = nmr.userchoice_based_movie_recommendation(selected_movie, MOVIES_DF, DICT_REC)
-    return choice_based_recommendation.generate_table(movie_list)
+    It searches the movies as their title is typed, so that the dropdown only
+    receives the matching titles instead of the whole catalog
+    Args:
+        search_value: text typed in the dropdown
+        selected_movies: movie titles already selected, which must stay in the options
+    Returns: Dropdown options of the selected and the matching movies
+    """
+    if not search_value:
+        raise PreventUpdate
+    matches = nmr.search_titles(DATA.title_search, search_value)
+    return nmr.get_options(list(dict.fromkeys((selected_movies or []) + matches)))
 
 
-@app.callback(Output('my-scatter-plot', 'figure'), [Input('movie_list_input', 'value')])
-def update_figure(selected_movie):
+def recommendation_response(movie_ids):
     """
-    This returns bar plot of movies along match scores
+    It returns the html table of top 10 movies and the bar plot of their match
+    scores for a selection, served from the response cache
     Args:
-        selected_movie: user input of movie title
-    Returns: Bar plot of movies & match %age
+        movie_ids: sorted tuple of movie ids resolved from the user selection
+    Returns: Html table of 10 movies, Bar plot of movies & match %age
     """
-    movie_list2 = nmr.userchoice_based_movie_recommendation(selected_movie, MOVIES_DF, DICT_REC)
-    return choice_based_recommendation.update_figure(movie_list2)
+    def render():
+        movie_list = cached_recommendation(movie_ids)
+        return (choice_based_recommendation.generate_table(movie_list),
+                choice_based_recommendation.update_figure(movie_list))
+    inputs = [RECOMMENDER_MODEL, [int(movie_id) for movie_id in movie_ids]]
+    return RESPONSES.get_or_compute('update_recommendation', inputs, render)
+
+
+@app.callback([Output('my-table', 'children'), Output('my-scatter-plot', 'figure')],
+              [Input('movie_list_input', 'value')])
+@metrics.timed('update_recommendation')
+def update_recommendation(selected_movies):
+    """
+    It returns the html table of top 10 movies and the bar plot of their match
+    scores, both served from a single recommendation
+    Args:
+        selected_movies: user input of one or several movie titles
+    Returns: Html table of 10 movies, Bar plot of movies & match %age
+    """
+    if not selected_movies:
+        raise PreventUpdate
+    # The order of the seeds does not change the recommendation, and the movies
+    # without recommendations in the index are left out.
+    movie_ids = tuple(sorted(movie_id for movie_id in nmr.get_movie_ids(
+        DATA.movies_df, selected_movies, DATA.title_index) if movie_id in DATA.dict_rec))
+    if not movie_ids:
+        raise PreventUpdate
+    return recommendation_response(movie_ids)
 
 ## Tab2:Genre/Time Based_recommendation callback
+def filter_response(selected_type, genre, year):
+    """
+    It returns the bar plot of the top titles of a facet, served from the
+    response cache
+    Args:
+        selected_type: title type, movie or tvSeries
+        genre: genre of the titles, or None for every genre
+        year: start year of the titles, or None for every year
+    Returns: Bar plot of titles with their weighted average
+    """
+    def render():
+        final_df = imdb_service.filter_facets(DATA.facet_index, DATA.imdb_df, selected_type,
+                                              genre, year)
+        return filter_based_recommendation.update_figure(final_df)
+    return RESPONSES.get_or_compute('update_figure_tab2', [selected_type, genre, year],
+                                    render)
+
+
 @app.callback(
     Output('graph-with-slider', 'figure'),
     [Input('filter-checklist', 'value'),
@@ -83,6 +202,7 @@ def update_figure(selected_movie):
      Input('title-type', 'value'),
      Input('genre-dropdown', 'value')
      ])
+@metrics.timed('update_figure_tab2')
 def update_figure_tab2(selected_filters, selected_year, selected_type, selected_genre):
     """
     Returns bar plot of movies with their weighted average
@@ -90,12 +210,26 @@ def update_figure_tab2(selected_filters, selected_year, selected_type, selected_
     genre_filtered = imdb_service.filter_selected(selected_filters, 'Genre')
     year_filtered = imdb_service.filter_selected(selected_filters, 'Year')
 
-    final_df = imdb_service.filter_type(IMDB_DF, selected_type)
-    if genre_filtered and selected_genre:
-        final_df = imdb_service.filter_genre(final_df, selected_genre)
-    if year_filtered and selected_year:
-        final_df = imdb_service.filter_year(final_df, selected_year)
-
-    final_df = imdb_service.filter_top10(final_df)
-
-    return filter_based_recommendation.update_figure(final_df)
+    genre = selected_genre if genre_filtered and selected_genre else None
+    year = selected_year if year_filtered and selected_year else None
+    return filter_response(selected_type, genre, year)
+
+
+## Metrics: cache hit rates and data load times, served by /metrics when enabled
+metrics.register_cache('recommendations', cached_recommendation.cache_info)
+metrics.register_cache('responses', RESPONSES.cache_info)
+# Looked up when read, as the layout modules may still be importing this module.
+metrics.register_cache('choice_based_layout', lambda: choice_based_recommendation
+                       .choice_based_recommendation_layout.cache_info())
+metrics.register_cache('filter_based_layout',
+                       lambda: filter_based_recommendation.tab2_layout.cache_info())
+metrics.register_gauge('data_load_seconds', 'Time taken to load each dataset.',
+                       lambda: dict(DATA.load_times))
+
+if metrics.ENABLED:
+    @app.server.route('/metrics')
+    def metrics_endpoint():
+        """
+        Returns: The metrics in the Prometheus text format
+        """
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -4,10 +4,9 @@ IMDb website and the Netflix Prize Dataset from Kaggle. Please look at
 the instructions on how to obtain the Netflix dataset before executing
 this script.
 """
-import shutil
+import argparse
 import os
-
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 
 import helper_functions as hf
 
@@ -15,6 +14,8 @@ PROCESSED_DIR = 'pre_processed'
 TXT_EXT = '.txt'
 CSV_EXT = '.csv'
 PKL_EXT = '.pkl'
+IDX_EXT = '.idx'
+NPZ_EXT = '.npz'
 
 # NETFLIX Constants
 NF_KAGGLE_USER = 'netflix-inc'
@@ -22,58 +23,202 @@ NF_DIRECTORY = 'netflix-prize-data'
 NF_FILE_NAME = 'combined_data_'
 FILE_I = list(range(1, 5))
 LIST_NF_FILES = [NF_FILE_NAME+str(i)+TXT_EXT for i in FILE_I]
-DF_NF_COLS = ['movie_id', 'user_id', 'rating', 'rating_date']
-DICT_NAME = 'dict_recommendations'
+INDEX_NAME = 'recommendations'
+STATE_NAME = 'similarity_state'
+EMBEDDINGS_NAME = 'item_embeddings'
+INDEX_PATH = os.path.join(PROCESSED_DIR, INDEX_NAME+IDX_EXT)
+STATE_PATH = os.path.join(PROCESSED_DIR, STATE_NAME+NPZ_EXT)
+EMBEDDINGS_PATH = os.path.join(PROCESSED_DIR, EMBEDDINGS_NAME+IDX_EXT)
 TITLE_FILE_NAME = 'movie_titles'
-TITLES_PATH = os.path.join(NF_DIRECTORY, TITLE_FILE_NAME+CSV_EXT)
 
 # IMDb Constants
 IMDB_TITLES_URL = 'https://datasets.imdbws.com/title.basics.tsv.gz'
 IMDB_RATINGS_URL = 'https://datasets.imdbws.com/title.ratings.tsv.gz'
 IMDB_FILE_NAME = 'imdb_df'
 GENRES_FILE_NAME = 'set_genres'
+GENRES_VOCAB_FILE_NAME = 'genre_vocabulary'
 
 
-def process_netflix():
+def process_netflix(workers=1, backend='exact', embedding_dim=0, source=None):
     """
     Processing Netflix dataset: download and parse data, create final
     files and storing them
+    Parameters:
+        workers = Number of processes used to compute the similarities.
+        backend = Name of the similarity backend ('exact' or 'ivf').
+        embedding_dim = Number of dimensions of the movie embeddings of the
+        latent-factor model, which are not computed if 0.
+        source = Directory or zip archive of the dataset; by default it
+        is downloaded from Kaggle and deleted once processed.
     """
-    # Download the files, unzip them and get the data in a dataframe.
-    hf.download_netflix_data(NF_KAGGLE_USER, NF_DIRECTORY)
-    list_nf_data = []
-
-    for file in LIST_NF_FILES:
-        list_nf_data += hf.parse_data(os.path.join(NF_DIRECTORY, file))
-        df_netflix = pd.DataFrame(list_nf_data, columns=DF_NF_COLS)
-
-    # Get the movie recommendation dictionary and store in data folder.
-    dict_recommendations = hf.get_recommended_movies(df_netflix)
-    hf.save_file(dict_recommendations, PROCESSED_DIR, DICT_NAME, PKL_EXT)
+    # Download the archive, then read the files straight from it into a
+    # dataframe.
+    downloaded = source is None
+    if downloaded:
+        source = hf.download_netflix_data(NF_KAGGLE_USER, NF_DIRECTORY)
+    nf_files = [hf.open_dataset_file(source, file) for file in LIST_NF_FILES]
+    try:
+        df_netflix = hf.read_ratings(nf_files)
+    finally:
+        for nf_file in nf_files:
+            nf_file.close()
+
+    # Get the movie recommendation index and store in data folder, with
+    # the state used to update it incrementally.
+    state = hf.get_similarity_state(df_netflix)
+    index = hf.build_recommendation_index(state, workers, backend=backend)
+    hf.save_file(index, PROCESSED_DIR, INDEX_NAME, IDX_EXT)
+    hf.save_file(state, PROCESSED_DIR, STATE_NAME, NPZ_EXT)
+    if embedding_dim:
+        hf.save_file(hf.get_embedding_index(state, embedding_dim), PROCESSED_DIR,
+                     EMBEDDINGS_NAME, IDX_EXT)
 
     # Cleaning the movie_titles file
-    df_titles = hf.format_movie_titles(TITLES_PATH)
+    with hf.open_dataset_file(source, TITLE_FILE_NAME+CSV_EXT) as titles_file:
+        df_titles = hf.format_movie_titles(titles_file)
     hf.save_file(df_titles, PROCESSED_DIR, TITLE_FILE_NAME, CSV_EXT)
 
-    #Deleting original Netflix dataset directory
-    shutil.rmtree(NF_DIRECTORY)
+    #Deleting the downloaded Netflix dataset
+    if downloaded:
+        os.remove(source)
 
 
-def process_imdb():
+def update_netflix(delta_files, workers=1, backend='exact'):
+    """
+    Updating the movie recommendation index with new Netflix ratings,
+    recomputing only the neighbours that can have changed.
+    Parameters:
+        delta_files = Paths to files with the new ratings, in the format
+        of the combined_data files.
+        workers = Number of processes used if the index must be rebuilt.
+        backend = Name of the similarity backend used for a rebuild.
+    """
+    index = hf.read_index(INDEX_PATH)
+    state = hf.load_similarity_state(STATE_PATH)
+    df_delta = hf.read_ratings(delta_files)
+    index, state = hf.update_recommendation_index(index, state, df_delta, workers=workers,
+                                                  backend=backend)
+    hf.save_file(index, PROCESSED_DIR, INDEX_NAME, IDX_EXT)
+    hf.save_file(state, PROCESSED_DIR, STATE_NAME, NPZ_EXT)
+
+    # The embeddings are recomputed so that they cover the new movies.
+    if os.path.exists(EMBEDDINGS_PATH):
+        embedding_dim = hf.read_index(EMBEDDINGS_PATH)['embeddings'].shape[1]
+        hf.save_file(hf.get_embedding_index(state, embedding_dim), PROCESSED_DIR,
+                     EMBEDDINGS_NAME, IDX_EXT)
+
+
+def parse_digest(value):
+    """
+    Parse a FILE=SHA256 command line argument.
+    Parameters:
+        value = Name of a downloaded file and its expected SHA-256 digest.
+    Returns: Tuple with the file name and the lowercase digest.
+    """
+    file_name, _, sha256 = value.partition('=')
+    sha256 = sha256.strip().lower()
+    if not file_name or len(sha256) != 64 or \
+            any(char not in '0123456789abcdef' for char in sha256):
+        raise argparse.ArgumentTypeError('expected FILE=SHA256, got ' + value)
+    return file_name, sha256
+
+
+def process_imdb(mirror=None, cache_dir=None, digests=None):
     """
     Processing IMDb dataset: download, merge and clean data, store
     final dataframe and unique genres.
+    Parameters:
+        mirror = Optional directory, file:// or http(s):// URL holding the
+        IMDb files under their original names, e.g. for offline runs.
+        cache_dir = Optional directory where the downloaded files are kept
+        and reused by the next runs.
+        digests = Optional dictionary with the expected SHA-256 digest of
+        IMDb files, by file name; checking a downloaded file needs
+        cache_dir.
     """
-    # Download the data and store the cleaned and merged datasets.
-    df_imdb_titles = hf.download_gz_file(IMDB_TITLES_URL)
-    df_imdb_ratings = hf.download_gz_file(IMDB_RATINGS_URL)
+    digests = digests or {}
+    # Download both files at the same time, reading only the needed titles
+    # and columns while they are decompressed, then clean and merge them.
+    urls = [hf.get_source_url(url, mirror) for url in [IMDB_TITLES_URL, IMDB_RATINGS_URL]]
+    sha256s = [digests.get(url.split("/")[-1]) for url in urls]
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        titles_future = executor.submit(hf.download_gz_file, urls[0], hf.read_imdb_titles,
+                                        cache_dir, sha256s[0])
+        ratings_future = executor.submit(hf.download_gz_file, urls[1],
+                                         hf.read_imdb_ratings, cache_dir, sha256s[1])
+        df_imdb_titles = titles_future.result()
+        df_imdb_ratings = ratings_future.result()
     df_imdb = hf.clean_imdb_data(df_imdb_titles, df_imdb_ratings)
-    hf.save_file(df_imdb, PROCESSED_DIR, IMDB_FILE_NAME, CSV_EXT)
 
-    # Get unique genres and storing them in data folder.
+    # Get unique genres and their bitmask vocabulary, and store them in
+    # data folder with the genre bitmask of every title.
     genres = hf.get_unique_genres(df_imdb)
+    genres_vocab = hf.get_genre_vocabulary(genres)
+    df_imdb = hf.add_genre_mask(df_imdb, genres_vocab)
+    df_imdb = hf.set_imdb_dtypes(df_imdb)
+    hf.save_file(df_imdb, PROCESSED_DIR, IMDB_FILE_NAME, PKL_EXT)
     hf.save_file(genres, PROCESSED_DIR, GENRES_FILE_NAME, PKL_EXT)
+    hf.save_file(genres_vocab, PROCESSED_DIR, GENRES_VOCAB_FILE_NAME, PKL_EXT)
 
 
-process_netflix()
-process_imdb()
+def process_all(workers=1, backend='exact', embedding_dim=0, netflix_source=None,
+                imdb_mirror=None, cache_dir=None, digests=None):
+    """
+    Processing both datasets. The IMDb files are fetched and processed in
+    a thread while the Netflix dataset is downloaded, so the fetch stage
+    lasts as long as the slowest download. The movie similarities are
+    computed afterwards, once the thread is done, as their worker
+    processes are forked.
+    Parameters:
+        workers, backend, embedding_dim = See process_netflix.
+        netflix_source = Optional directory or zip archive of the Netflix
+        dataset, instead of downloading it.
+        imdb_mirror, cache_dir, digests = See process_imdb.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        imdb_future = executor.submit(process_imdb, imdb_mirror, cache_dir, digests)
+        source = netflix_source or hf.download_netflix_data(NF_KAGGLE_USER, NF_DIRECTORY)
+        imdb_future.result()
+    process_netflix(workers, backend, embedding_dim, source)
+    if not netflix_source:
+        os.remove(source)
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__)
+    PARSER.add_argument('--workers', type=int, default=1,
+                        help='number of processes used to compute the '
+                        'movie similarities')
+    PARSER.add_argument('--update', nargs='+', metavar='RATINGS_FILE',
+                        help='only update the movie recommendations with the '
+                        'new ratings in these files')
+    PARSER.add_argument('--backend', choices=sorted(hf.SIMILARITY_BACKENDS),
+                        default='exact',
+                        help='similarity search: exact, or approximate with an '
+                        'inverted file index over SVD embeddings (ivf)')
+    PARSER.add_argument('--embeddings', type=int, nargs='?', const=hf.EMBEDDING_DIM,
+                        default=0, metavar='DIM',
+                        help='also store the movie embeddings of the latent-factor '
+                        'model, with DIM dimensions (default: %d)' % hf.EMBEDDING_DIM)
+    PARSER.add_argument('--netflix-source', metavar='PATH',
+                        help='directory or zip archive of the Netflix dataset, '
+                        'instead of downloading it from Kaggle')
+    PARSER.add_argument('--imdb-source', metavar='DIR_OR_URL',
+                        help='directory, file:// or http(s):// URL holding the '
+                        'IMDb files, instead of the IMDb website')
+    PARSER.add_argument('--cache-dir', metavar='DIR',
+                        help='keep the downloaded IMDb files in DIR, checked '
+                        'with their SHA-256 and resumed if interrupted')
+    PARSER.add_argument('--sha256', type=parse_digest, action='append', default=[],
+                        metavar='FILE=SHA256',
+                        help='expected SHA-256 digest of a downloaded IMDb file, '
+                        'e.g. title.basics.tsv.gz=...; can be repeated')
+    ARGS = PARSER.parse_args()
+    if ARGS.sha256 and not ARGS.cache_dir and \
+            hf.get_local_path(hf.get_source_url(IMDB_TITLES_URL, ARGS.imdb_source)) is None:
+        PARSER.error('--sha256 needs --cache-dir to check downloaded files')
+    if ARGS.update:
+        update_netflix(ARGS.update, ARGS.workers, ARGS.backend)
+    else:
+        process_all(ARGS.workers, ARGS.backend, ARGS.embeddings, ARGS.netflix_source,
+                    ARGS.imdb_source, ARGS.cache_dir, dict(ARGS.sha256))
@@ -0,0 +1,72 @@
+"""
+This module defines the formats of the preprocessed files, shared by the
+data processing scripts that write them and the web-app that reads them.
+It does not import the preprocessing libraries, so that the server
+workers can import it cheaply.
+"""
+import json
+import struct
+
+import numpy as np
+
+
+IDX_MAGIC = b'BWRECIDX'
+IDX_VERSION = 1
+IDX_ALIGN = 64
+IDX_HEADER_FORMAT = '<II'
+TOP_K = 99
+# Title types kept in the IMDb dataframe.
+TYPE_FILTER = ['movie', 'tvSeries']
+# Column of the IMDb dataframe holding the bitmask of the genres of a title.
+GENRE_MASK_COL = 'genreMask'
+# Compact dtypes of the columns of the IMDb dataframe.
+IMDB_DTYPES = {'titleType': 'category', 'genres': 'category', 'startYear': np.int16,
+               'averageRating': np.float32, 'numVotes': np.int32}
+
+
+def get_aligned_size(size):
+    """
+    Round a size in bytes up to the next multiple of IDX_ALIGN.
+    Parameters:
+        size = Size in bytes.
+    Returns: The aligned size.
+    """
+    return -(-size // IDX_ALIGN) * IDX_ALIGN
+
+
+def write_index_header(file_open, specs):
+    """
+    Write the header of an index file: IDX_MAGIC, the format version, the
+    length of the JSON header and the JSON header giving the dtype, shape
+    and offset of each array.
+    Parameters:
+        file_open = Binary file open for writing, positioned at its start.
+        specs = Dictionary with the name and the spec of each array.
+    Returns: The position of the first array, offsets being relative to it.
+    """
+    header = json.dumps(specs).encode()
+    file_open.write(IDX_MAGIC)
+    file_open.write(struct.pack(IDX_HEADER_FORMAT, IDX_VERSION, len(header)))
+    file_open.write(header)
+    return get_aligned_size(len(IDX_MAGIC) + struct.calcsize(IDX_HEADER_FORMAT)
+                            + len(header))
+
+
+def read_index_header(file_open):
+    """
+    Read and check the header written by write_index_header.
+    Parameters:
+        file_open = Binary file open for reading, positioned at its start.
+    Returns: Tuple of the dictionary with the name and the spec of each
+    array, and the position of the first array.
+    """
+    magic = file_open.read(len(IDX_MAGIC))
+    header_size = struct.calcsize(IDX_HEADER_FORMAT)
+    fields = file_open.read(header_size)
+    if magic != IDX_MAGIC or len(fields) != header_size:
+        raise ValueError('Unsupported index file: ' + str(file_open.name))
+    version, header_len = struct.unpack(IDX_HEADER_FORMAT, fields)
+    if version != IDX_VERSION:
+        raise ValueError('Unsupported index file: ' + str(file_open.name))
+    specs = json.loads(file_open.read(header_len).decode())
+    return specs, get_aligned_size(len(IDX_MAGIC) + header_size + header_len)
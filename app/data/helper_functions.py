@@ -2,42 +2,99 @@
 This module defines all the functions used in the data_processing.py
 module.
 """
+import hashlib
+import http.client
+import io
 import pickle
+import urllib.error
+import urllib.parse
 import urllib.request
 import gzip
 import os
+import shutil
+import tempfile
 import zipfile
+from multiprocessing import Pool
 
 import pandas as pd
 import numpy as np
 from scipy import sparse
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.utils.extmath import randomized_svd
+
+try:
+    from app.data.formats import (GENRE_MASK_COL, IMDB_DTYPES, TOP_K, TYPE_FILTER,
+                                  get_aligned_size, read_index_header, write_index_header)
+except ImportError:  # run as a script from app/data by data_processing.py
+    from formats import (GENRE_MASK_COL, IMDB_DTYPES, TOP_K, TYPE_FILTER, get_aligned_size,
+                         read_index_header, write_index_header)
 
 
 ZIP_EXT = '.zip'
 CSV_EXT = '.csv'
+IDX_EXT = '.idx'
+NPZ_EXT = '.npz'
 ENC = 'iso8859_2'
 NF_TITLES_COLS = ['Sno', 'Year', 'Final_title', 'Display']
 TAB = '\t'
 NAS = ['\\N']
-TYPE_FILTER = ['movie', 'tvSeries']
 COL_SUBSET = ['tconst', 'titleType', 'primaryTitle', 'startYear', 'genres']
+MAX_GENRES = 63
+IMDB_TITLE_DTYPES = {'tconst': str, 'titleType': str, 'primaryTitle': str,
+                     'startYear': np.float64, 'genres': str}
+IMDB_RATING_DTYPES = {'tconst': str, 'averageRating': np.float64, 'numVotes': np.int64}
+IMDB_CHUNK_SIZE = 500000
+NF_RAW_COLS = ['user_id', 'rating', 'rating_date']
+NF_COLS = ['movie_id', 'user_id', 'rating', 'rating_date']
+CHUNK_SIZE = 1000000
+EPOCH = np.datetime64('1970-01-01', 'D')
+BLOCK_SIZE = 256
+BLOCKS_PER_SHARD = 4
+EMBEDDING_DIM = 64
+IVF_PROBE = 8
+IVF_ITERATIONS = 10
+RECALL_SAMPLE = 1000
+RANDOM_SEED = 0
+DOWNLOAD_BUFFER_SIZE = 1 << 20
+DOWNLOAD_RETRIES = 3
+# Seconds without data after which a download is retried.
+DOWNLOAD_TIMEOUT = 60
+PART_EXT = '.part'
+SHA256_EXT = '.sha256'
 
 def download_netflix_data(user, directory):
     """
-    Download Netflix dataset from Kaggle and unzip directory.
+    Download Netflix dataset from Kaggle. The archive is not extracted:
+    its files are read straight from it with open_dataset_file.
     Parameters:
         user = Kaggle user owner of the dataset.
         directory = directory name that is downloaded.
-    Returns: Directory unzipped in the current working directory.
+    Returns: Path of the downloaded zip archive.
     """
     nf_file = directory+ZIP_EXT
     #os.system('kaggle datasets download -d netflix-inc/netflix-prize-data')
     os.system('kaggle datasets download -d '+user+'/'+directory)
-    with zipfile.ZipFile(nf_file, 'r') as zip_ref:
-        zip_ref.extractall(directory)
-    os.remove(nf_file)
-    print('The', directory, 'dataset was downloaded and unzipped.')
+    print('The', directory, 'dataset was downloaded.')
+    return nf_file
+
+
+def open_dataset_file(source, name):
+    """
+    Open a file of a dataset stored in a directory or in a zip archive,
+    decompressing it while it is read instead of extracting it.
+    Parameters:
+        source = Directory or zip archive of the dataset.
+        name = Name of the file, wherever it is in the archive.
+    Returns: The file opened in binary mode.
+    """
+    if not zipfile.is_zipfile(source):
+        return open(os.path.join(source, name), 'rb')
+    with zipfile.ZipFile(source) as zip_ref:
+        members = [member for member in zip_ref.namelist()
+                   if os.path.basename(member) == name]
+        if not members:
+            raise FileNotFoundError(name + ' is not in ' + source)
+        # The member keeps the archive open until it is closed.
+        return zip_ref.open(members[0])
 
 
 def parse_data(file_path):
@@ -61,37 +118,749 @@ def parse_data(file_path):
     return final_list
 
 
-def get_recommended_movies(movies):
+def iter_rating_chunks(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Stream the movie ratings file in chunks of typed NumPy columns, so
+    that memory is bounded by the chunk size instead of the file size.
+    The 'movie_id:' header lines are parsed by the C reader as floats
+    (':' acts as the decimal mark) and forward-filled onto the ratings.
+    Parameters:
+        file_path = path (or open file) of a combined_data file.
+        chunk_size = number of lines read per chunk.
+    Returns: Generator of dataframes with int32 movie_id and user_id,
+    int8 rating and int16 rating_date (days since 1970-01-01).
+    """
+    reader = pd.read_csv(file_path, header=None, names=NF_RAW_COLS,
+                         decimal=':', chunksize=chunk_size,
+                         dtype={'user_id': np.float64, 'rating': np.float32})
+    current_movie_id = -1
+    for chunk in reader:
+        first_col = chunk['user_id'].to_numpy()
+        is_header = np.isnan(chunk['rating'].to_numpy())
+        # Position of the last header line seen at or before each row.
+        header_pos = np.where(is_header, np.arange(len(chunk)), -1)
+        np.maximum.accumulate(header_pos, out=header_pos)
+        movie_ids = np.where(header_pos >= 0, first_col[header_pos],
+                             current_movie_id)
+        if len(chunk):
+            current_movie_id = movie_ids[-1]
+        is_rating = ~is_header
+        dates = pd.to_datetime(chunk['rating_date'][is_rating],
+                               format='%Y-%m-%d').to_numpy()
+        yield pd.DataFrame({
+            'movie_id': movie_ids[is_rating].astype(np.int32),
+            'user_id': first_col[is_rating].astype(np.int32),
+            'rating': chunk['rating'].to_numpy()[is_rating].astype(np.int8),
+            'rating_date': (dates.astype('datetime64[D]') - EPOCH).astype(np.int16)
+            }, columns=NF_COLS)
+
+
+def read_ratings(file_paths, chunk_size=CHUNK_SIZE):
+    """
+    Read one or more movie ratings files into a single typed dataframe,
+    streaming each file in chunks.
+    Parameters:
+        file_paths = list of paths (or open files) of the combined_data files.
+        chunk_size = number of lines read per chunk.
+    Returns: Dataframe with the columns movie_id, user_id, rating and
+    rating_date, using the dtypes of iter_rating_chunks.
+    """
+    chunks = []
+    for file_path in file_paths:
+        chunks += list(iter_rating_chunks(file_path, chunk_size))
+        print('Done parsing file: ', getattr(file_path, 'name', file_path))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def get_rating_matrix(movies):
+    """
+    Build the sparse movie x user matrix of raw ratings, keeping only the
+    rows of the movies that have ratings.
+    Parameters:
+        movies = Dataframe with all the movie ratings per user.
+    Returns: Array with the movie id of each row and the float32 CSR matrix.
+    """
+    sparse_data = sparse.csr_matrix((movies.rating.to_numpy(np.float32),
+                                     (movies.movie_id, movies.user_id)))
+    movie_ids = np.flatnonzero(np.diff(sparse_data.indptr)).astype(np.int32)
+    return movie_ids, sparse_data[movie_ids]
+
+
+def get_row_norms(ratings):
+    """
+    Compute the L2 norm of each row of a rating matrix.
+    Parameters:
+        ratings = CSR matrix of ratings.
+    Returns: Float64 array with the norm of each row.
+    """
+    squares = ratings.astype(np.float64)
+    squares.data **= 2
+    return np.sqrt(np.asarray(squares.sum(axis=1)).ravel())
+
+
+def normalize_rows(ratings, norms):
+    """
+    Divide each row of a rating matrix by its norm, so that the dot
+    product of two rows is their cosine similarity.
+    Parameters:
+        ratings = CSR matrix of ratings.
+        norms = Norm of each row, from get_row_norms.
+    Returns: The normalized float32 CSR matrix.
+    """
+    items = ratings.astype(np.float32)
+    items.data /= np.repeat(norms, np.diff(items.indptr)).astype(np.float32)
+    return items
+
+
+def get_item_matrix(movies):
+    """
+    Build the sparse movie x user rating matrix with L2-normalized rows,
+    so that the dot product of two rows is their cosine similarity.
+    Parameters:
+        movies = Dataframe with all the movie ratings per user.
+    Returns: Array with the movie id of each row and the normalized
+    float32 CSR matrix.
+    """
+    movie_ids, ratings = get_rating_matrix(movies)
+    return movie_ids, normalize_rows(ratings, get_row_norms(ratings))
+
+
+def top_k_columns(scores, k, columns=None):
+    """
+    Keep the k largest scores of each row of a dense score matrix.
+    Parameters:
+        scores = Dense matrix with the candidate scores of each row.
+        k = Number of neighbours to keep per row.
+        columns = Optional matrix with the row position of each candidate;
+        by default the candidates are the columns of scores.
+    Returns: Row positions (int32) and scores (float32) of the
+    neighbours, sorted by descending score and then by position.
+    """
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    if columns is not None:
+        top = np.take_along_axis(columns, top, axis=1)
+    order = np.lexsort((top, -top_scores))
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return top.astype(np.int32), top_scores.astype(np.float32)
+
+
+def top_k_rows(items, items_t, rows, k):
+    """
+    Compute the k most similar rows for some rows of items, excluding
+    each row itself.
+    Parameters:
+        items = Normalized CSR matrix from get_item_matrix.
+        items_t = Transpose of items in CSR format.
+        rows = Array with the positions of the rows to compute.
+        k = Number of neighbours to keep per row.
+    Returns: Row positions (int32) and scores (float32) of the
+    neighbours, sorted by descending score.
+    """
+    block = (items[rows] @ items_t).toarray()
+    block[np.arange(len(rows)), rows] = -np.inf
+    return top_k_columns(block, k)
+
+
+def top_k_block(items, items_t, start, stop, k):
+    """
+    Compute the k most similar rows for the rows start:stop of items,
+    excluding each row itself.
+    Parameters:
+        items = Normalized CSR matrix from get_item_matrix.
+        items_t = Transpose of items in CSR format.
+        start, stop = Range of rows to compute.
+        k = Number of neighbours to keep per row.
+    Returns: Row positions (int32) and scores (float32) of the
+    neighbours, sorted by descending score.
+    """
+    return top_k_rows(items, items_t, np.arange(start, stop), k)
+
+
+def save_shared_matrix(matrix, directory, name):
+    """
+    Store the arrays of a CSR matrix as .npy files, so that worker
+    processes can memory-map them instead of receiving a pickled copy.
+    Parameters:
+        matrix = CSR matrix to store.
+        directory = Folder where to store the arrays.
+        name = Prefix of the stored file names.
+    Returns: The .npy files in the directory.
+    """
+    for part in ['data', 'indices', 'indptr']:
+        np.save(os.path.join(directory, name+'_'+part+'.npy'), getattr(matrix, part))
+
+
+def load_shared_matrix(directory, name, shape):
+    """
+    Memory-map a CSR matrix stored with save_shared_matrix.
+    Parameters:
+        directory = Folder where the arrays are stored.
+        name = Prefix of the stored file names.
+        shape = Shape of the matrix.
+    Returns: CSR matrix backed by the memory-mapped arrays.
+    """
+    data, indices, indptr = [np.load(os.path.join(directory, name+'_'+part+'.npy'),
+                                     mmap_mode='r')
+                             for part in ['data', 'indices', 'indptr']]
+    return sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+def top_k_shard(task):
+    """
+    Process pool worker: compute the top k neighbours of one shard of
+    rows from the memory-mapped item matrix.
+    Parameters:
+        task = Tuple (directory, shape, start, stop, k, block_size).
+    Returns: Tuple with start, and the neighbours and scores of the shard.
+    """
+    directory, shape, start, stop, k, block_size = task
+    items = load_shared_matrix(directory, 'items', shape)
+    items_t = load_shared_matrix(directory, 'items_t', shape[::-1])
+    neighbours = np.empty((stop - start, k), dtype=np.int32)
+    scores = np.empty((stop - start, k), dtype=np.float32)
+    for block_start in range(start, stop, block_size):
+        block_stop = min(block_start + block_size, stop)
+        rows = slice(block_start - start, block_stop - start)
+        neighbours[rows], scores[rows] = top_k_block(items, items_t, block_start,
+                                                     block_stop, k)
+    return start, neighbours, scores
+
+
+def get_top_k_similar(items, k=TOP_K, block_size=BLOCK_SIZE, workers=1):
+    """
+    Compute the top k cosine similarities of every row of items, one
+    block of rows at a time, so the full similarity matrix is never
+    materialized. With several workers, the rows are sharded across a
+    process pool that memory-maps the matrix; the result is identical
+    to the single-process build.
+    Parameters:
+        items = Normalized CSR matrix from get_item_matrix.
+        k = Number of neighbours to keep per row.
+        block_size = Number of rows computed at once.
+        workers = Number of processes to use.
+    Returns: Row positions int32[N, k] and scores float32[N, k] of the
+    neighbours of each row, sorted by descending score.
+    """
+    n_items = items.shape[0]
+    k = max(min(k, n_items - 1), 0)
+    neighbours = np.empty((n_items, k), dtype=np.int32)
+    scores = np.empty((n_items, k), dtype=np.float32)
+    if k == 0:
+        return neighbours, scores
+    items_t = items.T.tocsr()
+    if workers <= 1:
+        for start in range(0, n_items, block_size):
+            stop = min(start + block_size, n_items)
+            neighbours[start:stop], scores[start:stop] = top_k_block(
+                items, items_t, start, stop, k)
+        return neighbours, scores
+
+    directory = tempfile.mkdtemp()
+    try:
+        save_shared_matrix(items, directory, 'items')
+        save_shared_matrix(items_t, directory, 'items_t')
+        shard_size = block_size * BLOCKS_PER_SHARD
+        tasks = [(directory, items.shape, start, min(start + shard_size, n_items),
+                  k, block_size) for start in range(0, n_items, shard_size)]
+        with Pool(workers) as pool:
+            for start, shard_neighbours, shard_scores in pool.imap_unordered(
+                    top_k_shard, tasks):
+                stop = start + len(shard_neighbours)
+                neighbours[start:stop] = shard_neighbours
+                scores[start:stop] = shard_scores
+    finally:
+        shutil.rmtree(directory)
+    return neighbours, scores
+
+
+def get_item_embeddings(items, dim=EMBEDDING_DIM, seed=RANDOM_SEED):
+    """
+    Compute dense item embeddings with a randomized truncated SVD of the
+    normalized rating matrix, so that the dot product of two embeddings
+    approximates the cosine similarity of the two movies.
+    Parameters:
+        items = Normalized CSR matrix from get_item_matrix.
+        dim = Number of latent dimensions.
+        seed = Seed of the random projections.
+    Returns: float32 matrix [N, dim] with L2-normalized rows.
+    """
+    dim = max(min(dim, min(items.shape)), 1)
+    left, singular, _ = randomized_svd(items, dim, random_state=seed)
+    embeddings = (left * singular).astype(np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+def get_ivf_lists(embeddings, n_lists, iterations=IVF_ITERATIONS, seed=RANDOM_SEED):
+    """
+    Partition the embeddings into inverted lists with spherical k-means.
+    Parameters:
+        embeddings = Normalized embeddings from get_item_embeddings.
+        n_lists = Number of lists (clusters).
+        iterations = Number of k-means iterations.
+        seed = Seed used to pick the initial centroids.
+    Returns: Normalized centroids [n_lists, dim] and the list of each row.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = embeddings[rng.choice(len(embeddings), n_lists, replace=False)]
+    for _ in range(iterations):
+        assignments = np.argmax(embeddings @ centroids.T, axis=1)
+        members = sparse.csr_matrix(
+            (np.ones(len(assignments), dtype=np.float32),
+             (assignments, np.arange(len(assignments)))),
+            shape=(n_lists, len(assignments)))
+        sums = members @ embeddings
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # An empty list keeps its previous centroid.
+        centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1), centroids)
+    return centroids, np.argmax(embeddings @ centroids.T, axis=1)
+
+
+def top_k_cluster(items, cluster, ivf, k, n_probe, block_size):
+    """
+    Compute the top k neighbours of the movies of one IVF cluster among
+    the movies of its n_probe nearest clusters.
+    Parameters:
+        items = Normalized CSR matrix from get_item_matrix.
+        cluster = Position of the cluster.
+        ivf = Tuple (order, bounds, centroid_scores): the rows sorted by
+        cluster, the bounds of each cluster in order and the similarities
+        of the centroids.
+        k = Number of neighbours to keep per row.
+        n_probe = Number of clusters searched for each movie.
+        block_size = Number of rows computed at once.
+    Returns: Tuple with the rows of the cluster, and their neighbours and
+    scores.
+    """
+    order, bounds, centroid_scores = ivf
+    sizes = np.diff(bounds)
+    rows = order[bounds[cluster]:bounds[cluster + 1]]
+    nearest = np.argsort(-centroid_scores[cluster], kind='stable')
+    probed = np.concatenate([[cluster], nearest[nearest != cluster]])
+    # Probe more clusters when needed to get at least k candidates.
+    n_probed = max(n_probe, np.searchsorted(np.cumsum(sizes[probed]), k + 1) + 1)
+    candidates = np.sort(np.concatenate(
+        [order[bounds[c]:bounds[c + 1]] for c in probed[:n_probed]]))
+    candidates_t = items[candidates].T.tocsr()
+    neighbours = np.empty((len(rows), k), dtype=np.int32)
+    scores = np.empty((len(rows), k), dtype=np.float32)
+    for start in range(0, len(rows), block_size):
+        positions = slice(start, start + block_size)
+        block_rows = rows[positions]
+        block = (items[block_rows] @ candidates_t).toarray()
+        block[np.arange(len(block_rows)),
+              np.searchsorted(candidates, block_rows)] = -np.inf
+        neighbours[positions], scores[positions] = top_k_columns(
+            block, k, np.broadcast_to(candidates, block.shape))
+    return rows, neighbours, scores
+
+
+def top_k_clusters_shard(task):
+    """
+    Process pool worker: compute the top k neighbours of the movies of a
+    shard of IVF clusters from the memory-mapped item matrix.
+    Parameters:
+        task = Tuple (directory, shape, clusters, ivf, k, n_probe, block_size),
+        see top_k_cluster.
+    Returns: List with the rows, neighbours and scores of each cluster.
+    """
+    directory, shape, clusters, ivf, k, n_probe, block_size = task
+    items = load_shared_matrix(directory, 'items', shape)
+    return [top_k_cluster(items, cluster, ivf, k, n_probe, block_size)
+            for cluster in clusters]
+
+
+def get_top_k_similar_ivf(items, k=TOP_K, block_size=BLOCK_SIZE, workers=1,
+                          n_lists=None, n_probe=IVF_PROBE, dim=EMBEDDING_DIM):
+    """
+    Approximate get_top_k_similar with an inverted file index over
+    truncated-SVD item embeddings. The movies are clustered, and the
+    movies of each cluster are only compared with the movies of the
+    n_probe clusters with the nearest centroids, using their exact cosine
+    similarity. The cost grows with N * n_probe * N / n_lists instead of
+    N * N. With several workers, the clusters are sharded across a
+    process pool that memory-maps the matrix; the result is identical
+    to the single-process build.
+    Parameters:
+        items = Normalized CSR matrix from get_item_matrix.
+        k = Number of neighbours to keep per row.
+        block_size = Number of rows computed at once.
+        workers = Number of processes to use.
+        n_lists = Number of clusters, by default the square root of N.
+        n_probe = Number of clusters searched for each movie.
+        dim = Number of latent dimensions of the embeddings.
+    Returns: Row positions int32[N, k] and scores float32[N, k] of the
+    neighbours of each row, sorted by descending score.
+    """
+    n_items = items.shape[0]
+    k = max(min(k, n_items - 1), 0)
+    neighbours = np.empty((n_items, k), dtype=np.int32)
+    scores = np.empty((n_items, k), dtype=np.float32)
+    if k == 0:
+        return neighbours, scores
+    n_lists = min(n_lists or max(int(np.sqrt(n_items)), 1), n_items)
+    centroids, assignments = get_ivf_lists(get_item_embeddings(items, dim), n_lists)
+    order = np.argsort(assignments, kind='stable')
+    bounds = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+    ivf = (order, bounds, centroids @ centroids.T)
+    clusters = np.flatnonzero(np.diff(bounds))
+    if workers <= 1:
+        for cluster in clusters:
+            rows, neighbours[rows], scores[rows] = top_k_cluster(items, cluster, ivf, k,
+                                                                 n_probe, block_size)
+        return neighbours, scores
+
+    directory = tempfile.mkdtemp()
+    try:
+        save_shared_matrix(items, directory, 'items')
+        shards = np.array_split(clusters, min(len(clusters), workers * BLOCKS_PER_SHARD))
+        tasks = [(directory, items.shape, shard, ivf, k, n_probe, block_size)
+                 for shard in shards]
+        with Pool(workers) as pool:
+            for results in pool.imap_unordered(top_k_clusters_shard, tasks):
+                for rows, cluster_neighbours, cluster_scores in results:
+                    neighbours[rows] = cluster_neighbours
+                    scores[rows] = cluster_scores
+    finally:
+        shutil.rmtree(directory)
+    return neighbours, scores
+
+
+SIMILARITY_BACKENDS = {'exact': get_top_k_similar, 'ivf': get_top_k_similar_ivf}
+
+
+def recall_at_k(exact, approx):
+    """
+    Measure the fraction of the exact neighbours found by an approximate
+    search.
+    Parameters:
+        exact = Row positions [N, k] of the exact neighbours of each row.
+        approx = Row positions [N, k] of the approximate neighbours.
+    Returns: Recall@k, between 0 and 1.
+    """
+    if exact.size == 0:
+        return 1.0
+    offsets = np.arange(len(exact), dtype=np.int64)[:, None] * (
+        int(max(exact.max(), approx.max())) + 1)
+    return np.isin(approx + offsets, exact + offsets).sum() / exact.size
+
+
+def similarity_recall(items, neighbours, sample=RECALL_SAMPLE, block_size=BLOCK_SIZE,
+                      seed=RANDOM_SEED):
+    """
+    Estimate the recall@k of approximate neighbours against the exact
+    cosine similarities, on a random sample of rows.
+    Parameters:
+        items = Normalized CSR matrix from get_item_matrix.
+        neighbours = Row positions [N, k] of the approximate neighbours.
+        sample = Number of rows checked.
+        block_size = Number of rows computed at once.
+        seed = Seed used to pick the rows.
+    Returns: Recall@k, between 0 and 1.
+    """
+    n_items, k = neighbours.shape
+    if k == 0:
+        return 1.0
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(n_items, min(sample, n_items), replace=False))
+    items_t = items.T.tocsr()
+    exact = np.vstack([top_k_rows(items, items_t, rows[start:start + block_size], k)[0]
+                       for start in range(0, len(rows), block_size)])
+    return recall_at_k(exact, neighbours[rows])
+
+
+def get_similarity_state(movies):
+    """
+    Compute the state that the similarities are built from, and that is
+    persisted so they can later be updated incrementally: the raw
+    movie x user rating matrix and the L2 norm of each movie.
+    Parameters:
+        movies = Dataframe with all the movie ratings per user.
+    Returns: Dictionary with the arrays movie_ids, data, indices, indptr,
+    shape and norms.
+    """
+    movie_ids, ratings = get_rating_matrix(movies)
+    return {'movie_ids': movie_ids, 'data': ratings.data, 'indices': ratings.indices,
+            'indptr': ratings.indptr, 'shape': np.array(ratings.shape),
+            'norms': get_row_norms(ratings)}
+
+
+def state_matrix(state):
+    """
+    Rebuild the rating matrix stored in a similarity state.
+    Parameters:
+        state = Dictionary from get_similarity_state.
+    Returns: The float32 CSR rating matrix.
+    """
+    return sparse.csr_matrix((state['data'], state['indices'], state['indptr']),
+                             shape=tuple(state['shape']))
+
+
+def build_recommendation_index(state, workers=1, score_dtype=np.float32, backend='exact'):
+    """
+    Compute the arrays of the recommendation index from a similarity state.
+    Parameters:
+        state = Dictionary from get_similarity_state.
+        workers = Number of processes used to compute the similarities.
+        score_dtype = Dtype used to store the scores (float32 or float16).
+        backend = Name of the similarity backend in SIMILARITY_BACKENDS.
+    Returns: Dictionary with the arrays movie_ids int32[N],
+    neighbour_ids int32[N, k], scores [N, k] and num_ratings int32[N].
+    """
+    items = normalize_rows(state_matrix(state), state['norms'])
+    neighbours, scores = SIMILARITY_BACKENDS[backend](items, workers=workers)
+    print('Done computing the movie similarities')
+    if backend != 'exact':
+        print('Recall@%d of the %s backend against the exact similarities: %.3f'
+              % (neighbours.shape[1], backend, similarity_recall(items, neighbours)))
+    return {'movie_ids': state['movie_ids'],
+            'neighbour_ids': state['movie_ids'][neighbours],
+            'scores': scores.astype(score_dtype),
+            'num_ratings': get_num_ratings(state)}
+
+
+def get_num_ratings(state):
+    """
+    Count the ratings of every movie of a similarity state.
+    Parameters:
+        state = Dictionary from get_similarity_state.
+    Returns: Array int32[N] with the number of ratings of each movie.
+    """
+    return np.diff(state['indptr']).astype(np.int32)
+
+
+def get_recommendation_index(movies, workers=1, score_dtype=np.float32, backend='exact'):
+    """
+    Compute the arrays of the recommendation index: the top k most
+    similar movies of every rated movie, based on cosine similarity.
+    Parameters:
+        movies = Dataframe with all the movie ratings per user.
+        workers = Number of processes used to compute the similarities.
+        score_dtype = Dtype used to store the scores (float32 or float16).
+        backend = Name of the similarity backend in SIMILARITY_BACKENDS.
+    Returns: Dictionary with the arrays movie_ids int32[N],
+    neighbour_ids int32[N, k], scores [N, k] and num_ratings int32[N].
+    """
+    return build_recommendation_index(get_similarity_state(movies), workers, score_dtype,
+                                      backend)
+
+
+def get_embedding_index(state, dim=EMBEDDING_DIM):
+    """
+    Compute the latent-factor model of the movies: dense float32 item
+    embeddings from a truncated SVD of the normalized rating matrix, from
+    which the app computes the similar movies at query time.
+    Parameters:
+        state = Dictionary from get_similarity_state.
+        dim = Number of latent dimensions.
+    Returns: Dictionary with the arrays movie_ids int32[N],
+    embeddings float32[N, dim] and num_ratings int32[N].
+    """
+    items = normalize_rows(state_matrix(state), state['norms'])
+    embeddings = get_item_embeddings(items, dim)
+    print('Done computing the movie embeddings')
+    return {'movie_ids': state['movie_ids'], 'embeddings': embeddings,
+            'num_ratings': get_num_ratings(state)}
+
+
+def apply_ratings(state, delta):
+    """
+    Apply a batch of ratings to a similarity state. A new rating of a
+    user for a movie replaces the previous one, and new movies are added
+    at the end of the rows.
+    Parameters:
+        state = Dictionary from get_similarity_state.
+        delta = Dataframe with the new movie ratings per user.
+    Returns: The updated state and the row positions of the movies whose
+    ratings changed.
+    """
+    delta = delta.drop_duplicates(['movie_id', 'user_id'], keep='last')
+    new_movies = np.setdiff1d(delta.movie_id.unique(), state['movie_ids'])
+    movie_ids = np.concatenate([state['movie_ids'], new_movies.astype(np.int32)])
+    shape = (len(movie_ids), max(int(state['shape'][1]), int(delta.user_id.max()) + 1))
+    indptr = np.concatenate([state['indptr'],
+                             np.full(len(new_movies), state['indptr'][-1])])
+    ratings = sparse.csr_matrix((state['data'], state['indices'], indptr), shape=shape)
+
+    rows = pd.Index(movie_ids).get_indexer(delta.movie_id)
+    changes = sparse.csr_matrix((delta.rating.to_numpy(np.float32), (rows, delta.user_id)),
+                                shape=shape)
+    replaced = changes.copy()
+    replaced.data[:] = 1
+    ratings = ratings - ratings.multiply(replaced) + changes
+    ratings.eliminate_zeros()
+
+    changed = np.unique(rows)
+    norms = np.concatenate([state['norms'], np.zeros(len(new_movies))])
+    norms[changed] = get_row_norms(ratings[changed])
+    return {'movie_ids': movie_ids, 'data': ratings.data, 'indices': ratings.indices,
+            'indptr': ratings.indptr, 'shape': np.array(shape), 'norms': norms}, changed
+
+
+def update_recommendation_index(index, state, delta, block_size=BLOCK_SIZE, workers=1,
+                                backend='exact'):
+    """
+    Update the recommendation index with a batch of new ratings. Only the
+    similarities involving the movies whose ratings changed are computed:
+    those movies get new neighbours, and every other movie merges its
+    previous neighbours with its new scores against the changed movies.
+    A movie whose merged list falls below its previous k-th score may be
+    missing a neighbour, so it is recomputed in full. All the scores are
+    computed block_size rows at a time, so the memory used does not grow
+    with N times the number of changed movies. When more than half of the
+    movies changed, the index is rebuilt.
+    Parameters:
+        index = Dictionary with the arrays of the current index.
+        state = Dictionary from get_similarity_state, matching the index.
+        delta = Dataframe with the new movie ratings per user.
+        block_size = Number of rows computed at once.
+        workers = Number of processes used for a rebuild.
+        backend = Name of the similarity backend used for a rebuild.
+    Returns: The updated index and similarity state.
+    """
+    state, changed = apply_ratings(state, delta)
+    movie_ids = state['movie_ids']
+    n_items = len(movie_ids)
+    k = max(min(TOP_K, n_items - 1), 0)
+    old_scores = np.asarray(index['scores'], dtype=np.float32)
+    score_dtype = index['scores'].dtype
+    if k == 0 or old_scores.shape[1] < k or 2 * len(changed) > n_items:
+        print('Too many changes, rebuilding the recommendation index')
+        return build_recommendation_index(state, workers, score_dtype, backend), state
+
+    items = normalize_rows(state_matrix(state), state['norms'])
+    items_t = items.T.tocsr()
+    neighbours = np.empty((n_items, k), dtype=np.int32)
+    scores = np.empty((n_items, k), dtype=np.float32)
+    for start in range(0, len(changed), block_size):
+        rows = changed[start:start + block_size]
+        neighbours[rows], scores[rows] = top_k_rows(items, items_t, rows, k)
+    changed_t = items[changed].T.tocsr()
+
+    old_neighbours = pd.Index(movie_ids).get_indexer(
+        np.asarray(index['neighbour_ids']).ravel()).reshape(old_scores.shape)
+    old_neighbours, old_scores = old_neighbours[:, :k], old_scores[:, :k]
+    is_changed = np.zeros(n_items, dtype=bool)
+    is_changed[changed] = True
+    unchanged = np.flatnonzero(~is_changed)
+    recompute = [np.empty(0, dtype=np.int64)]
+    for start in range(0, len(unchanged), block_size):
+        rows = unchanged[start:start + block_size]
+        candidates = np.hstack([old_neighbours[rows],
+                                np.broadcast_to(changed, (len(rows), len(changed)))])
+        candidate_scores = np.hstack([
+            np.where(is_changed[old_neighbours[rows]], -np.inf, old_scores[rows]),
+            (items[rows] @ changed_t).toarray()])
+        neighbours[rows], scores[rows] = top_k_columns(candidate_scores, k, candidates)
+        # Movies outside the previous list score at most its k-th score.
+        recompute.append(rows[scores[rows, -1] < old_scores[rows, -1]])
+    recompute = np.concatenate(recompute)
+    for start in range(0, len(recompute), block_size):
+        rows = recompute[start:start + block_size]
+        neighbours[rows], scores[rows] = top_k_rows(items, items_t, rows, k)
+    print('Updated the neighbours of', len(changed), 'changed movies and recomputed',
+          len(recompute), 'other movies')
+    return {'movie_ids': movie_ids,
+            'neighbour_ids': movie_ids[neighbours],
+            'scores': scores.astype(score_dtype),
+            'num_ratings': get_num_ratings(state)}, state
+
+
+def get_recommended_movies(movies, workers=1, backend='exact'):
     """
     Creating a dictionary with the recommended movies, based on the
     cosine similarity between them.
     Parameters:
         movies = Dataframe with all the movie ratings per user.
+        workers = Number of processes used to compute the similarities.
+        backend = Name of the similarity backend in SIMILARITY_BACKENDS.
     Returns: Dictionary with the recommended movies for each movie id.
     """
-    sparse_data = sparse.csr_matrix((movies.rating,
-                                     (movies.user_id, movies.movie_id)))
-    similarity = cosine_similarity(sparse_data.T, dense_output=False)
-    movie_ids = np.unique(similarity.nonzero())
+    index = get_recommendation_index(movies, workers, backend=backend)
     similar_movies_dict = dict()
-    for movie in movie_ids:
-        rec_movies_ids = np.argsort(-similarity[movie].toarray().ravel())[1:100]
-        score_lst = sorted(similarity[movie].toarray().ravel(), reverse=True)
-        rec_movies_score = np.array(score_lst[1:100])
-        similar_movies_dict[movie] = [rec_movies_ids, rec_movies_score]
+    for row, movie in enumerate(index['movie_ids']):
+        similar_movies_dict[int(movie)] = [index['neighbour_ids'][row],
+                                           index['scores'][row]]
     print('Done creating cosine similarity dictionary')
     return similar_movies_dict
 
 
+def write_index(arrays, file_path):
+    """
+    Write named arrays into a binary index file that can be opened with
+    np.memmap. The file starts with the header of formats.write_index_header
+    giving the dtype, shape and offset of each array. The arrays follow the
+    header, each stored contiguously and aligned to IDX_ALIGN bytes; offsets
+    are relative to the first aligned byte after the header.
+    Parameters:
+        arrays = Dictionary with the name and the array to store.
+        file_path = Path of the index file.
+    Returns: The index file in the desired location.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    specs = {}
+    offset = 0
+    for name, array in arrays.items():
+        specs[name] = {'dtype': array.dtype.str, 'shape': list(array.shape),
+                       'offset': offset}
+        offset += get_aligned_size(array.nbytes)
+    # Written aside and renamed, so processes that have the previous file
+    # memory-mapped keep reading it unchanged.
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as file_open:
+        data_start = write_index_header(file_open, specs)
+        for name, array in arrays.items():
+            file_open.seek(data_start + specs[name]['offset'])
+            file_open.write(array.tobytes())
+        file_open.truncate(data_start + offset)
+    os.replace(tmp_path, file_path)
+
+
+def read_index(file_path):
+    """
+    Read all the arrays of an index file written by write_index.
+    Parameters:
+        file_path = Path of the index file.
+    Returns: Dictionary with the name and the array of each entry.
+    """
+    with open(file_path, 'rb') as file_open:
+        specs, data_start = read_index_header(file_open)
+        arrays = {}
+        for name, spec in specs.items():
+            file_open.seek(data_start + spec['offset'])
+            count = int(np.prod(spec['shape']))
+            arrays[name] = np.fromfile(file_open, dtype=spec['dtype'],
+                                       count=count).reshape(spec['shape'])
+    return arrays
+
+
+def load_similarity_state(file_path):
+    """
+    Load a similarity state stored with save_file.
+    Parameters:
+        file_path = Path of the .npz file.
+    Returns: Dictionary with the arrays of the state.
+    """
+    with np.load(file_path) as state:
+        return {name: state[name] for name in state.files}
+
+
 def format_movie_titles(titles_path):
     """
     Remove the commas in the movie title and adds the Display column.
     Parameters:
-        titles_path = path to the movie_titles file from the Netflix data.
+        titles_path = path (or file open in binary mode) of the
+        movie_titles file from the Netflix data.
     Returns: A dataframe with the formatted data.
     """
-    with open(titles_path, 'r', encoding=ENC) as file:
-        data = file.readlines()
+    if isinstance(titles_path, (str, os.PathLike)):
+        with open(titles_path, 'r', encoding=ENC) as file:
+            data = file.readlines()
+    else:
+        data = io.TextIOWrapper(titles_path, encoding=ENC).readlines()
     final_list = []
     for line in data:
         current_line = line[:-1]
@@ -104,44 +873,358 @@ def format_movie_titles(titles_path):
     return movie_titles
 
 
-def download_gz_file(url):
+def get_source_url(url, mirror=None):
     """
-    Download and unzip tsv file.
+    Get the location a file is fetched from: the URL itself, or the file
+    of the same name in a mirror, e.g. a local directory for offline runs.
     Parameters:
-        url = URL where the file is stored.
-    Returns: Downloaded file in a dataframe.
+        url = URL of the file.
+        mirror = Optional directory, file:// or http(s):// URL holding the
+        files under their original names.
+    Returns: The URL or local path of the file.
     """
+    if not mirror:
+        return url
     file_name = url.split("/")[-1]
-    testfile = urllib.request.URLopener()
-    testfile.retrieve(url, file_name)
-    with gzip.open(file_name) as file_open:
-        df_data = pd.read_csv(file_open, sep=TAB, na_values=NAS)
-    os.remove(file_name)
+    if '://' in mirror:
+        return mirror.rstrip('/') + '/' + file_name
+    return os.path.join(mirror, file_name)
+
+
+def get_local_path(url):
+    """
+    Get the local path of a file:// URL or of a path.
+    Parameters:
+        url = URL or path of the file.
+    Returns: The path, or None for a remote URL.
+    """
+    if url.startswith('file://'):
+        return urllib.request.url2pathname(urllib.parse.urlparse(url).path)
+    if '://' not in url:
+        return url
+    return None
+
+
+def get_file_sha256(file_path):
+    """
+    Compute the SHA-256 digest of a file, reading it in blocks.
+    Parameters:
+        file_path = Path of the file.
+    Returns: The hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file_open:
+        for block in iter(lambda: file_open.read(DOWNLOAD_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_range_total(content_range):
+    """
+    Get the total size of a file from a Content-Range header.
+    Parameters:
+        content_range = Header value, e.g. 'bytes 100-199/200' or 'bytes */200'.
+    Returns: The size in bytes, or None if it is unknown.
+    """
+    if not content_range:
+        return None
+    total = content_range.rsplit('/', 1)[-1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def is_cached(file_path, sha256=None):
+    """
+    Check that a downloaded file is complete and unchanged, against the
+    expected digest or else against the digest recorded when it was
+    downloaded. A file that fails the check is removed.
+    Parameters:
+        file_path = Path of the cached file.
+        sha256 = Optional expected SHA-256 digest.
+    Returns: True if the file can be used.
+    """
+    if not os.path.exists(file_path):
+        return False
+    if sha256 is None and os.path.exists(file_path + SHA256_EXT):
+        with open(file_path + SHA256_EXT) as file_open:
+            sha256 = file_open.read().strip()
+    if sha256 is not None and get_file_sha256(file_path) == sha256:
+        return True
+    print('Discarding the corrupted or unverified file', file_path)
+    os.remove(file_path)
+    return False
+
+
+class CachingDownload(io.RawIOBase):
+    """
+    Readable stream of a remote file that is saved to a local cache while
+    it is read, so that it can be parsed during the download. An
+    interrupted or truncated download is resumed: the part already saved,
+    by this run or by a previous one, is read back first, and the rest is
+    requested with an HTTP Range header, with up to DOWNLOAD_RETRIES
+    attempts. The file is complete once the size announced by the server
+    is received; its SHA-256 digest is then checked and recorded next to
+    it, and the file is moved into place.
+    """
+
+    def __init__(self, url, file_path, sha256=None):
+        super().__init__()
+        self.url = url
+        self.file_path = file_path
+        self.sha256 = sha256
+        self.part_path = file_path + PART_EXT
+        self.digest = hashlib.sha256()
+        self.saved = open(self.part_path, 'rb') if os.path.exists(self.part_path) else None
+        self.output = open(self.part_path, 'ab')
+        self.offset = self.output.tell()
+        self.size = None
+        self.response = None
+
+    def readable(self):
+        return True
+
+    def open_response(self):
+        """
+        Request the file from the current offset, and read its total size
+        from the Content-Range or Content-Length header. A server that
+        ignores the Range header sends the whole file, whose start is
+        skipped.
+        Returns: The HTTP response, or None if the saved part is already
+        the whole file.
+        """
+        request = urllib.request.Request(self.url)
+        if self.offset:
+            request.add_header('Range', 'bytes=%d-' % self.offset)
+        try:
+            response = urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT)
+        except urllib.error.HTTPError as error:
+            # 416 Range Not Satisfiable: nothing is left after the saved part.
+            if error.code != 416 or not self.offset:
+                raise
+            self.size = get_range_total(error.headers.get('Content-Range'))
+            error.close()
+            self.check_size()
+            return None
+        if response.status == 206:
+            self.size = get_range_total(response.headers.get('Content-Range'))
+        else:
+            length = response.headers.get('Content-Length')
+            self.size = int(length) if length else None
+        self.check_size()
+        skip = self.offset if response.status != 206 else 0
+        while skip:
+            skipped = len(response.read(min(skip, DOWNLOAD_BUFFER_SIZE)))
+            if not skipped:
+                raise http.client.IncompleteRead(b'', skip)
+            skip -= skipped
+        return response
+
+    def check_size(self):
+        """
+        Check that the saved part is not longer than the file, in which
+        case it is removed so that the next run downloads the file again.
+        """
+        if self.size is not None and self.offset > self.size:
+            os.remove(self.part_path)
+            raise ValueError('The saved part of %s is longer than the file'
+                             % self.url)
+
+    def read_response(self, buffer):
+        """
+        Read the next bytes from the server, reconnecting on errors and
+        when the connection is closed before the end of the file.
+        Returns: The number of bytes read, 0 at the end of the file.
+        """
+        for attempt in range(DOWNLOAD_RETRIES):
+            try:
+                if self.response is None:
+                    if self.size is not None and self.offset == self.size:
+                        return 0
+                    self.response = self.open_response()
+                    if self.response is None:
+                        return 0
+                size = self.response.readinto(buffer)
+                if not size and self.size is not None and self.offset < self.size:
+                    raise http.client.IncompleteRead(b'', self.size - self.offset)
+                return size
+            except (OSError, http.client.HTTPException) as error:
+                if self.response is not None:
+                    self.response.close()
+                    self.response = None
+                if attempt == DOWNLOAD_RETRIES - 1:
+                    raise
+                print('Resuming the download of', self.url, 'after:', repr(error))
+        return 0
+
+    def readinto(self, buffer):
+        if self.saved is not None:
+            size = self.saved.readinto(buffer)
+            if size:
+                self.digest.update(memoryview(buffer)[:size])
+                return size
+            self.saved.close()
+            self.saved = None
+        size = self.read_response(buffer)
+        if not size:
+            self.finish()
+            return 0
+        data = memoryview(buffer)[:size]
+        self.output.write(data)
+        self.digest.update(data)
+        self.offset += size
+        return size
+
+    def finish(self):
+        """
+        Verify the complete file and move it into the cache.
+        """
+        if self.output.closed:
+            return
+        self.output.close()
+        sha256 = self.digest.hexdigest()
+        if self.sha256 is not None and sha256 != self.sha256:
+            os.remove(self.part_path)
+            raise ValueError('Checksum mismatch for %s: expected %s, got %s'
+                             % (self.url, self.sha256, sha256))
+        os.replace(self.part_path, self.file_path)
+        with open(self.file_path + SHA256_EXT, 'w') as file_open:
+            file_open.write(sha256)
+
+    def close(self):
+        for stream in (self.saved, self.response, self.output):
+            if stream is not None:
+                stream.close()
+        super().close()
+
+
+def open_source(url, cache_dir=None, sha256=None):
+    """
+    Open a remote or local file for streaming. A remote file is read from
+    the network, and also saved to cache_dir if it is given, or read from
+    there if it was already downloaded completely.
+    Parameters:
+        url = http(s):// or file:// URL, or path of the file.
+        cache_dir = Optional directory of the downloaded files.
+        sha256 = Optional expected SHA-256 digest of the file, checked
+        for local and cached files, so it needs cache_dir for a remote
+        file.
+    Returns: The file opened in binary mode.
+    """
+    local_path = get_local_path(url)
+    if local_path is not None:
+        if sha256 is not None and get_file_sha256(local_path) != sha256:
+            raise ValueError('Checksum mismatch for ' + local_path)
+        return open(local_path, 'rb')
+    if cache_dir is None:
+        if sha256 is not None:
+            raise ValueError('Checking the digest of %s needs a cache directory' % url)
+        return urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT)
+    os.makedirs(cache_dir, exist_ok=True)
+    file_path = os.path.join(cache_dir, url.split("/")[-1])
+    if is_cached(file_path, sha256):
+        return open(file_path, 'rb')
+    return io.BufferedReader(CachingDownload(url, file_path, sha256), DOWNLOAD_BUFFER_SIZE)
+
+
+def download_gz_file(url, parse=None, cache_dir=None, sha256=None):
+    """
+    Download a gzipped tsv file and parse it while it is decompressed,
+    without writing a temporary file.
+    Parameters:
+        url = URL where the file is stored, or file:// URL or path of a
+        local copy.
+        parse = Optional function reading the unzipped file object into a
+        dataframe, e.g. read_imdb_titles; by default all of it is read.
+        cache_dir = Optional directory where the file is kept, so that
+        the next runs read it from there.
+        sha256 = Optional expected SHA-256 digest of the gzipped file.
+    Returns: Downloaded file in a dataframe.
+    """
+    with open_source(url, cache_dir, sha256) as source:
+        with gzip.GzipFile(fileobj=source) as file_open:
+            if parse is None:
+                df_data = pd.read_csv(file_open, sep=TAB, na_values=NAS)
+            else:
+                df_data = parse(file_open)
+            # Reaches the end of the file, so that a cached download is completed.
+            while file_open.read(DOWNLOAD_BUFFER_SIZE):
+                pass
     return df_data
 
 
+def read_imdb_titles(file_path, chunk_size=IMDB_CHUNK_SIZE):
+    """
+    Read the IMDb titles file, keeping only the columns of COL_SUBSET
+    with explicit dtypes, and only the complete rows of movies and tv
+    series. The file is filtered one chunk at a time, so the titles of
+    the other types are never all in memory.
+    Parameters:
+        file_path = Path (or open file) of title.basics.tsv.
+        chunk_size = Number of lines read per chunk.
+    Returns: Dataframe with the columns of COL_SUBSET.
+    """
+    reader = pd.read_csv(file_path, sep=TAB, na_values=NAS, usecols=COL_SUBSET,
+                         dtype=IMDB_TITLE_DTYPES, chunksize=chunk_size)
+    chunks = [chunk[chunk['titleType'].isin(TYPE_FILTER).to_numpy()
+                    & chunk.notna().all(axis=1).to_numpy()] for chunk in reader]
+    return pd.concat(chunks, ignore_index=True)[COL_SUBSET]
+
+
+def read_imdb_ratings(file_path):
+    """
+    Read the IMDb ratings file with explicit dtypes, indexed by title.
+    Parameters:
+        file_path = Path (or open file) of title.ratings.tsv.
+    Returns: Dataframe with the columns averageRating and numVotes,
+    indexed by tconst.
+    """
+    return pd.read_csv(file_path, sep=TAB, na_values=NAS, dtype=IMDB_RATING_DTYPES,
+                       index_col='tconst')
+
+
 def clean_imdb_data(df_titles, df_ratings):
     """
     Cleaning the IMDb data: keeping only tv series and movies, merging
     the dataframes to get the ratings for each observation, and
-    calculating the weighted average.
+    calculating the weighted average. The rows to keep are found first
+    and the ratings are then gathered through the index of df_ratings,
+    so the data is copied once.
     Parameters:
         df_titles = Dataframe with all the titles from IMDb.
         df_ratings = Dataframe with the ratings for all the titles
-                    from IMDb.
+                    from IMDb, optionally indexed by tconst.
     Returns: Cleaned and merged dataframe.
     """
-    types_filter = df_titles.titleType.isin(TYPE_FILTER)
-    df_titles = df_titles[types_filter][COL_SUBSET]
-    df_merged = df_titles.merge(df_ratings, how='left', left_on='tconst',
-                                right_on='tconst')
+    if df_ratings.index.name != 'tconst':
+        df_ratings = df_ratings.set_index('tconst')
+    rating_rows = df_ratings.index.get_indexer(df_titles['tconst'])
+    rated = df_ratings.notna().all(axis=1).to_numpy()
+    keep = (df_titles['titleType'].isin(TYPE_FILTER).to_numpy()
+            & df_titles[COL_SUBSET].notna().all(axis=1).to_numpy()
+            & (rating_rows >= 0))
+    keep[keep] = rated[rating_rows[keep]]
+    rating_rows = rating_rows[keep]
+    df_merged = df_titles.loc[keep, COL_SUBSET].reset_index(drop=True)
+    for col in df_ratings.columns:
+        df_merged[col] = df_ratings[col].to_numpy()[rating_rows]
     df_merged['titleType'] = df_merged['titleType'].astype(str)
-    df_merged = df_merged.dropna()
     df_merged['weightedAverage'] = df_merged['averageRating']*df_merged['numVotes']
     print('Done cleaning and merging IMDb data')
     return df_merged
 
 
+def set_imdb_dtypes(df_imdb):
+    """
+    Converts the IMDb columns to compact dtypes: categoricals for the
+    title types and genres, int16 for the year, float32 for the ratings
+    and int32 for the number of votes.
+    Parameters:
+        df_imdb = Cleaned IMDb dataframe.
+    Returns: The dataframe with the compact dtypes.
+    """
+    dtypes = {col: dtype for col, dtype in IMDB_DTYPES.items() if col in df_imdb}
+    return df_imdb.astype(dtypes)
+
+
 def get_unique_genres(df_movies):
     """
     Obtains a unique list of possible genres.
@@ -155,6 +1238,37 @@ def get_unique_genres(df_movies):
     return genres_unique
 
 
+def get_genre_vocabulary(genres):
+    """
+    Orders the unique genres, so that each genre is given the bit of
+    its position in the genre bitmask.
+    Parameters:
+        genres = Set with the unique genres.
+    Returns: A sorted list with the genres.
+    """
+    genres_vocab = sorted(genres)
+    if len(genres_vocab) > MAX_GENRES:
+        raise ValueError('Too many genres for a 64-bit genre mask: '
+                         + str(len(genres_vocab)))
+    return genres_vocab
+
+
+def add_genre_mask(df_movies, genres_vocab):
+    """
+    Adds the genreMask column: an integer where bit i is set when the
+    title has the genre genres_vocab[i].
+    Parameters:
+        df_movies = Complete IMDb dataframe.
+        genres_vocab = Sorted list of genres from get_genre_vocabulary.
+    Returns: The dataframe with the genreMask column.
+    """
+    dummies = df_movies['genres'].str.get_dummies(sep=',')
+    dummies = dummies.reindex(columns=genres_vocab, fill_value=0)
+    bits = np.left_shift(1, np.arange(len(genres_vocab), dtype=np.int64))
+    df_movies[GENRE_MASK_COL] = dummies.to_numpy(dtype=np.int64) @ bits
+    return df_movies
+
+
 def save_file(obj, directory, file_name, ext):
     """
     Saves the object in the specified directory. The method used depends
@@ -168,6 +1282,10 @@ def save_file(obj, directory, file_name, ext):
     """
     if ext == CSV_EXT:
         obj.to_csv(os.path.join(directory, file_name+ext), index=False)
+    elif ext == IDX_EXT:
+        write_index(obj, os.path.join(directory, file_name+ext))
+    elif ext == NPZ_EXT:
+        np.savez(os.path.join(directory, file_name+ext), **obj)
     else:
         with open(os.path.join(directory, file_name+ext), 'wb') as file_open:
             pickle.dump(obj, file_open, protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,82 @@
+"""
+This module defines the registry that loads the data files used by the web-app
+when they are first needed, instead of at import time.
+"""
+import threading
+import time
+
+
+class DataRegistry:
+    """
+    Named datasets that are loaded on first access, once, by the loader registered
+    for them. Loading is thread-safe. preload() loads everything up front, e.g. in the
+    gunicorn master (gunicorn --preload) so that the forked workers share the loaded
+    pages copy-on-write instead of each loading their own copy.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._values = {}
+        self._lock = threading.RLock()
+        self.load_times = {}
+
+    def register(self, name, loader, *args):
+        """
+        It registers the loader of a dataset
+        Args:
+            name: name of the dataset, also readable as an attribute of the registry
+            loader: function returning the dataset
+            args: arguments passed to the loader
+        """
+        self._loaders[name] = (loader, args)
+
+    def get(self, name):
+        """
+        It returns a dataset, loading it on the first call
+        Args:
+            name: name of the dataset
+        Returns: The loaded dataset
+        """
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        # Reentrant, so loaders can read the datasets they are built from.
+        with self._lock:
+            if name not in self._values:
+                loader, args = self._loaders[name]
+                start = time.perf_counter()
+                self._values[name] = loader(*args)
+                self.load_times[name] = time.perf_counter() - start
+            return self._values[name]
+
+    def __getattr__(self, name):
+        if name in self.__dict__.get('_loaders', {}):
+            return self.get(name)
+        raise AttributeError(name)
+
+    def is_loaded(self, name):
+        """
+        Returns: True if the dataset has already been loaded
+        """
+        return name in self._values
+
+    def clear(self):
+        """
+        It forgets the loaded datasets, so that they are loaded again from their files
+        on their next access
+        """
+        with self._lock:
+            self._values.clear()
+
+    def preload(self):
+        """
+        It loads every registered dataset that is not loaded yet
+        Returns: Time taken in seconds
+        """
+        start = time.perf_counter()
+        for name in list(self._loaders):
+            self.get(name)
+        duration = time.perf_counter() - start
+        print('Done preloading data in %.2fs' % duration)
+        return duration
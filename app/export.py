@@ -0,0 +1,151 @@
+"""
+This module exports the movie recommendations of every movie, or of a list of movie
+ids, joined with the movie titles, to a JSON lines, csv or Parquet file. The file
+is written one chunk of movies at a time, to a temporary file that replaces the
+output file once it is complete. Run it from the project root:
+    python -m app.export recommendations.csv --k 10
+"""
+import argparse
+import os
+
+from app import netflix_service as nmr
+
+DATA_DIR = os.path.join('app', 'data')
+INDEX_PATH = os.path.join(DATA_DIR, 'pre_processed', 'recommendations.idx')
+TITLES_PATH = os.path.join(DATA_DIR, 'dataset', 'movie_titles.csv')
+FORMATS = {'.jsonl': 'jsonl', '.csv': 'csv', '.parquet': 'parquet'}
+# Parquet types of the exported columns.
+PARQUET_TYPES = {'movie_id': 'int64', 'title': 'string', 'rank': 'int64',
+                 'recommended_id': 'int64', 'recommended_title': 'string',
+                 'score': 'float32'}
+TMP_EXT = '.tmp'
+
+
+def write_jsonl(chunks, path):
+    """
+    It writes the chunks to a JSON lines file, one recommendation per line
+    Args:
+        chunks: iterable of dataframes from iter_recommendation_chunks()
+        path: path of the output file
+    Returns: Number of rows written
+    """
+    n_rows = 0
+    with open(path, 'w') as file:
+        for chunk in chunks:
+            if len(chunk):
+                file.write(chunk.to_json(orient='records', lines=True).rstrip('\n') + '\n')
+            n_rows += len(chunk)
+    return n_rows
+
+
+def write_csv(chunks, path):
+    """
+    It writes the chunks to a csv file
+    Args:
+        chunks: iterable of dataframes from iter_recommendation_chunks()
+        path: path of the output file
+    Returns: Number of rows written
+    """
+    n_rows = 0
+    with open(path, 'w', newline='') as file:
+        file.write(','.join(nmr.EXPORT_COLS) + '\n')
+        for chunk in chunks:
+            chunk.to_csv(file, header=False, index=False)
+            n_rows += len(chunk)
+    return n_rows
+
+
+def write_parquet(chunks, path):
+    """
+    It writes the chunks to a Parquet file, one row group per chunk. It needs the
+    optional pyarrow package
+    Args:
+        chunks: iterable of dataframes from iter_recommendation_chunks()
+        path: path of the output file
+    Returns: Number of rows written
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as error:
+        raise ImportError('Writing Parquet files needs pyarrow: pip install pyarrow') \
+            from error
+    # Every chunk, and an empty export, is written with the same schema.
+    schema = pa.schema([(col, pa.type_for_alias(PARQUET_TYPES[col]))
+                        for col in nmr.EXPORT_COLS])
+    n_rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema,
+                                                    preserve_index=False))
+            n_rows += len(chunk)
+    return n_rows
+
+
+WRITERS = {'jsonl': write_jsonl, 'csv': write_csv, 'parquet': write_parquet}
+
+
+def export_recommendations(path, dict_rec, movies_df, movie_ids=None, k=10,
+                           output_format=None, chunk_size=nmr.EXPORT_CHUNK_SIZE):
+    """
+    It exports the top k recommendations of the movies to a file. The unknown movie
+    ids are skipped and reported, and the file is only replaced once every
+    recommendation is written
+    Args:
+        path: path of the output file
+        dict_rec: mapping containing list of recommended movies for each movie
+        movies_df: pandas dataframe containing details of all movies
+        movie_ids: list of movie ids to export, by default every movie of dict_rec
+        k: number of recommendations per movie
+        output_format: 'jsonl', 'csv' or 'parquet', by default from the file extension
+        chunk_size: number of movies written at once
+    Returns: Number of rows written
+    """
+    if output_format is None:
+        output_format = FORMATS.get(os.path.splitext(path)[1].lower())
+        if output_format is None:
+            raise ValueError('Unknown output format of ' + path)
+    if movie_ids is not None:
+        movie_ids = list(dict.fromkeys(movie_ids))
+        missing = [movie_id for movie_id in movie_ids if movie_id not in dict_rec]
+        if missing:
+            print('Skipping unknown movie ids:', ' '.join(map(str, missing)))
+            movie_ids = [movie_id for movie_id in movie_ids if movie_id in dict_rec]
+    chunks = nmr.iter_recommendation_chunks(dict_rec, movies_df, movie_ids, k, chunk_size)
+    tmp_path = path + TMP_EXT
+    try:
+        n_rows = WRITERS[output_format](chunks, tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return n_rows
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    PARSER.add_argument('output', help='output file (.jsonl, .csv or .parquet)')
+    PARSER.add_argument('--format', choices=sorted(WRITERS), dest='output_format',
+                        help='output format, by default from the file extension')
+    PARSER.add_argument('--ids', type=int, nargs='+', metavar='MOVIE_ID',
+                        help='only export the recommendations of these movies')
+    PARSER.add_argument('--k', type=int, default=10,
+                        help='number of recommendations per movie')
+    PARSER.add_argument('--index', default=INDEX_PATH,
+                        help='recommendation index (.idx), or item embeddings')
+    PARSER.add_argument('--embeddings', action='store_true',
+                        help='the index is an item embeddings file')
+    PARSER.add_argument('--titles', default=TITLES_PATH, help='movie titles csv file')
+    PARSER.add_argument('--chunk-size', type=int, default=nmr.EXPORT_CHUNK_SIZE,
+                        help='number of movies written at once')
+    ARGS = PARSER.parse_args()
+    if ARGS.embeddings:
+        DICT_REC = nmr.EmbeddingIndex(ARGS.index)
+    else:
+        DICT_REC = nmr.recommendation_for_movies(ARGS.index)
+    N_ROWS = export_recommendations(ARGS.output, DICT_REC,
+                                    nmr.reading_movie_title_csv(ARGS.titles), ARGS.ids,
+                                    ARGS.k, ARGS.output_format, ARGS.chunk_size)
+    print('Done exporting', N_ROWS, 'recommendations to', ARGS.output)
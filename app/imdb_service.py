@@ -3,18 +3,34 @@ This module defines the functions used in the tab2.py module.
 """
 import pickle
 
+import numpy as np
 import pandas as pd
 
+from app.data.formats import GENRE_MASK_COL, IMDB_DTYPES
+from app.metrics import timed
 
+FACET_TOP_N = 10
+TYPE_COL = 'titleType'
+GENRE_COL = 'genre'
+YEAR_COL = 'startYear'
+PKL_EXT = '.pkl'
+
+
+@timed('load_data')
 def load_data(file_path):
     """
-    Loading the imdb file located in file_path.
+    Loading the imdb file located in file_path. The typed dataframe
+    stored by the preprocessing (.pkl) is loaded as it is; a csv file is
+    converted to the same compact dtypes.
     Parameters:
         file_path = File path to the imdb pre_processed dataframe.
     Returns: The dataframe with the pre_processed imdb data.
     """
-    imdb_df = pd.read_csv(file_path)
-    return imdb_df
+    if file_path.endswith(PKL_EXT):
+        return pd.read_pickle(file_path)
+    imdb_df = pd.read_csv(file_path, dtype={'titleType': 'category', 'genres': 'category'})
+    dtypes = {col: dtype for col, dtype in IMDB_DTYPES.items() if col in imdb_df}
+    return imdb_df.astype(dtypes)
 
 
 def load_genres(file_path):
@@ -29,6 +45,35 @@ def load_genres(file_path):
     return list(genres_set)
 
 
+def load_genre_vocabulary(file_path):
+    """
+    Loading the genre vocabulary located in file_path.
+    Parameters:
+        file_path = File path to the preprocessed genre vocabulary.
+    Returns: A list with the genres, where the position of each genre
+    is its bit in the column genreMask.
+    """
+    with open(file_path, 'rb') as file:
+        genres_vocab = pickle.load(file)
+    return list(genres_vocab)
+
+
+def genre_bits(genres_vocab, genres):
+    """
+    Computes the bitmask of a list of genres.
+    Parameters:
+        genres_vocab = List of genres from load_genre_vocabulary.
+        genres = List of genres.
+    Returns: An integer with the bit of each genre set; unknown genres
+    raise a ValueError.
+    """
+    bits = 0
+    for genre in genres:
+        bits |= 1 << genres_vocab.index(genre)
+    return bits
+
+
+@timed('filter_type')
 def filter_type(data, titletype: str):
     """
     Filters the data so that it only returns rows with the
@@ -42,19 +87,44 @@ def filter_type(data, titletype: str):
     return data[data['titleType'].str.contains(titletype)]
 
 
-def filter_genre(data, genre: str):
+@timed('filter_genre')
+def filter_genre(data, genre: str, genres_vocab=None):
     """
     Filters the data so that it only returns rows that contain the
-    defined 'genre' in their column genres.
+    defined 'genre' in their column genres. When the vocabulary is given
+    and the data has the column genreMask, the bitmask is used instead of
+    a substring search.
     Parameters:
         data = IMDb dataframe that contains the column 'genres'.
         genre = String value used to filter the data.
+        genres_vocab = Optional list of genres from load_genre_vocabulary.
     Returns: A dataframe with rows that contain the value 'genre'
     in the field genres.
     """
+    if genres_vocab is not None and GENRE_MASK_COL in data:
+        return filter_genres(data, [genre], genres_vocab)
     return data[data['genres'].str.contains(genre)]
 
 
+def filter_genres(data, genres, genres_vocab, match_all=True):
+    """
+    Filters the data by several genres with the genreMask column.
+    Parameters:
+        data = IMDb dataframe that contains the column 'genreMask'.
+        genres = List of genres used to filter the data.
+        genres_vocab = List of genres from load_genre_vocabulary.
+        match_all = True to keep rows with all the genres, False to keep
+        rows with any of them.
+    Returns: A dataframe with rows that match the genres.
+    """
+    bits = genre_bits(genres_vocab, genres)
+    masked = data[GENRE_MASK_COL].to_numpy() & bits
+    if match_all:
+        return data[masked == bits]
+    return data[masked != 0]
+
+
+@timed('filter_year')
 def filter_year(data, year_selected: int):
     """
     Filters the data so that it only returns rows that contain the
@@ -68,6 +138,7 @@ def filter_year(data, year_selected: int):
     return data[data['startYear'].astype(int) == year_selected]
 
 
+@timed('filter_top10')
 def filter_top10(data):
     """
     Gets the top ten rows based on the weightedAverage column.
@@ -88,3 +159,72 @@ def filter_selected(list_values, value):
     Returns: True if the value exists in the list.
     """
     return value in list_values
+
+
+@timed('build_facet_index')
+def build_facet_index(data, top_n=FACET_TOP_N, genres_vocab=None):
+    """
+    Pre-computes the top rows by weightedAverage for every combination of
+    titleType, genre and startYear, so that filtering becomes a dictionary
+    lookup. Combinations without a genre or year filter use None in place
+    of the genre or year.
+    Parameters:
+        data = IMDb dataframe that contains the columns 'titleType', 'genres',
+        'startYear' and 'weightedAverage'.
+        top_n = Number of rows kept for each combination.
+        genres_vocab = Optional list of genres from load_genre_vocabulary, used
+        to read the genres from the column genreMask instead of 'genres'.
+    Returns: A dictionary from (titletype, genre, year) to the row positions
+    in data of the top_n rows, sorted by descending 'weightedAverage'.
+    """
+    # Stable sort so that ties keep the data order, as in nlargest.
+    order = np.argsort(-data['weightedAverage'].to_numpy(), kind='stable')
+    rows = pd.DataFrame({
+        'position': order,
+        TYPE_COL: data[TYPE_COL].astype(str).to_numpy()[order],
+        YEAR_COL: data[YEAR_COL].astype(int).to_numpy()[order]})
+    if genres_vocab is not None and GENRE_MASK_COL in data:
+        masks = data[GENRE_MASK_COL].to_numpy()[order]
+        # One bit at a time, without a rows x genres temporary; np.flatnonzero
+        # walks the rows in order, so the sort is preserved within each genre.
+        genre_row_ids = [np.flatnonzero(masks & (np.int64(1) << bit))
+                         for bit in range(len(genres_vocab))]
+        row_ids = np.concatenate(genre_row_ids + [np.empty(0, dtype=np.int64)])
+        genre_ids = np.repeat(np.arange(len(genres_vocab)),
+                              [len(ids) for ids in genre_row_ids])
+        genre_rows = rows.iloc[row_ids].assign(
+            **{GENRE_COL: np.array(genres_vocab, dtype=object)[genre_ids]})
+    else:
+        genres = data['genres'].astype(str).str.split(',').to_numpy()[order]
+        genre_rows = rows.assign(**{GENRE_COL: genres}).explode(GENRE_COL)
+
+    facet_index = {}
+    for frame, keys in [(rows, [TYPE_COL]), (rows, [TYPE_COL, YEAR_COL]),
+                        (genre_rows, [TYPE_COL, GENRE_COL]),
+                        (genre_rows, [TYPE_COL, GENRE_COL, YEAR_COL])]:
+        top_rows = frame.groupby(keys, sort=False).head(top_n)
+        for key, positions in top_rows.groupby(keys, sort=False)['position']:
+            key = dict(zip(keys, key if isinstance(key, tuple) else (key,)))
+            facet_key = (key[TYPE_COL], key.get(GENRE_COL), key.get(YEAR_COL))
+            facet_index[facet_key] = positions.to_numpy()
+    return facet_index
+
+
+@timed('filter_facets')
+def filter_facets(facet_index, data, titletype: str, genre=None, year=None):
+    """
+    Gets the top rows of data for a combination of filters from the
+    index built by build_facet_index.
+    Parameters:
+        facet_index = Dictionary returned by build_facet_index(data).
+        data = IMDb dataframe used to build facet_index.
+        titletype = String value of the field titleType.
+        genre = Genre to filter by, or None.
+        year = Year to filter by, or None.
+    Returns: A dataframe with the top rows for the combination, sorted by
+    descending 'weightedAverage'.
+    """
+    if year is not None:
+        year = int(year)
+    positions = facet_index.get((titletype, genre, year), np.empty(0, dtype=int))
+    return data.iloc[positions]
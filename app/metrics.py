@@ -0,0 +1,156 @@
+"""
+This module records optional metrics of the web-app: latency histograms and call
+counts of the instrumented functions, and the hit rates of the caches. They are
+exposed in the Prometheus text format by /metrics. Set METRICS_ENABLED=1 to turn
+them on; otherwise the decorators return the functions unchanged, so they cost
+nothing.
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+
+ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+PREFIX = 'recommender_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Upper bounds, in seconds, of the latency buckets.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Thread-safe latency histogram with fixed buckets.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        It records one value
+        Args:
+            value: observed value, in seconds
+        """
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += value
+
+    @property
+    def count(self):
+        """
+        Returns: Number of observed values
+        """
+        return sum(self.counts)
+
+    def cumulative_counts(self):
+        """
+        Returns: List of (upper bound, number of values up to it), ending with +Inf
+        """
+        with self._lock:
+            counts = list(self.counts)
+        total = 0
+        cumulative = []
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+
+HISTOGRAMS = {}
+CACHES = {}
+GAUGES = {}
+
+
+def timed(name, enabled=None):
+    """
+    Decorator recording the latency of every call of a function in the histogram
+    called name. Exceptions are recorded too.
+    Args:
+        name: name of the function in the metrics
+        enabled: whether to instrument the function, by default ENABLED
+    Returns: The decorator, which returns the function itself when disabled
+    """
+    if enabled is None:
+        enabled = ENABLED
+
+    def decorator(func):
+        if not enabled:
+            return func
+        histogram = HISTOGRAMS.setdefault(name, Histogram())
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def register_cache(name, cache_info):
+    """
+    It registers a cache whose hits, misses and size are exposed
+    Args:
+        name: name of the cache in the metrics
+        cache_info: function returning the cache statistics, such as the cache_info
+        of a functools.lru_cache
+    """
+    CACHES[name] = cache_info
+
+
+def register_gauge(name, description, values):
+    """
+    It registers a gauge read when the metrics are exposed
+    Args:
+        name: name of the metric, without the prefix
+        description: help text of the metric
+        values: function returning a dictionary from a label value to the gauge value
+    """
+    GAUGES[name] = (description, values)
+
+
+def format_bound(bound):
+    """
+    Returns: The bucket upper bound in the Prometheus format
+    """
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def render():
+    """
+    It writes all the metrics in the Prometheus text exposition format
+    Returns: The metrics as text
+    """
+    lines = []
+    name = PREFIX + 'call_duration_seconds'
+    lines += ['# HELP %s Latency of the instrumented functions.' % name,
+              '# TYPE %s histogram' % name]
+    for function, histogram in sorted(HISTOGRAMS.items()):
+        for bound, count in histogram.cumulative_counts():
+            lines.append('%s_bucket{function="%s",le="%s"} %d'
+                         % (name, function, format_bound(bound), count))
+        lines.append('%s_sum{function="%s"} %r' % (name, function, histogram.sum))
+        lines.append('%s_count{function="%s"} %d' % (name, function, histogram.count))
+
+    cache_infos = {cache: cache_info() for cache, cache_info in sorted(CACHES.items())}
+    for field, kind, description in [('hits', 'counter', 'Cache hits.'),
+                                     ('misses', 'counter', 'Cache misses.'),
+                                     ('currsize', 'gauge', 'Number of cached entries.')]:
+        metric = PREFIX + 'cache_' + field + ('_total' if kind == 'counter' else '')
+        lines += ['# HELP %s %s' % (metric, description), '# TYPE %s %s' % (metric, kind)]
+        for cache, info in cache_infos.items():
+            lines.append('%s{cache="%s"} %d' % (metric, cache, getattr(info, field)))
+
+    for gauge, (description, values) in sorted(GAUGES.items()):
+        metric = PREFIX + gauge
+        lines += ['# HELP %s %s' % (metric, description), '# TYPE %s gauge' % metric]
+        for label, value in sorted(values().items()):
+            lines.append('%s{name="%s"} %r' % (metric, label, float(value)))
+    return '\n'.join(lines) + '\n'
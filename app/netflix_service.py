@@ -2,10 +2,36 @@
 This module comprises of all the functions that are used in choice_based_recommendation.py file
 """
 
+import abc
 import pickle
+import re
+from bisect import bisect_left
+from collections import namedtuple
+import numpy as np
 import pandas as pd
 
+from app.data.formats import TOP_K, read_index_header
+from app.metrics import timed
 
+PKL_EXT = '.pkl'
+QUERY_BLOCK_SIZE = 256
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_COLS = ['movie_id', 'title', 'rank', 'recommended_id', 'recommended_title', 'score']
+SEARCH_LIMIT = 20
+# Sorts after any text, so that [query, query + SEARCH_END) holds its completions.
+SEARCH_END = '\U0010ffff'
+NGRAM = 3
+FUZZY_K = 5
+# Dice score of the trigrams under which a title is not considered a match.
+FUZZY_MIN_SCORE = 0.3
+
+TitleIndex = namedtuple('TitleIndex', ['sno_by_title', 'row_by_sno'])
+TitleSearch = namedtuple('TitleSearch', ['keys', 'title_ids', 'is_start', 'titles'])
+FuzzyTitleIndex = namedtuple('FuzzyTitleIndex', ['gram_ids', 'indptr', 'postings', 'n_grams',
+                                                 'snos', 'titles'])
+
+
+@timed('reading_movie_title_csv')
 def reading_movie_title_csv(path):
     """
     It reads the csv file having list of all the movies either watched or recommended
@@ -29,66 +55,584 @@ def get_options(movies_df):
     return dict_list
 
 
-def get_movie_id(movies_df, selected_movie):
+@timed('build_title_search')
+def build_title_search(titles):
+    """
+    It builds the index used to search the titles as they are typed: the sorted,
+    lowercased ends of every title that start at one of its words, each with the
+    title it comes from, so that the titles containing a word starting with some
+    text are found by binary search
+    Args:
+        titles: titles to search, such as the Display column of the movies dataframe
+    Returns: TitleSearch with the sorted keys, the title_ids and is_start arrays
+    aligned with them (is_start marks the whole titles), and the titles in
+    alphabetical order
+    """
+    titles = sorted(set(titles), key=lambda title: (title.lower(), title))
+    entries = []
+    for title_id, title in enumerate(titles):
+        lowered = title.lower()
+        for word in re.finditer(r'\S+', lowered):
+            entries.append((lowered[word.start():], title_id, word.start() == 0))
+    entries.sort()
+    return TitleSearch([key for key, _, _ in entries],
+                       np.array([title_id for _, title_id, _ in entries], dtype=np.int32),
+                       np.array([is_start for _, _, is_start in entries], dtype=bool),
+                       titles)
+
+
+@timed('search_titles')
+def search_titles(title_search, query, limit=SEARCH_LIMIT):
+    """
+    It finds the titles having a word that starts with the query, ignoring case
+    Args:
+        title_search: TitleSearch from build_title_search()
+        query: searched text, possibly several words
+        limit: maximum number of titles returned
+    Returns: List of at most limit titles: the titles starting with the query, then
+    the other matches, each in alphabetical order
+    """
+    query = query.strip().lower()
+    if not query:
+        return []
+    start = bisect_left(title_search.keys, query)
+    stop = bisect_left(title_search.keys, query + SEARCH_END, start)
+    title_ids = title_search.title_ids[start:stop]
+    prefix_ids = np.unique(title_ids[title_search.is_start[start:stop]])
+    other_ids = np.setdiff1d(title_ids, prefix_ids)
+    return [title_search.titles[title_id]
+            for title_id in np.concatenate([prefix_ids, other_ids])[:limit].tolist()]
+
+
+def get_ngrams(text, n=NGRAM):
+    """
+    It splits a title into the character n-grams compared by the fuzzy title index.
+    The text is lowercased, runs of other characters than letters and digits become
+    one space, and the words are padded with a space so that their first and last
+    letters make n-grams of their own
+    Args:
+        text: title or searched text
+        n: number of characters of the n-grams
+    Returns: Set of the n-grams of the text
+    """
+    text = ' %s ' % ' '.join(re.findall(r'[^\W_]+', text.lower()))
+    return {text[start:start + n] for start in range(len(text) - n + 1)}
+
+
+@timed('build_fuzzy_title_index')
+def build_fuzzy_title_index(movies_df):
+    """
+    It builds the index resolving approximate titles to movie ids: the inverted list
+    of the titles containing each trigram, stored in CSR form, and the number of
+    trigrams of every title
+    Args:
+        movies_df: pandas dataframe containing details of all movies
+    Returns: FuzzyTitleIndex with the gram_ids dictionary from a trigram to its list,
+    the indptr and postings arrays of the lists, the n_grams, snos and titles of the
+    movies
+    """
+    titles = movies_df['Display'].tolist()
+    gram_ids = {}
+    title_grams = []
+    for title in titles:
+        title_grams.append([gram_ids.setdefault(gram, len(gram_ids))
+                            for gram in get_ngrams(title)])
+    n_grams = np.array([len(grams) for grams in title_grams], dtype=np.int32)
+    grams = np.fromiter((gram for grams in title_grams for gram in grams), dtype=np.int32,
+                        count=int(n_grams.sum()))
+    title_ids = np.repeat(np.arange(len(titles), dtype=np.int32), n_grams)
+    order = np.argsort(grams, kind='stable')
+    indptr = np.zeros(len(gram_ids) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(grams, minlength=len(gram_ids)))
+    return FuzzyTitleIndex(gram_ids, indptr, title_ids[order], n_grams,
+                           movies_df['Sno'].to_numpy(), titles)
+
+
+@timed('resolve_titles')
+def resolve_titles(fuzzy_index, query, k=FUZZY_K, min_score=FUZZY_MIN_SCORE):
+    """
+    It finds the titles closest to a free-text title, tolerating typos, missing
+    words and a missing year. The titles are scored by the Dice coefficient of their
+    trigrams and of the query's, counted at once over the inverted lists
+    Args:
+        fuzzy_index: FuzzyTitleIndex from build_fuzzy_title_index()
+        query: approximate title
+        k: maximum number of titles returned
+        min_score: minimum score of the returned titles, between 0 and 1
+    Returns: List of at most k (movie id, title, score), by descending score
+    """
+    query_grams = get_ngrams(query)
+    gram_ids = [fuzzy_index.gram_ids[gram] for gram in query_grams
+                if gram in fuzzy_index.gram_ids]
+    if not gram_ids:
+        return []
+    postings = np.concatenate([fuzzy_index.postings[fuzzy_index.indptr[gram]:
+                                                    fuzzy_index.indptr[gram + 1]]
+                               for gram in gram_ids])
+    common = np.bincount(postings, minlength=len(fuzzy_index.titles))
+    candidates = np.flatnonzero(common)
+    scores = (2 * common[candidates]
+              / (len(query_grams) + fuzzy_index.n_grams[candidates]))
+    keep = scores >= min_score
+    candidates, scores = candidates[keep], scores[keep]
+    best = np.argsort(-scores, kind='stable')[:k]
+    return [(int(fuzzy_index.snos[title_id]), fuzzy_index.titles[title_id], float(score))
+            for title_id, score in zip(candidates[best].tolist(), scores[best].tolist())]
+
+
+def resolve_movie_id(fuzzy_index, query, min_score=FUZZY_MIN_SCORE):
+    """
+    It resolves a free-text title to the movie id of the closest title
+    Args:
+        fuzzy_index: FuzzyTitleIndex from build_fuzzy_title_index()
+        query: approximate title
+        min_score: minimum score of the match, between 0 and 1
+    Returns: The movie id, or None if no title is close enough
+    """
+    matches = resolve_titles(fuzzy_index, query, 1, min_score)
+    return matches[0][0] if matches else None
+
+
+@timed('build_title_index')
+def build_title_index(movies_df):
+    """
+    It builds the lookup tables used to resolve a selected movie without scanning
+    the movies dataframe: a hash map from Display title to movie id and an array
+    from movie id to row position in movies_df
+    Args:
+        movies_df: pandas dataframe containing details of all movies
+    Returns: TitleIndex with the sno_by_title dictionary and the row_by_sno array
+    (-1 for movie ids that are not in movies_df)
+    """
+    snos = movies_df['Sno'].to_numpy()
+    # Reversed so that a repeated title keeps its first movie id, like the scan.
+    sno_by_title = dict(zip(movies_df['Display'].tolist()[::-1], snos.tolist()[::-1]))
+    row_by_sno = np.full(int(snos.max()) + 1 if len(snos) else 0, -1, dtype=np.int32)
+    row_by_sno[snos] = np.arange(len(snos), dtype=np.int32)
+    return TitleIndex(sno_by_title, row_by_sno)
+
+
+def get_movie_id(movies_df, selected_movie, title_index=None):
     """
     This function returns the movie details associated with a particular movie-id
     Args:
         movies_df: pandas dataframe containing details of all movies
         selected_movie: movie id selected by users based on which he/she wants recommendations
+        title_index: optional TitleIndex from build_title_index(), which replaces
+        the scan of movies_df with a dictionary lookup
     Returns: Movie id to generate recommendation
     """
     if isinstance(selected_movie, list):
-        movie_details = movies_df[movies_df['Display'] == selected_movie[0]]
-    else:
-        movie_details = movies_df[movies_df['Display'] == selected_movie]
+        selected_movie = selected_movie[0]
+    if title_index is not None:
+        return title_index.sno_by_title[selected_movie]
+    movie_details = movies_df[movies_df['Display'] == selected_movie]
     movie_id = movie_details['Sno'].iloc[0]
     return movie_id
 
 
+@timed('get_movie_ids')
+def get_movie_ids(movies_df, selected_movies, title_index=None):
+    """
+    This function returns the movie ids of one or several selected movies
+    Args:
+        movies_df: pandas dataframe containing details of all movies
+        selected_movies: movie title, or list of movie titles, selected by the user
+        title_index: optional TitleIndex from build_title_index()
+    Returns: List of movie ids, without repetitions, in selection order
+    """
+    if not isinstance(selected_movies, list):
+        selected_movies = [selected_movies]
+    movie_ids = [get_movie_id(movies_df, movie, title_index) for movie in selected_movies]
+    return list(dict.fromkeys(movie_ids))
+
+
+def get_neighbours(dict_rec, movie_ids):
+    """
+    It reads the recommended movies of several movies, at once for the binary
+    indexes and one by one for a former recommendation dictionary
+    Args:
+        dict_rec: mapping containing list of recommended movies for each movie
+        movie_ids: list of movie ids in dict_rec
+    Returns: Recommended movie ids and scores of each movie, sorted by descending score
+    """
+    if hasattr(dict_rec, 'neighbours'):
+        return dict_rec.neighbours(movie_ids)
+    recommendations = [dict_rec[movie_id] for movie_id in movie_ids]
+    return ([neighbour_ids for neighbour_ids, _ in recommendations],
+            [scores for _, scores in recommendations])
+
+
+def lookup_titles(movies_df, movie_ids, title_index):
+    """
+    It gets the Display titles of many movie ids at once
+    Args:
+        movies_df: pandas dataframe containing details of all movies
+        movie_ids: array of movie ids
+        title_index: TitleIndex from build_title_index(movies_df)
+    Returns: Object array of the titles, None for the movie ids not in movies_df
+    """
+    movie_ids = np.asarray(movie_ids, dtype=np.int64)
+    row_by_sno = title_index.row_by_sno
+    known = (movie_ids >= 0) & (movie_ids < len(row_by_sno))
+    rows = np.full(movie_ids.shape, -1, dtype=np.int64)
+    rows[known] = row_by_sno[movie_ids[known]]
+    titles = np.full(movie_ids.shape, None, dtype=object)
+    titles[rows >= 0] = movies_df['Display'].to_numpy()[rows[rows >= 0]]
+    return titles
+
+
+def iter_recommendation_chunks(dict_rec, movies_df, movie_ids=None, k=10,
+                               chunk_size=EXPORT_CHUNK_SIZE, title_index=None):
+    """
+    It generates the top k recommendations of many movies, joined with the movie
+    titles, as dataframes of at most chunk_size movies with one row per
+    recommendation
+    Args:
+        dict_rec: mapping containing list of recommended movies for each movie
+        movies_df: pandas dataframe containing details of all movies
+        movie_ids: list of movie ids to export, by default every movie of dict_rec
+        k: number of recommendations per movie
+        chunk_size: number of movies per dataframe
+        title_index: optional TitleIndex from build_title_index()
+    Returns: Generator of dataframes with the columns of EXPORT_COLS
+    """
+    if title_index is None:
+        title_index = build_title_index(movies_df)
+    if movie_ids is None:
+        movie_ids = list(dict_rec.keys())
+    for start in range(0, len(movie_ids), chunk_size):
+        chunk_ids = np.asarray(movie_ids[start:start + chunk_size], dtype=np.int64)
+        neighbour_ids, scores = get_neighbours(dict_rec, chunk_ids)
+        neighbour_ids = np.asarray(neighbour_ids)[:, :k]
+        scores = np.asarray(scores)[:, :k]
+        n_recommended = neighbour_ids.shape[1]
+        yield pd.DataFrame({
+            EXPORT_COLS[0]: np.repeat(chunk_ids, n_recommended),
+            EXPORT_COLS[1]: np.repeat(lookup_titles(movies_df, chunk_ids, title_index),
+                                      n_recommended),
+            EXPORT_COLS[2]: np.tile(np.arange(1, n_recommended + 1), len(chunk_ids)),
+            EXPORT_COLS[3]: neighbour_ids.ravel(),
+            EXPORT_COLS[4]: lookup_titles(movies_df, neighbour_ids.ravel(), title_index),
+            EXPORT_COLS[5]: scores.ravel()}, columns=EXPORT_COLS)
+
+
+@timed('fuse_recommendations')
+def fuse_recommendations(dict_rec, movie_ids, k=10, fusion='sum'):
+    """
+    It combines the recommended movies of several seed movies into one list. The
+    neighbour lists of all the seeds are gathered at once and the scores of each
+    recommended movie are fused: 'sum' ranks by the sum of its scores over the
+    seeds, reported as the mean so that it stays a match score, and 'max' by its
+    best score. The seeds themselves are never recommended, and the seeds missing
+    from dict_rec are ignored
+    Args:
+        dict_rec: mapping containing list of recommended movies for each movie
+        movie_ids: list of seed movie ids
+        k: number of movies to recommend
+        fusion: 'sum' or 'max'
+    Returns: Arrays of the k recommended movie ids and of their fused scores, empty
+    when no seed is in dict_rec
+    """
+    movie_ids = [movie_id for movie_id in movie_ids if movie_id in dict_rec]
+    if not movie_ids:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    neighbour_ids, scores = get_neighbours(dict_rec, movie_ids)
+    neighbour_ids = np.concatenate([np.ravel(ids) for ids in neighbour_ids]).astype(np.int64)
+    scores = np.concatenate([np.ravel(score) for score in scores]).astype(np.float64)
+    keep = ~np.isin(neighbour_ids, movie_ids)
+    neighbour_ids, scores = neighbour_ids[keep], scores[keep]
+    if fusion == 'max':
+        order = np.argsort(-scores, kind='stable')
+        fused_ids, first = np.unique(neighbour_ids[order], return_index=True)
+        fused_scores = scores[order][first]
+    elif fusion == 'sum':
+        fused_ids, inverse = np.unique(neighbour_ids, return_inverse=True)
+        fused_scores = np.bincount(inverse, weights=scores) / len(movie_ids)
+    else:
+        raise ValueError('Unknown score fusion: ' + str(fusion))
+    top = np.lexsort((fused_ids, -fused_scores))[:k]
+    return fused_ids[top], fused_scores[top]
+
+
+def open_index(path):
+    """
+    It memory-maps every array of a binary index file written by
+    helper_functions.write_index, so that all the processes reading it
+    share the same pages of the OS page cache
+    Args:
+        path: path where file is stored
+    Returns: Dictionary with the name and the read-only array of each entry
+    """
+    with open(path, 'rb') as file:
+        specs, data_start = read_index_header(file)
+    arrays = {}
+    for name, spec in specs.items():
+        shape = tuple(spec['shape'])
+        if 0 in shape:
+            arrays[name] = np.empty(shape, dtype=spec['dtype'])
+        else:
+            arrays[name] = np.memmap(path, dtype=spec['dtype'], mode='r',
+                                     offset=data_start + spec['offset'], shape=shape)
+    return arrays
+
+
+def get_row_lookup(movie_ids):
+    """
+    It builds the array from a movie id to its position in movie_ids
+    Args:
+        movie_ids: array of the indexed movie ids
+    Returns: int32 array with the position of each movie id, -1 for the others
+    """
+    max_id = int(movie_ids.max()) if len(movie_ids) else -1
+    rows = np.full(max_id + 1, -1, dtype=np.int32)
+    rows[movie_ids] = np.arange(len(movie_ids), dtype=np.int32)
+    return rows
+
+
+class MovieIndex(abc.ABC):
+    """
+    Base of the read-only mappings from a movie id to its [recommended movie ids,
+    scores], opened from a binary index file. It keeps the lookup semantics of the
+    former recommendation dictionary; the subclasses define how the neighbours are
+    obtained.
+    """
+
+    def __init__(self, path):
+        self.arrays = open_index(path)
+        self.movie_ids = np.asarray(self.arrays['movie_ids'])
+        self.rows = get_row_lookup(self.movie_ids)
+
+    def row(self, movie_id):
+        """
+        Returns: Position of movie_id in the index, or -1 if it is not indexed
+        """
+        if 0 <= movie_id < len(self.rows):
+            return int(self.rows[movie_id])
+        return -1
+
+    def lookup(self, movie_ids):
+        """
+        Returns: Positions of several movie ids in the index
+        Raises: KeyError if a movie id is not indexed
+        """
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        known = (movie_ids >= 0) & (movie_ids < len(self.rows))
+        rows = np.full(len(movie_ids), -1, dtype=np.int64)
+        rows[known] = self.rows[movie_ids[known]]
+        if (rows < 0).any():
+            raise KeyError(int(movie_ids[np.argmax(rows < 0)]))
+        return rows
+
+    @abc.abstractmethod
+    def neighbours(self, movie_ids):
+        """
+        It returns the recommended movies of several movies at once
+        Args:
+            movie_ids: list of indexed movie ids
+        Returns: Arrays of the recommended movie ids [len(movie_ids), k] and of their
+        scores, sorted by descending score
+        """
+
+    def __getitem__(self, movie_id):
+        if self.row(movie_id) < 0:
+            raise KeyError(movie_id)
+        neighbour_ids, scores = self.neighbours([movie_id])
+        return [neighbour_ids[0], scores[0]]
+
+    def __contains__(self, movie_id):
+        return self.row(movie_id) >= 0
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def __iter__(self):
+        return iter(self.movie_ids.tolist())
+
+    def keys(self):
+        """
+        Returns: List of the indexed movie ids
+        """
+        return self.movie_ids.tolist()
+
+    def most_rated(self, n):
+        """
+        It returns the movies with the most ratings
+        Args:
+            n: number of movies
+        Returns: List of at most n movie ids, the most rated first; in index order
+        for the index files written without the rating counts
+        """
+        if 'num_ratings' not in self.arrays:
+            return self.movie_ids[:n].tolist()
+        order = np.argsort(-np.asarray(self.arrays['num_ratings'], dtype=np.int64),
+                           kind='stable')
+        return self.movie_ids[order[:n]].tolist()
+
+
+class RecommendationIndex(MovieIndex):
+    """
+    Movie index backed by the memory-mapped neighbour lists of the binary
+    recommendation index.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.neighbour_ids = self.arrays['neighbour_ids']
+        self.scores = self.arrays['scores']
+
+    def neighbours(self, movie_ids):
+        """
+        It reads the recommended movies of several movies at once
+        Args:
+            movie_ids: list of indexed movie ids
+        Returns: Arrays of the recommended movie ids [len(movie_ids), k] and of their
+        scores, sorted by descending score
+        """
+        rows = self.lookup(movie_ids)
+        return np.asarray(self.neighbour_ids[rows]), np.asarray(self.scores[rows])
+
+    def __getitem__(self, movie_id):
+        row = self.row(movie_id)
+        if row < 0:
+            raise KeyError(movie_id)
+        return [self.neighbour_ids[row], self.scores[row]]
+
+
+class EmbeddingIndex(MovieIndex):
+    """
+    Movie index whose neighbours are computed on demand from the memory-mapped
+    movie embeddings of the latent-factor model instead of being read from
+    stored neighbour lists.
+    """
+
+    def __init__(self, path, k=TOP_K):
+        super().__init__(path)
+        self.embeddings = self.arrays['embeddings']
+        self.k = max(min(k, len(self.movie_ids) - 1), 0)
+
+    def neighbours(self, movie_ids):
+        """
+        It computes the most similar movies of several movies at once, with one
+        matrix multiplication of their embeddings per block of movies
+        Args:
+            movie_ids: list of indexed movie ids
+        Returns: Arrays of the recommended movie ids [len(movie_ids), k] and of their
+        scores, sorted by descending score
+        """
+        rows = self.lookup(movie_ids)
+        neighbours = np.empty((len(rows), self.k), dtype=np.int64)
+        scores = np.empty((len(rows), self.k), dtype=np.float32)
+        if self.k == 0:
+            return self.movie_ids[neighbours], scores
+        for start in range(0, len(rows), QUERY_BLOCK_SIZE):
+            block_rows = rows[start:start + QUERY_BLOCK_SIZE]
+            block = self.embeddings[block_rows] @ self.embeddings.T
+            block[np.arange(len(block_rows)), block_rows] = -np.inf
+            top = np.argpartition(-block, self.k - 1, axis=1)[:, :self.k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.lexsort((top, -top_scores))
+            neighbours[start:start + len(block_rows)] = np.take_along_axis(top, order, axis=1)
+            scores[start:start + len(block_rows)] = np.take_along_axis(top_scores, order,
+                                                                       axis=1)
+        return self.movie_ids[neighbours], scores
+
+
+@timed('recommendation_for_movies')
 def recommendation_for_movies(path):
     """
-    It reads the dictionary containing the list of recommended movie ids for
-    each of the movies present in our dataset
+    It opens the list of recommended movie ids for each of the movies present
+    in our dataset. Binary index files are memory-mapped; the former pickled
+    dictionaries (.pkl) are still read for compatibility
     Args:
         path: path where file is stored
-    Returns: Dictionary containing the list of movie ids recommended for all movie ids
+    Returns: Mapping containing the list of movie ids recommended for all movie ids
     """
-    dict_rec = {}
-    with open(path, 'rb') as filename:
-        dict_rec = pickle.load(filename)
-    return dict_rec
+    if path.endswith(PKL_EXT):
+        with open(path, 'rb') as filename:
+            return pickle.load(filename)
+    return RecommendationIndex(path)
 
 
-def get_top10_movies(movies_df, recommended_movie_ids, recommended_movie_scores):
+@timed('get_top10_movies')
+def get_top10_movies(movies_df, recommended_movie_ids, recommended_movie_scores,
+                     title_index=None):
     """
     This function generates details of the top 10 movies recommended to the user
     Args:
         movies_df: pandas dataframe containing details of all movies
         recommended_movie_ids: list of movie ids generated from recommendation_for_movies()
         recommended_movie_scores: list of scores for movie ids from recommendation_for_movies()
-    Returns: pandas dataframe containing the movie details
+        title_index: optional TitleIndex from build_title_index(), whose row positions
+        replace the lookup of the movie ids in movies_df
+    Returns: pandas dataframe containing the movie details, in recommendation order
     """
-    top10_movies = movies_df[movies_df.Sno.isin(recommended_movie_ids)]
-    top10_movies['Match%'] = recommended_movie_scores.copy()
-    top10_movies['Match%'] = round(round(top10_movies['Match%'], 2) * 100)
-    top10_movies = top10_movies.drop(['Sno', 'Final_title'], axis=1)
-    top10_movies.columns = ['Year of Release', 'Movie Title', 'Match%']
+    movie_ids = np.asarray(recommended_movie_ids, dtype=np.int64)
+    if title_index is None:
+        rows = pd.Index(movies_df['Sno']).get_indexer(movie_ids)
+    else:
+        row_by_sno = title_index.row_by_sno
+        known = (movie_ids >= 0) & (movie_ids < len(row_by_sno))
+        rows = np.full(len(movie_ids), -1, dtype=np.int64)
+        rows[known] = row_by_sno[movie_ids[known]]
+    found = rows >= 0
+    rows = rows[found]
+    scores = np.asarray(recommended_movie_scores, dtype=np.float64)[found]
+    top10_movies = pd.DataFrame({
+        'Year of Release': movies_df['Year'].to_numpy()[rows],
+        'Movie Title': movies_df['Display'].to_numpy()[rows],
+        'Match%': np.round(np.round(scores, 2) * 100)})
     return top10_movies
 
 
-def userchoice_based_movie_recommendation(selected_movie, movies_df, dict_rec):
+@timed('movie_id_based_recommendation')
+def movie_id_based_recommendation(movie_id, movies_df, dict_rec, title_index=None):
     """
-    This function recommends movies based a user selected movie id
+    This function recommends movies based on a movie id
     Args:
-         selected_movie: movie-id input by user
+         movie_id: movie id resolved from the user selection
          movies_df: dataframe containing all movies'
          dict_rec: dictionary containing list of recommended movies for each movie
+         title_index: optional TitleIndex from build_title_index()
     Returns: Dataframe containing top 10 recommended movies
     """
-    movie_id = get_movie_id(movies_df, selected_movie)
-    recommended_movie_ids = dict_rec[movie_id][0][:10]
-    recommended_movie_scores = dict_rec[movie_id][1][:10]
-    top10_movies = get_top10_movies(movies_df, recommended_movie_ids, recommended_movie_scores)
+    neighbour_ids, scores = dict_rec[movie_id]
+    top10_movies = get_top10_movies(movies_df, neighbour_ids[:10], scores[:10], title_index)
     return top10_movies
 
 
+@timed('movies_based_recommendation')
+def movies_based_recommendation(movie_ids, movies_df, dict_rec, title_index=None,
+                                fusion='sum'):
+    """
+    This function recommends movies based on several seed movie ids
+    Args:
+         movie_ids: list of movie ids resolved from the user selection
+         movies_df: dataframe containing all movies'
+         dict_rec: dictionary containing list of recommended movies for each movie
+         title_index: optional TitleIndex from build_title_index()
+         fusion: how the scores of the seeds are combined, 'sum' or 'max'
+    Returns: Dataframe containing top 10 recommended movies
+    """
+    recommended_movie_ids, recommended_movie_scores = fuse_recommendations(
+        dict_rec, movie_ids, fusion=fusion)
+    return get_top10_movies(movies_df, recommended_movie_ids, recommended_movie_scores,
+                            title_index)
+
+
+@timed('userchoice_based_movie_recommendation')
+def userchoice_based_movie_recommendation(selected_movie, movies_df, dict_rec,
+                                          title_index=None):
+    """
+    This function recommends movies based on one or several user selected movies
+    Args:
+         selected_movie: movie title, or list of movie titles, input by user
+         movies_df: dataframe containing all movies'
+         dict_rec: dictionary containing list of recommended movies for each movie
+         title_index: optional TitleIndex from build_title_index()
+    Returns: Dataframe containing top 10 recommended movies
+    """
+    movie_ids = get_movie_ids(movies_df, selected_movie, title_index)
+    if len(movie_ids) == 1:
+        return movie_id_based_recommendation(movie_ids[0], movies_df, dict_rec, title_index)
+    return movies_based_recommendation(movie_ids, movies_df, dict_rec, title_index)
@@ -0,0 +1,234 @@
+"""
+This module defines the cache of the serialized responses of the Dash callbacks.
+A response depends only on the callback, its inputs and the preprocessed data, so
+it is stored as JSON under the key (callback, inputs, data version), in a bounded
+in-process LRU cache, optionally backed by a directory shared by all the server
+workers. The data version changes with the modification time and size of the
+preprocessed files, so that a new build of the data is never served stale
+responses: the in-memory tier is emptied, the data is reloaded through the
+on_change hook and the on-disk responses of the previous versions are removed.
+The on-disk tier keeps one directory per version, bounded to disk_maxsize files.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from plotly.utils import PlotlyJSONEncoder
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+# Seconds during which the data version is reused before the files are checked again.
+VERSION_TTL = 1.0
+VERSION_LENGTH = 16
+JSON_EXT = '.json'
+DISK_MAXSIZE = 65536
+# Number of responses written by a process between two checks of the on-disk size.
+DISK_PRUNE_INTERVAL = 64
+
+
+def data_version(paths):
+    """
+    It computes the version of the data stored in some files
+    Args:
+        paths: paths of the data files; missing files are allowed
+    Returns: Hexadecimal string that changes when a file is created, removed,
+    modified or replaced
+    """
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats.append((path, stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        except OSError:
+            stats.append((path, None))
+    return hashlib.sha1(repr(stats).encode()).hexdigest()[:VERSION_LENGTH]
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of JSON responses, with an optional on-disk tier. It is
+    thread-safe.
+    """
+
+    def __init__(self, maxsize, data_paths=(), directory=None, disk_maxsize=DISK_MAXSIZE,
+                 on_change=None):
+        self.maxsize = maxsize
+        self.data_paths = list(data_paths)
+        self.directory = directory
+        self.disk_maxsize = disk_maxsize
+        # Called without arguments when the data version changes.
+        self.on_change = on_change
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_puts = 0
+        # Taken before any data is loaded, so that a change after the data is
+        # loaded is always seen as a new version.
+        self._version = data_version(self.data_paths)
+        self._checked_at = time.monotonic()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._remove_old_versions()
+
+    def version(self):
+        """
+        Returns: The current data version, checked at most every VERSION_TTL seconds
+        """
+        now = time.monotonic()
+        if now - self._checked_at > VERSION_TTL:
+            version = data_version(self.data_paths)
+            if version != self._version:
+                with self._lock:
+                    self._entries.clear()
+                if self.on_change is not None:
+                    self.on_change()
+                self._version = version
+                if self.directory:
+                    self._remove_old_versions()
+            self._checked_at = now
+        return self._version
+
+    def _remove_old_versions(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and len(entry.name) == VERSION_LENGTH \
+                    and entry.name != self._version:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def key(self, callback, inputs):
+        """
+        It builds the key of a response
+        Args:
+            callback: name of the callback
+            inputs: JSON-serializable inputs of the callback
+        Returns: The key as a string
+        """
+        return json.dumps([callback, inputs, self.version()], sort_keys=True,
+                          separators=(',', ':'))
+
+    def _disk_path(self, key):
+        version = json.loads(key)[-1]
+        return os.path.join(self.directory, version,
+                            hashlib.sha256(key.encode()).hexdigest() + JSON_EXT)
+
+    def get(self, key):
+        """
+        It looks up a response in memory, then on disk
+        Args:
+            key: key from key()
+        Returns: The serialized response, or None if it is not cached
+        """
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return response
+        if self.directory:
+            try:
+                with open(self._disk_path(key)) as file:
+                    response = file.read()
+            except OSError:
+                response = None
+            if response is not None:
+                self._store(key, response)
+                with self._lock:
+                    self.hits += 1
+                return response
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _store(self, key, response):
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def put(self, key, response):
+        """
+        It stores a serialized response in memory and on disk
+        Args:
+            key: key from key()
+            response: JSON string
+        """
+        self._store(key, response)
+        if self.directory:
+            path = self._disk_path(key)
+            tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, 'w') as file:
+                    file.write(response)
+                os.replace(tmp_path, path)
+            except OSError:
+                # The version directory was removed by another process.
+                return
+            with self._lock:
+                self._disk_puts += 1
+                prune = self._disk_puts % DISK_PRUNE_INTERVAL == 0
+            if prune:
+                self.prune_disk(os.path.dirname(path))
+
+    def prune_disk(self, directory):
+        """
+        It removes the oldest responses of a version directory beyond disk_maxsize
+        Args:
+            directory: directory of the responses of a data version
+        """
+        try:
+            entries = [entry for entry in os.scandir(directory)
+                       if entry.name.endswith(JSON_EXT)]
+        except OSError:
+            return
+        if len(entries) <= self.disk_maxsize:
+            return
+        mtimes = []
+        for entry in entries:
+            try:
+                mtimes.append((entry.stat().st_mtime_ns, entry.path))
+            except OSError:
+                pass
+        for _, path in sorted(mtimes)[:len(mtimes) - self.disk_maxsize]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_or_compute(self, callback, inputs, compute):
+        """
+        It returns the cached response of a callback, or computes and caches it
+        Args:
+            callback: name of the callback
+            inputs: JSON-serializable inputs of the callback
+            compute: function without arguments computing the response
+        Returns: The response, as decoded JSON when it comes from the cache
+        """
+        key = self.key(callback, inputs)
+        response = self.get(key)
+        if response is not None:
+            return json.loads(response)
+        value = compute()
+        self.put(key, json.dumps(value, cls=PlotlyJSONEncoder))
+        return value
+
+    def clear(self):
+        """
+        It empties the in-memory tier and resets the statistics
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def cache_info(self):
+        """
+        Returns: CacheInfo with the hits, misses, maximum and current size, like the
+        cache_info of functools.lru_cache
+        """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
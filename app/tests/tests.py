@@ -5,23 +5,44 @@ found in data_processing.py, as these functions ingest and process all of the
 data, which would take too much time. However, we do test all the functions
 used inside process_netflix() and process_imdb().
 """
+import functools
+import gzip
+import hashlib
+import importlib.util
 import os
 import sys
 import unittest
+import zipfile
 import pickle
 import random
+import re
+import shutil
+import tempfile
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, \
+    ThreadingHTTPServer
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import dash_html_components as html
 import app.data.helper_functions as hf
 import app.imdb_service as imdb
 import app.netflix_service as nf
+from app.data_registry import DataRegistry
+from app import metrics
+from app.response_cache import DISK_PRUNE_INTERVAL, ResponseCache
 import app.web.choice_based_recommendation
+import app.api
+import app.export
+import app.warmup
+from benchmarks import synthetic
 
 sys.path.append('../data')
 
 
 CSV_EXT = '.csv'
+PKL_EXT = '.pkl'
 TAB = '\t'
 NAS = ['\\N']
 COMMA = ','
@@ -44,7 +65,9 @@ NF_RATINGS_TEST = 'netflix_test.txt'
 NF_RATINGS_COLS = ['movie_id', 'user_id', 'rating', 'rating_date']
 MOVIE_TITLES_RAW_TEST = 'movie_titles_raw_test.csv'
 NF_MOVIE_TITLES_COLS = ['Sno', 'Year', 'Final_title', 'Display']
-NF_DICT_RECOMMENDATIONS = 'dict_recommendations.pkl'
+NF_DICT_RECOMMENDATIONS = 'recommendations.idx'
+IDX_EXT = '.idx'
+NPZ_EXT = '.npz'
 
 MOVIE_TITLES_TEST = 'movie_titles_test.csv'
 
@@ -54,6 +77,52 @@ TEST_FILE_OUT = 'test_file'
 IMDB_URL = 'https://datasets.imdbws.com/title.ratings.tsv.gz'
 
 
+class QuietRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the files of a directory to the download tests, without logging.
+    """
+
+    def log_message(self, *args):
+        pass
+
+
+class TruncatingRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves some bytes to the download tests, honouring the Range header. The first
+    response is cut in the middle, as when the connection drops.
+    """
+
+    def __init__(self, *args, data=b'', starts=None, **kwargs):
+        self.data = data
+        self.starts = starts
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        start = int(match.group(1)) if match else 0
+        self.starts.append(start)
+        if start >= len(self.data):
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */%d' % len(self.data))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(206 if match else 200)
+        if match:
+            self.send_header('Content-Range', 'bytes %d-%d/%d'
+                             % (start, len(self.data) - 1, len(self.data)))
+        self.send_header('Content-Length', str(len(self.data) - start))
+        self.end_headers()
+        body = self.data[start:]
+        if len(self.starts) == 1:
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
 class TestHelperFunctions(unittest.TestCase):
     """
     Test all the functions in helper_functions.py.
@@ -71,6 +140,16 @@ class TestHelperFunctions(unittest.TestCase):
             hf.get_unique_genres(self.test_df),
             set(["Action", "Comedy", "Romance"]))
 
+    def test_add_genre_mask(self):
+        """
+        Check that the function add_genre_mask(df, list) sets the bit of each
+        genre of a title, following the order of get_genre_vocabulary(set).
+        """
+        genres_vocab = hf.get_genre_vocabulary(hf.get_unique_genres(self.test_df))
+        self.assertEqual(genres_vocab, ["Action", "Comedy", "Romance"])
+        masked_df = hf.add_genre_mask(self.test_df.copy(), genres_vocab)
+        self.assertEqual(list(masked_df['genreMask']), [5, 2, 2, 4])
+
     def test_save_file(self):
         """
         Check that the save_file(file) function correctly outputs a csv file,
@@ -89,6 +168,135 @@ class TestHelperFunctions(unittest.TestCase):
         generated_df = hf.download_gz_file(IMDB_URL)
         self.assertGreater(len(generated_df), 0)
 
+    def test_download_gz_file_offline(self):
+        """
+        Checks that download_gz_file(url, parse) reads a local copy given by its path,
+        by a file:// URL or by a mirror directory, decompressing it on the fly, and
+        checks its expected digest.
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            ratings_path = os.path.join(PATH_TO_DATA_TESTS, IMDB_RATINGS_TEST)
+            gz_path = os.path.join(directory, 'title.ratings.tsv.gz')
+            with open(ratings_path, 'rb') as file_in, gzip.open(gz_path, 'wb') as file_out:
+                file_out.write(file_in.read())
+            expected_df = hf.read_imdb_ratings(ratings_path)
+            for url in [gz_path, Path(gz_path).absolute().as_uri(),
+                        hf.get_source_url(IMDB_URL, directory)]:
+                self.assertTrue(hf.download_gz_file(url, hf.read_imdb_ratings)
+                                .equals(expected_df))
+            self.assertTrue(hf.download_gz_file(gz_path, hf.read_imdb_ratings,
+                                                sha256=hf.get_file_sha256(gz_path))
+                            .equals(expected_df))
+            with self.assertRaises(ValueError):
+                hf.download_gz_file(gz_path, hf.read_imdb_ratings, sha256='0' * 64)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_cached_download(self):
+        """
+        Checks that a download to a cache directory resumes from a partial file, is
+        verified with its SHA-256 digest, and is then read from the cache.
+        """
+        directory = tempfile.mkdtemp()
+        server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(
+            QuietRequestHandler, directory=directory))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            ratings_path = os.path.join(PATH_TO_DATA_TESTS, IMDB_RATINGS_TEST)
+            with open(ratings_path, 'rb') as file_in:
+                data = gzip.compress(file_in.read())
+            with open(os.path.join(directory, 'ratings.tsv.gz'), 'wb') as file_out:
+                file_out.write(data)
+            cache_dir = os.path.join(directory, 'cache')
+            os.makedirs(cache_dir)
+            cached_path = os.path.join(cache_dir, 'ratings.tsv.gz')
+            with open(cached_path + hf.PART_EXT, 'wb') as file_out:
+                file_out.write(data[:len(data) // 2])
+            url = 'http://127.0.0.1:%d/ratings.tsv.gz' % server.server_port
+            expected_df = hf.read_imdb_ratings(ratings_path)
+            sha256 = hashlib.sha256(data).hexdigest()
+            self.assertTrue(hf.download_gz_file(url, hf.read_imdb_ratings, cache_dir, sha256)
+                            .equals(expected_df))
+            with open(cached_path, 'rb') as file_in:
+                self.assertEqual(file_in.read(), data)
+            self.assertFalse(os.path.exists(cached_path + hf.PART_EXT))
+            with self.assertRaises(ValueError):
+                hf.download_gz_file(url, hf.read_imdb_ratings, cache_dir, '0' * 64)
+            self.assertFalse(os.path.exists(cached_path))
+            hf.download_gz_file(url, hf.read_imdb_ratings, cache_dir)
+            server.shutdown()
+            server.server_close()
+            self.assertTrue(hf.download_gz_file(url, hf.read_imdb_ratings, cache_dir)
+                            .equals(expected_df))
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(directory)
+
+    def test_truncated_download(self):
+        """
+        Checks that a download cut before its announced size is resumed with a Range
+        request instead of being cached truncated, and that a saved part holding the
+        whole file is completed without downloading it again.
+        """
+        directory = tempfile.mkdtemp()
+        ratings_path = os.path.join(PATH_TO_DATA_TESTS, IMDB_RATINGS_TEST)
+        with open(ratings_path, 'rb') as file_in:
+            data = gzip.compress(file_in.read())
+        starts = []
+        server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(
+            TruncatingRequestHandler, data=data, starts=starts))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = 'http://127.0.0.1:%d/ratings.tsv.gz' % server.server_port
+            cached_path = os.path.join(directory, 'ratings.tsv.gz')
+            expected_df = hf.read_imdb_ratings(ratings_path)
+            self.assertTrue(hf.download_gz_file(url, hf.read_imdb_ratings, directory)
+                            .equals(expected_df))
+            self.assertEqual(starts, [0, len(data) // 2])
+            with open(cached_path, 'rb') as file_in:
+                self.assertEqual(file_in.read(), data)
+            with open(cached_path + hf.SHA256_EXT) as file_in:
+                self.assertEqual(file_in.read(), hashlib.sha256(data).hexdigest())
+            os.replace(cached_path, cached_path + hf.PART_EXT)
+            self.assertTrue(hf.download_gz_file(url, hf.read_imdb_ratings, directory)
+                            .equals(expected_df))
+            self.assertEqual(starts[2:], [len(data)])
+            self.assertTrue(os.path.exists(cached_path))
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(directory)
+
+    def test_open_dataset_file(self):
+        """
+        Checks that open_dataset_file(source, name) reads the same ratings from a
+        directory and from a zip archive, without extracting it, and that the movie
+        titles are read from the archive too.
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            zip_path = os.path.join(directory, 'dataset.zip')
+            with zipfile.ZipFile(zip_path, 'w') as zip_ref:
+                zip_ref.write(os.path.join(PATH_TO_DATA_TESTS, NF_RATINGS_TEST),
+                              'dataset/' + NF_RATINGS_TEST)
+                zip_ref.write(os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_RAW_TEST),
+                              'dataset/' + MOVIE_TITLES_RAW_TEST)
+            ratings = []
+            for source in [PATH_TO_DATA_TESTS, zip_path]:
+                with hf.open_dataset_file(source, NF_RATINGS_TEST) as file_open:
+                    ratings.append(hf.read_ratings([file_open]))
+            self.assertTrue(ratings[0].equals(ratings[1]))
+            self.assertEqual(len(ratings[0]), 10)
+            with hf.open_dataset_file(zip_path, MOVIE_TITLES_RAW_TEST) as file_open:
+                self.assertTrue(hf.format_movie_titles(file_open).equals(hf.format_movie_titles(
+                    os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_RAW_TEST))))
+            with self.assertRaises(FileNotFoundError):
+                hf.open_dataset_file(zip_path, 'missing.txt')
+        finally:
+            shutil.rmtree(directory)
+
     def test_parse_data(self):
         """
         Checks that the function parse_data(file) parses the data from the file
@@ -98,6 +306,31 @@ class TestHelperFunctions(unittest.TestCase):
         lst_data = hf.parse_data(file_path)
         self.assertEqual(len(lst_data), 10)
 
+    def test_iter_rating_chunks(self):
+        """
+        Checks that the function iter_rating_chunks(file, int) yields typed
+        chunks that carry the movie id across chunk boundaries.
+        """
+        file_path = os.path.join(PATH_TO_DATA_TESTS, NF_RATINGS_TEST)
+        chunks = list(hf.iter_rating_chunks(file_path, chunk_size=4))
+        df_netflix = pd.concat(chunks, ignore_index=True)
+        self.assertEqual(list(df_netflix.columns), NF_RATINGS_COLS)
+        self.assertEqual(df_netflix['movie_id'].tolist(),
+                         [1, 1, 1, 2, 2, 2, 2, 3, 3, 3])
+        self.assertEqual(df_netflix['user_id'].dtype, 'int32')
+        self.assertEqual(df_netflix['rating'].dtype, 'int8')
+
+    def test_read_ratings(self):
+        """
+        Checks that the function read_ratings(list) reads the same ratings
+        as parse_data(file).
+        """
+        file_path = os.path.join(PATH_TO_DATA_TESTS, NF_RATINGS_TEST)
+        lst_data = hf.parse_data(file_path)
+        df_netflix = hf.read_ratings([file_path])
+        self.assertEqual(df_netflix['user_id'].tolist(), [row[1] for row in lst_data])
+        self.assertEqual(df_netflix['rating'].tolist(), [row[2] for row in lst_data])
+
     def test_get_recommended_movies(self):
         """
         Checks that the function get_recommended_movies(df) outputs a dictionary with
@@ -108,6 +341,135 @@ class TestHelperFunctions(unittest.TestCase):
         df_netflix = pd.DataFrame(lst_data, columns=NF_RATINGS_COLS)
         self.assertEqual(len(hf.get_recommended_movies(df_netflix)), 3)
 
+    def test_get_top_k_similar(self):
+        """
+        Checks that the function get_top_k_similar(matrix, int, int) gives the
+        same neighbours and scores whatever the block size, excluding each
+        movie from its own neighbours.
+        """
+        file_path = os.path.join(PATH_TO_DATA_TESTS, NF_RATINGS_TEST)
+        movie_ids, items = hf.get_item_matrix(hf.read_ratings([file_path]))
+        neighbours, scores = hf.get_top_k_similar(items, k=2, block_size=1)
+        neighbours_one_block, scores_one_block = hf.get_top_k_similar(items, k=2)
+        self.assertEqual(neighbours.tolist(), neighbours_one_block.tolist())
+        self.assertEqual(scores.tolist(), scores_one_block.tolist())
+        self.assertEqual(movie_ids[neighbours[0]].tolist(), [3, 2])
+        self.assertEqual(scores.dtype, 'float32')
+
+    def test_get_top_k_similar_workers(self):
+        """
+        Checks that the function get_top_k_similar(matrix, int, int, int) gives
+        the same result with a process pool as with a single process.
+        """
+        file_path = os.path.join(PATH_TO_DATA_TESTS, NF_RATINGS_TEST)
+        _, items = hf.get_item_matrix(hf.read_ratings([file_path]))
+        neighbours, scores = hf.get_top_k_similar(items, k=2)
+        neighbours_pool, scores_pool = hf.get_top_k_similar(items, k=2, block_size=1,
+                                                            workers=2)
+        self.assertEqual(neighbours.tolist(), neighbours_pool.tolist())
+        self.assertEqual(scores.tolist(), scores_pool.tolist())
+
+    def test_get_top_k_similar_ivf(self):
+        """
+        Checks that the function get_top_k_similar_ivf(matrix, int) finds the exact
+        neighbours when every cluster is probed, and a high recall@k with few probes
+        when users only rate one of five groups of movies, with one process as with
+        a process pool.
+        """
+        random_state = np.random.RandomState(0)
+        user_ids = random_state.randint(1, 2000, 30000)
+        df_netflix = pd.DataFrame({'movie_id': random_state.randint(0, 60, 30000) * 5
+                                               + user_ids % 5 + 1,
+                                   'user_id': user_ids,
+                                   'rating': random_state.randint(1, 6, 30000)})
+        df_netflix = df_netflix.drop_duplicates(['movie_id', 'user_id'])
+        _, items = hf.get_item_matrix(df_netflix)
+        neighbours, scores = hf.get_top_k_similar(items, k=10)
+        neighbours_ivf, scores_ivf = hf.get_top_k_similar_ivf(items, k=10, n_lists=10,
+                                                              n_probe=10)
+        self.assertEqual(neighbours.tolist(), neighbours_ivf.tolist())
+        self.assertEqual(scores.tolist(), scores_ivf.tolist())
+        neighbours_ivf, scores_ivf = hf.get_top_k_similar_ivf(items, k=10, n_lists=10,
+                                                              n_probe=3)
+        neighbours_pool, scores_pool = hf.get_top_k_similar_ivf(items, k=10, n_lists=10,
+                                                                n_probe=3, workers=2)
+        self.assertEqual(neighbours_ivf.tolist(), neighbours_pool.tolist())
+        self.assertEqual(scores_ivf.tolist(), scores_pool.tolist())
+        self.assertEqual(hf.recall_at_k(neighbours, neighbours), 1.0)
+        self.assertGreater(hf.recall_at_k(neighbours, neighbours_ivf), 0.9)
+        self.assertEqual(hf.similarity_recall(items, neighbours), 1.0)
+
+    def test_update_recommendation_index(self):
+        """
+        Checks that the function update_recommendation_index(dict, dict, df) gives the
+        same index as a full build of all the ratings, when new ratings change existing
+        ratings, add ratings to some movies and add a new movie. The index and state
+        are stored and read back in between.
+        """
+        random_state = np.random.RandomState(0)
+        df_netflix = pd.DataFrame({'movie_id': random_state.randint(1, 120, 20000),
+                                   'user_id': random_state.randint(1, 3000, 20000),
+                                   'rating': random_state.randint(1, 6, 20000)})
+        df_netflix = df_netflix.drop_duplicates(['movie_id', 'user_id'])
+        df_delta = pd.DataFrame({'movie_id': [3, 3, 7, 150, 150],
+                                 'user_id': df_netflix['user_id'].iloc[:5].tolist(),
+                                 'rating': [1, 5, 2, 4, 3]})
+        state = hf.get_similarity_state(df_netflix)
+        hf.save_file(hf.build_recommendation_index(state), CURRENT_DIR, TEST_FILE_OUT, IDX_EXT)
+        hf.save_file(state, CURRENT_DIR, TEST_FILE_OUT, NPZ_EXT)
+        index = hf.read_index(os.path.join(CURRENT_DIR, TEST_FILE_OUT+IDX_EXT))
+        state = hf.load_similarity_state(os.path.join(CURRENT_DIR, TEST_FILE_OUT+NPZ_EXT))
+        os.remove(os.path.join(CURRENT_DIR, TEST_FILE_OUT+IDX_EXT))
+        os.remove(os.path.join(CURRENT_DIR, TEST_FILE_OUT+NPZ_EXT))
+
+        index, state = hf.update_recommendation_index(index, state, df_delta)
+        df_all = pd.concat([df_netflix, df_delta]).drop_duplicates(['movie_id', 'user_id'],
+                                                                   keep='last')
+        expected = hf.get_recommendation_index(df_all)
+        self.assertEqual(index['movie_ids'].tolist(), expected['movie_ids'].tolist())
+        self.assertEqual(index['neighbour_ids'].tolist(), expected['neighbour_ids'].tolist())
+        self.assertEqual(index['scores'].tolist(), expected['scores'].tolist())
+        self.assertEqual(state['norms'].tolist(),
+                         hf.get_similarity_state(df_all)['norms'].tolist())
+
+    def test_update_recommendation_index_blocks(self):
+        """
+        Checks that the function update_recommendation_index(dict, dict, df, int) gives
+        the same index as a full build when the changed movies span several blocks.
+        """
+        random_state = np.random.RandomState(1)
+        df_netflix = pd.DataFrame({'movie_id': random_state.randint(1, 200, 20000),
+                                   'user_id': random_state.randint(1, 3000, 20000),
+                                   'rating': random_state.randint(1, 6, 20000)})
+        df_netflix = df_netflix.drop_duplicates(['movie_id', 'user_id'])
+        df_delta = pd.DataFrame({'movie_id': np.arange(1, 60),
+                                 'user_id': random_state.randint(1, 3000, 59),
+                                 'rating': random_state.randint(1, 6, 59)})
+        state = hf.get_similarity_state(df_netflix)
+        index, _ = hf.update_recommendation_index(hf.build_recommendation_index(state),
+                                                  state, df_delta, block_size=8)
+        df_all = pd.concat([df_netflix, df_delta]).drop_duplicates(['movie_id', 'user_id'],
+                                                                   keep='last')
+        expected = hf.get_recommendation_index(df_all)
+        self.assertEqual(index['neighbour_ids'].tolist(), expected['neighbour_ids'].tolist())
+        self.assertEqual(index['scores'].tolist(), expected['scores'].tolist())
+
+    def test_get_embedding_index(self):
+        """
+        Checks that the function get_embedding_index(dict, int) gives float32
+        embeddings whose dot products are the cosine similarities when all the
+        dimensions are kept.
+        """
+        file_path = os.path.join(PATH_TO_DATA_TESTS, NF_RATINGS_TEST)
+        df_netflix = hf.read_ratings([file_path])
+        embedding_index = hf.get_embedding_index(hf.get_similarity_state(df_netflix), dim=3)
+        embeddings = embedding_index['embeddings']
+        _, items = hf.get_item_matrix(df_netflix)
+        self.assertEqual(embeddings.dtype, 'float32')
+        self.assertEqual(embedding_index['movie_ids'].tolist(), [1, 2, 3])
+        np.testing.assert_allclose(embeddings @ embeddings.T,
+                                   (items @ items.T).toarray(), atol=1e-5)
+
     def test_format_movie_titles(self):
         """
         Checks that the function format_movie_titles(file) processes the
@@ -132,6 +494,25 @@ class TestHelperFunctions(unittest.TestCase):
         merged_df = hf.clean_imdb_data(titles_df, ratings_df)
         self.assertEqual(list(merged_df.columns), IMDB_MERGED_COLS)
 
+    def test_read_imdb_titles(self):
+        """
+        Checks that the functions read_imdb_titles(file, int) and read_imdb_ratings(file)
+        read, in chunks, the titles and ratings that clean_imdb_data(df1, df2) keeps
+        from the complete files.
+        """
+        titles_path = os.path.join(PATH_TO_DATA_TESTS, IMDB_TITLES_TEST)
+        ratings_path = os.path.join(PATH_TO_DATA_TESTS, IMDB_RATINGS_TEST)
+        titles_df = hf.read_imdb_titles(titles_path, chunk_size=7)
+        self.assertEqual(list(titles_df.columns), hf.COL_SUBSET)
+        self.assertTrue(titles_df['titleType'].isin(['movie', 'tvSeries']).all())
+        merged_df = hf.clean_imdb_data(titles_df, hf.read_imdb_ratings(ratings_path))
+        expected_df = hf.clean_imdb_data(pd.read_csv(titles_path, sep=TAB, na_values=NAS),
+                                         pd.read_csv(ratings_path, sep=TAB, na_values=NAS))
+        self.assertEqual(list(merged_df.columns), IMDB_MERGED_COLS)
+        self.assertEqual(merged_df['tconst'].tolist(), expected_df['tconst'].tolist())
+        self.assertEqual(merged_df['weightedAverage'].tolist(),
+                         expected_df['weightedAverage'].tolist())
+
     def test_download_netflix_data(self):
         """
         The function download_netflix_data(user, directory) cannot be tested through
@@ -145,6 +526,25 @@ class TestHelperFunctions(unittest.TestCase):
         pass
 
 
+class TestSynthetic(unittest.TestCase):
+    """
+    Test the synthetic data of the benchmarks in benchmarks/synthetic.py.
+    """
+
+    def test_synthetic_ratings(self):
+        """
+        Checks that the synthetic ratings of the benchmarks are read by
+        read_ratings(list) with the requested number of ratings and movies.
+        """
+        file_path = os.path.join(CURRENT_DIR, TEST_FILE_OUT+'.txt')
+        synthetic.write_netflix_ratings(file_path, n_ratings=5000, n_movies=1500, n_users=100)
+        df_netflix = hf.read_ratings([file_path])
+        os.remove(file_path)
+        self.assertEqual(len(df_netflix), 5000)
+        self.assertLessEqual(df_netflix['movie_id'].max(), 1500)
+        self.assertLessEqual(df_netflix['user_id'].max(), 100)
+
+
 class TestImdb(unittest.TestCase):
     """
     Test all the function in imdb_service.py.
@@ -169,6 +569,22 @@ class TestImdb(unittest.TestCase):
         original_file = pd.read_csv(file_path)
         self.assertEqual(len(imdb.load_data(file_path)), len(original_file))
 
+    def test_load_data_typed(self):
+        """
+        Checks that the function load_data(file) loads the typed dataframe stored
+        by the preprocessing with the same compact dtypes as a csv file.
+        """
+        file_path = os.path.join(PATH_TO_DATA_TESTS, IMDB_TEST)
+        typed_df = hf.set_imdb_dtypes(pd.read_csv(file_path))
+        hf.save_file(typed_df, CURRENT_DIR, TEST_FILE_OUT, PKL_EXT)
+        pickle_path = os.path.join(CURRENT_DIR, TEST_FILE_OUT+PKL_EXT)
+        loaded_df = imdb.load_data(pickle_path)
+        os.remove(pickle_path)
+        self.assertTrue(loaded_df.equals(typed_df))
+        self.assertEqual(list(imdb.load_data(file_path).dtypes), list(typed_df.dtypes))
+        self.assertEqual(loaded_df['startYear'].dtype, 'int16')
+        self.assertEqual(loaded_df['titleType'].dtype, 'category')
+
     def test_load_genres(self):
         """
         Checks that the function load_genres(file) properly loads the list of genres.
@@ -192,6 +608,19 @@ class TestImdb(unittest.TestCase):
         """
         self.assertEqual(len(imdb.filter_genre(self.test_df, 'Action')), 5)
 
+    def test_filter_genres(self):
+        """
+        Checks that the function filter_genres(df, list, list, bool) filters test_df
+        by the genre bitmask, with all or any of the genres.
+        """
+        genres_vocab = ["Action", "Comedy", "Romance"]
+        masked_df = hf.add_genre_mask(self.test_df.copy(), genres_vocab)
+        self.assertEqual(len(imdb.filter_genre(masked_df, 'Action', genres_vocab)), 5)
+        self.assertEqual(len(imdb.filter_genres(masked_df, ['Action', 'Comedy'],
+                                                genres_vocab)), 2)
+        self.assertEqual(len(imdb.filter_genres(masked_df, ['Action', 'Romance'],
+                                                genres_vocab, match_all=False)), 9)
+
     def test_filter_year(self):
         """
         Checks that the function filter_year(df, int) filters test_df
@@ -208,6 +637,29 @@ class TestImdb(unittest.TestCase):
         """
         self.assertGreater(imdb.filter_top10(self.test_df)['weightedAverage'].min(), 1)
 
+    def test_filter_facets(self):
+        """
+        Checks that the lookups in the index built by build_facet_index(df) give the
+        same rows as chaining the filter functions and filter_top10(df).
+        """
+        facet_index = imdb.build_facet_index(self.test_df, top_n=10)
+        for genre in [None, 'Action', 'Romance']:
+            for year in [None, 2016, 2018]:
+                expected_df = imdb.filter_type(self.test_df, 'Movie')
+                if genre:
+                    expected_df = imdb.filter_genre(expected_df, genre)
+                if year:
+                    expected_df = imdb.filter_year(expected_df, year)
+                expected_df = imdb.filter_top10(expected_df)
+                facet_df = imdb.filter_facets(facet_index, self.test_df, 'Movie', genre, year)
+                self.assertTrue(facet_df.equals(expected_df))
+        self.assertEqual(len(imdb.filter_facets(facet_index, self.test_df, 'Movie', 'Drama')), 0)
+        genres_vocab = ["Action", "Comedy", "Romance"]
+        masked_df = hf.add_genre_mask(self.test_df.copy(), genres_vocab)
+        mask_index = imdb.build_facet_index(masked_df, top_n=10, genres_vocab=genres_vocab)
+        self.assertEqual({key: list(rows) for key, rows in mask_index.items()},
+                         {key: list(rows) for key, rows in facet_index.items()})
+
     def test_filter_selected(self):
         """
         Checks that the function filter_selected(list, string) returns true when
@@ -263,6 +715,61 @@ class TestNetflix(unittest.TestCase):
         movie_id = nf.get_movie_id(movies_df, title)
         self.assertEqual(movie_id, 61)
 
+    def test_build_title_index(self):
+        """
+        Checks that the TitleIndex resolves titles and row positions like a scan
+        of the dataframe.
+        """
+        file_path = os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_TEST)
+        movies_df = nf.reading_movie_title_csv(file_path)
+        title_index = nf.build_title_index(movies_df)
+        title = 'Ricky Martin: One Night Only - 1999'
+        self.assertEqual(nf.get_movie_id(movies_df, [title], title_index), 61)
+        row = title_index.row_by_sno[61]
+        self.assertEqual(movies_df['Display'].iloc[row], title)
+        self.assertEqual(len(title_index.sno_by_title), len(movies_df))
+
+    def test_search_titles(self):
+        """
+        Checks that search_titles(search, str) finds the titles having a word that
+        starts with the query, whatever its case, the whole-title matches first.
+        """
+        file_path = os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_TEST)
+        movies_df = nf.reading_movie_title_csv(file_path)
+        title_search = nf.build_title_search(movies_df['Display'])
+        display = movies_df['Display'].tolist()
+        matches = nf.search_titles(title_search, ' MAN', limit=100)
+        expected = [title for title in display
+                    if any(word.startswith('man') for word in title.lower().split())]
+        self.assertEqual(sorted(matches), sorted(expected))
+        self.assertEqual(nf.search_titles(title_search, 'ricky martin'),
+                         ['Ricky Martin: One Night Only - 1999'])
+        starts = [title for title in matches if title.lower().startswith('man')]
+        self.assertEqual(matches[:len(starts)], starts)
+        self.assertEqual(len(nf.search_titles(title_search, 'the', limit=2)), 2)
+        self.assertEqual(nf.search_titles(title_search, '  '), [])
+
+    def test_resolve_titles(self):
+        """
+        Checks that resolve_titles(index, str) finds a title despite typos and a
+        missing year, with the Dice score of their trigrams, and that
+        resolve_movie_id(index, str) gives its movie id.
+        """
+        file_path = os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_TEST)
+        movies_df = nf.reading_movie_title_csv(file_path)
+        fuzzy_index = nf.build_fuzzy_title_index(movies_df)
+        self.assertEqual(nf.get_ngrams('8 Man!'), {' 8 ', '8 m', ' ma', 'man', 'an '})
+        matches = nf.resolve_titles(fuzzy_index, 'Rickie Martin: one nite only', k=3)
+        self.assertEqual(matches[0][:2], (61, 'Ricky Martin: One Night Only - 1999'))
+        self.assertEqual([score for _, _, score in matches],
+                         sorted([score for _, _, score in matches], reverse=True))
+        title_grams = nf.get_ngrams('Ricky Martin: One Night Only - 1999')
+        query_grams = nf.get_ngrams('Rickie Martin: one nite only')
+        self.assertAlmostEqual(matches[0][2], 2 * len(title_grams & query_grams)
+                               / (len(title_grams) + len(query_grams)))
+        self.assertEqual(nf.resolve_movie_id(fuzzy_index, 'the rise and fal of ECW'), 5)
+        self.assertIsNone(nf.resolve_movie_id(fuzzy_index, 'xqzv'))
+
     def test_recommendation_for_movies(self):
         """
         Checks that the function recommendation_for_movies(file) loads a non-empty
@@ -272,6 +779,57 @@ class TestNetflix(unittest.TestCase):
         dict_recommendations = nf.recommendation_for_movies(file_path)
         self.assertTrue(len(dict_recommendations) > 0)
 
+    def test_recommendation_index(self):
+        """
+        Checks that an index written by helper_functions.save_file is read back
+        by recommendation_for_movies(file) with the dictionary lookup semantics, and
+        that the abstract MovieIndex cannot be opened.
+        """
+        file_path = os.path.join(PATH_TO_DATA_TESTS, NF_RATINGS_TEST)
+        df_netflix = hf.read_ratings([file_path])
+        index = hf.get_recommendation_index(df_netflix)
+        hf.save_file(index, CURRENT_DIR, TEST_FILE_OUT, IDX_EXT)
+        index_path = os.path.join(CURRENT_DIR, TEST_FILE_OUT+IDX_EXT)
+        dict_recommendations = nf.recommendation_for_movies(index_path)
+        self.assertEqual(len(dict_recommendations), 3)
+        self.assertEqual(dict_recommendations[1][0].tolist(), [3, 2])
+        self.assertEqual(dict_recommendations[1][1].tolist(), index['scores'][0].tolist())
+        self.assertFalse(4 in dict_recommendations)
+        counts = df_netflix['movie_id'].value_counts()
+        self.assertEqual(index['num_ratings'].tolist(),
+                         counts[index['movie_ids']].tolist())
+        self.assertEqual(dict_recommendations.most_rated(1),
+                         [int(counts[counts == counts.max()].index.min())])
+        del dict_recommendations
+        with self.assertRaises(TypeError):
+            nf.MovieIndex(index_path)
+        os.remove(index_path)
+
+    def test_embedding_index(self):
+        """
+        Checks that EmbeddingIndex(file) gives the same neighbours as the cosine
+        index when the embeddings keep all the dimensions, one movie at a time
+        and for several movies at once.
+        """
+        random_state = np.random.RandomState(0)
+        df_netflix = pd.DataFrame({'movie_id': random_state.randint(1, 40, 3000),
+                                   'user_id': random_state.randint(1, 500, 3000),
+                                   'rating': random_state.randint(1, 6, 3000)})
+        state = hf.get_similarity_state(df_netflix.drop_duplicates(['movie_id', 'user_id']))
+        hf.save_file(hf.get_embedding_index(state, dim=39), CURRENT_DIR, TEST_FILE_OUT,
+                     IDX_EXT)
+        index_path = os.path.join(CURRENT_DIR, TEST_FILE_OUT+IDX_EXT)
+        expected = hf.build_recommendation_index(state)
+        embedding_index = nf.EmbeddingIndex(index_path, k=10)
+        self.assertEqual(embedding_index[1][0].tolist(),
+                         expected['neighbour_ids'][0, :10].tolist())
+        neighbour_ids, scores = embedding_index.neighbours([1, 2, 3])
+        self.assertEqual(neighbour_ids.tolist(), expected['neighbour_ids'][:3, :10].tolist())
+        np.testing.assert_allclose(scores, expected['scores'][:3, :10], atol=1e-5)
+        self.assertFalse(40 in embedding_index)
+        del embedding_index
+        os.remove(index_path)
+
     def test_get_top10_movies(self):
         """
         CHecks that the function get_top10_movies(df, list1, list2) returns the info
@@ -286,6 +844,23 @@ class TestNetflix(unittest.TestCase):
         movies_info = nf.get_top10_movies(movies_df, movie_ids, movie_scores)
         self.assertEqual(len(movies_info), 10)
 
+    def test_get_top10_movies_order(self):
+        """
+        Checks that the function get_top10_movies(df, list1, list2, index) keeps the
+        recommendation order and aligns each score with its movie.
+        """
+        file_path = os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_TEST)
+        movies_df = nf.reading_movie_title_csv(file_path)
+        title_index = nf.build_title_index(movies_df)
+        movie_ids = [61, 3, 1]
+        movie_scores = [0.9, 0.5, 0.1]
+        for index in [None, title_index]:
+            movies_info = nf.get_top10_movies(movies_df, movie_ids, movie_scores, index)
+            self.assertEqual(list(movies_info['Movie Title']),
+                             ['Ricky Martin: One Night Only - 1999', 'Character - 1997',
+                              'Dinosaur Planet - 2003'])
+            self.assertEqual(list(movies_info['Match%']), [90, 50, 10])
+
     def test_userchoice_based_movie_recommendation(self):
         """
         CHecks that the function userchoice_based_movie_recommendation(title, df, dictionary)
@@ -300,6 +875,94 @@ class TestNetflix(unittest.TestCase):
                                                                dict_recommendations)
         self.assertGreater(len(movies_info), 0)
 
+    def test_movie_id_based_recommendation(self):
+        """
+        Checks that the function movie_id_based_recommendation(int, df, dictionary)
+        gives the same recommendations as the title based function.
+        """
+        titles_path = os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_TEST)
+        recs_path = os.path.join(PATH_TO_DATA_PROC, NF_DICT_RECOMMENDATIONS)
+        movies_df = nf.reading_movie_title_csv(titles_path)
+        dict_recommendations = nf.recommendation_for_movies(recs_path)
+        title = 'Ricky Martin: One Night Only - 1999'
+        by_title = nf.userchoice_based_movie_recommendation(title, movies_df,
+                                                            dict_recommendations)
+        by_id = nf.movie_id_based_recommendation(61, movies_df, dict_recommendations)
+        self.assertTrue(by_title.equals(by_id))
+
+    def test_fuse_recommendations(self):
+        """
+        Checks that the function fuse_recommendations(dict, list) sums or keeps the
+        best score of the movies recommended for several seeds, never recommends the
+        seeds and ignores the unknown seeds.
+        """
+        dict_recommendations = {1: [np.array([2, 3, 4]), np.array([0.9, 0.5, 0.4])],
+                                2: [np.array([1, 4, 3]), np.array([0.9, 0.8, 0.1])]}
+        movie_ids, scores = nf.fuse_recommendations(dict_recommendations, [1, 2])
+        self.assertEqual(movie_ids.tolist(), [4, 3])
+        np.testing.assert_allclose(scores, [0.6, 0.3])
+        movie_ids, scores = nf.fuse_recommendations(dict_recommendations, [1, 2],
+                                                    fusion='max')
+        self.assertEqual(movie_ids.tolist(), [4, 3])
+        np.testing.assert_allclose(scores, [0.8, 0.5])
+        movie_ids, _ = nf.fuse_recommendations(dict_recommendations, [1], k=2)
+        self.assertEqual(movie_ids.tolist(), [2, 3])
+        movie_ids, scores = nf.fuse_recommendations(dict_recommendations, [1, 5, 2])
+        self.assertEqual(movie_ids.tolist(), [4, 3])
+        np.testing.assert_allclose(scores, [0.6, 0.3])
+        self.assertEqual(len(nf.fuse_recommendations(dict_recommendations, [5])[0]), 0)
+
+    def test_movies_based_recommendation(self):
+        """
+        Checks that the function userchoice_based_movie_recommendation(list, df, index)
+        recommends none of several selected movies, gives the single movie
+        recommendations for one selected movie, and leaves out a selected movie that is
+        not indexed.
+        """
+        titles_path = os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_TEST)
+        recs_path = os.path.join(PATH_TO_DATA_PROC, NF_DICT_RECOMMENDATIONS)
+        movies_df = nf.reading_movie_title_csv(titles_path)
+        dict_recommendations = nf.recommendation_for_movies(recs_path)
+        titles = movies_df['Display'].iloc[:3].tolist()
+        movies_info = nf.userchoice_based_movie_recommendation(titles, movies_df,
+                                                               dict_recommendations)
+        self.assertGreater(len(movies_info), 0)
+        self.assertFalse(movies_info['Movie Title'].isin(titles).any())
+        by_list = nf.userchoice_based_movie_recommendation(titles[:1] * 2, movies_df,
+                                                           dict_recommendations)
+        by_title = nf.userchoice_based_movie_recommendation(titles[0], movies_df,
+                                                            dict_recommendations)
+        self.assertTrue(by_list.equals(by_title))
+        # A selected movie missing from the index is left out of the seeds.
+        known_ids = nf.get_movie_ids(movies_df, titles[1:])
+        partial_index = {movie_id: dict_recommendations[movie_id] for movie_id in known_ids}
+        by_known = nf.userchoice_based_movie_recommendation(titles[1:], movies_df,
+                                                            partial_index)
+        with_unknown = nf.userchoice_based_movie_recommendation(titles, movies_df,
+                                                                partial_index)
+        self.assertTrue(with_unknown.equals(by_known))
+
+    def test_iter_recommendation_chunks(self):
+        """
+        Checks that the function iter_recommendation_chunks(index, df) gives the top k
+        recommendations of every movie, in chunks, joined with the titles.
+        """
+        titles_path = os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_TEST)
+        recs_path = os.path.join(PATH_TO_DATA_PROC, NF_DICT_RECOMMENDATIONS)
+        movies_df = nf.reading_movie_title_csv(titles_path)
+        dict_recommendations = nf.recommendation_for_movies(recs_path)
+        chunks = list(nf.iter_recommendation_chunks(dict_recommendations, movies_df,
+                                                    movie_ids=[61, 1, 2], k=3,
+                                                    chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [6, 3])
+        export_df = pd.concat(chunks, ignore_index=True)
+        self.assertEqual(list(export_df.columns), nf.EXPORT_COLS)
+        self.assertEqual(export_df['rank'].tolist()[:3], [1, 2, 3])
+        expected = nf.movie_id_based_recommendation(61, movies_df, dict_recommendations)
+        self.assertEqual(export_df['recommended_title'].tolist()[:3],
+                         expected['Movie Title'].tolist()[:3])
+        self.assertEqual(export_df['title'].iloc[0], 'Ricky Martin: One Night Only - 1999')
+
     def test_generate_table(self):
         """
         Checks that the function generate_table(df, int) returns an html Table.
@@ -307,6 +970,390 @@ class TestNetflix(unittest.TestCase):
         max_rows = 5
         table_output = app.web.choice_based_recommendation.generate_table(self.test_df, max_rows)
         self.assertTrue(isinstance(table_output, html.Table))
+        rows = table_output.children[1].children
+        self.assertEqual(len(rows), max_rows)
+        self.assertEqual([cell.children for cell in rows[2].children],
+                         self.test_df.iloc[2].tolist())
+
+
+class TestDataRegistry(unittest.TestCase):
+    """
+    Test the DataRegistry in data_registry.py.
+    """
+
+    def test_lazy_loading(self):
+        """
+        Checks that a dataset is only loaded on first access, only once when
+        several threads read it at the same time, and again after clear().
+        """
+        calls = []
+        registry = DataRegistry()
+        registry.register('numbers', lambda size: calls.append(size) or list(range(size)), 3)
+        self.assertFalse(registry.is_loaded('numbers'))
+        threads = [threading.Thread(target=registry.get, args=('numbers',))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(registry.numbers, [0, 1, 2])
+        self.assertEqual(calls, [3])
+        self.assertIn('numbers', registry.load_times)
+        registry.clear()
+        self.assertFalse(registry.is_loaded('numbers'))
+        self.assertEqual(registry.numbers, [0, 1, 2])
+        self.assertEqual(calls, [3, 3])
+
+    def test_preload(self):
+        """
+        Checks that preload() loads every registered dataset, including the ones
+        built from other datasets.
+        """
+        registry = DataRegistry()
+        registry.register('base', list, 'abc')
+        registry.register('derived', lambda: len(registry.base))
+        registry.preload()
+        self.assertTrue(registry.is_loaded('base'))
+        self.assertTrue(registry.is_loaded('derived'))
+        self.assertEqual(registry.derived, 3)
+        with self.assertRaises(AttributeError):
+            registry.missing
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Test the instrumentation in metrics.py.
+    """
+
+    def tearDown(self):
+        metrics.HISTOGRAMS.pop('test_function', None)
+        metrics.CACHES.pop('test_cache', None)
+
+    def test_timed(self):
+        """
+        Checks that timed(name) returns the function itself when disabled, and
+        records every call in the histogram when enabled.
+        """
+        def square(value):
+            return value * value
+        self.assertIs(metrics.timed('test_function', enabled=False)(square), square)
+        self.assertNotIn('test_function', metrics.HISTOGRAMS)
+        timed_square = metrics.timed('test_function', enabled=True)(square)
+        self.assertEqual([timed_square(value) for value in range(3)], [0, 1, 4])
+        histogram = metrics.HISTOGRAMS['test_function']
+        self.assertEqual(histogram.count, 3)
+        self.assertEqual(histogram.cumulative_counts()[-1], (float('inf'), 3))
+
+    def test_render(self):
+        """
+        Checks that render() writes the histograms and the cache statistics in the
+        Prometheus text format.
+        """
+        histogram = metrics.HISTOGRAMS.setdefault('test_function', metrics.Histogram())
+        histogram.observe(0.003)
+        histogram.observe(20)
+        cached = lru_cache()(abs)
+        cached(-1)
+        cached(-1)
+        metrics.register_cache('test_cache', cached.cache_info)
+        lines = metrics.render().splitlines()
+        name = 'recommender_call_duration_seconds'
+        self.assertIn(name + '_bucket{function="test_function",le="0.0025"} 0', lines)
+        self.assertIn(name + '_bucket{function="test_function",le="0.005"} 1', lines)
+        self.assertIn(name + '_bucket{function="test_function",le="+Inf"} 2', lines)
+        self.assertIn(name + '_count{function="test_function"} 2', lines)
+        self.assertIn('recommender_cache_hits_total{cache="test_cache"} 1', lines)
+        self.assertIn('recommender_cache_misses_total{cache="test_cache"} 1', lines)
+
+
+class TestResponseCache(unittest.TestCase):
+    """
+    Test the cache of the callback responses in response_cache.py.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_path = os.path.join(self.directory, 'data.pkl')
+        with open(self.data_path, 'w') as file:
+            file.write('v1')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_or_compute(self):
+        """
+        Checks that a response is computed once per inputs, served as JSON afterwards,
+        and that the least recently used responses are evicted.
+        """
+        calls = []
+        cache = ResponseCache(2, [self.data_path])
+
+        def compute(value):
+            return lambda: calls.append(value) or {'data': [{'x': [value], 'type': 'bar'}]}
+        self.assertEqual(cache.get_or_compute('figure', [1], compute(1)),
+                         {'data': [{'x': [1], 'type': 'bar'}]})
+        self.assertEqual(cache.get_or_compute('figure', [1], compute(1)),
+                         {'data': [{'x': [1], 'type': 'bar'}]})
+        cache.get_or_compute('figure', [2], compute(2))
+        cache.get_or_compute('figure', [3], compute(3))
+        cache.get_or_compute('figure', [1], compute(1))
+        self.assertEqual(calls, [1, 2, 3, 1])
+        self.assertEqual(cache.cache_info(), (1, 4, 2, 2))
+
+    def test_invalidation(self):
+        """
+        Checks that the responses are recomputed when a data file changes, and that
+        the on-disk tier is shared by the caches using the same directory.
+        """
+        calls = []
+        cache_dir = os.path.join(self.directory, 'responses')
+        cache = ResponseCache(8, [self.data_path], cache_dir)
+        compute = lambda: calls.append(1) or [html.Div('table'), {'data': []}]
+        cache.get_or_compute('table', ['a'], compute)
+        other = ResponseCache(8, [self.data_path], cache_dir)
+        self.assertEqual(other.get_or_compute('table', ['a'], compute),
+                         [{'props': {'children': 'table'}, 'type': 'Div',
+                           'namespace': 'dash_html_components'}, {'data': []}])
+        self.assertEqual(len(calls), 1)
+        with open(self.data_path, 'w') as file:
+            file.write('v2 of the data')
+        cache._checked_at = float('-inf')
+        cache.get_or_compute('table', ['a'], compute)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(os.listdir(cache_dir), [cache.version()])
+
+    def test_version_change(self):
+        """
+        Checks that the on_change hook is called when a data file changes, and that
+        the on-disk tier is bounded.
+        """
+        changes = []
+        cache_dir = os.path.join(self.directory, 'responses')
+        cache = ResponseCache(8, [self.data_path], cache_dir, disk_maxsize=10,
+                              on_change=lambda: changes.append(1))
+        for value in range(DISK_PRUNE_INTERVAL):
+            cache.get_or_compute('figure', [value], lambda: {'data': []})
+        self.assertEqual(len(os.listdir(os.path.join(cache_dir, cache.version()))), 10)
+        self.assertEqual(changes, [])
+        with open(self.data_path, 'w') as file:
+            file.write('v2 of the data')
+        cache._checked_at = float('-inf')
+        cache.version()
+        self.assertEqual(changes, [1])
+
+
+class TestWarmup(unittest.TestCase):
+    """
+    Test the warm-up of the caches in warmup.py.
+    """
+
+    def test_get_warmup_facets(self):
+        """
+        Checks that get_warmup_facets(int) gives every type and genre, for every
+        latest year and for the unchecked filters.
+        """
+        registry = DataRegistry()
+        registry.register('imdb_df', imdb.load_data, os.path.join(PATH_TO_DATA_TESTS, IMDB_TEST))
+        registry.register('genres', imdb.load_genres, os.path.join(PATH_TO_DATA_TESTS,
+                                                                   GENRES_TEST))
+        data = app.warmup.DATA
+        app.warmup.DATA = registry
+        try:
+            facets = app.warmup.get_warmup_facets(3)
+        finally:
+            app.warmup.DATA = data
+        year_max = int(registry.imdb_df['startYear'].max())
+        self.assertEqual(len(facets), len(hf.TYPE_FILTER) * (len(registry.genres) + 1) * 4)
+        self.assertEqual(facets[:4], [('movie', None, None), ('movie', None, year_max),
+                                      ('movie', None, year_max - 1),
+                                      ('movie', None, year_max - 2)])
+        self.assertIn(('tvSeries', sorted(registry.genres)[0], year_max), facets)
+
+    def test_get_warmup_movie_ids(self):
+        """
+        Checks that get_warmup_movie_ids(int) gives the indexed movies of the default
+        selection and then the first movies of a former recommendation dictionary,
+        which does not know the most rated movies.
+        """
+        movies_df = nf.reading_movie_title_csv(os.path.join(PATH_TO_DATA_TESTS,
+                                                            MOVIE_TITLES_TEST))
+        snos = movies_df['Sno'].tolist()
+        default_id = snos[app.warmup.DEFAULT_MOVIE_ROW]
+        registry = DataRegistry()
+        registry.register('movies_df', lambda: movies_df)
+        registry.register('title_index', lambda: nf.build_title_index(movies_df))
+        registry.register('dict_rec', lambda: {sno: [[], []] for sno in snos[:5]
+                                               + [default_id]})
+        data = app.warmup.DATA
+        app.warmup.DATA = registry
+        try:
+            movie_ids = app.warmup.get_warmup_movie_ids(3)
+        finally:
+            app.warmup.DATA = data
+        self.assertEqual(movie_ids, [default_id] + snos[:3])
+
+
+class TestExport(unittest.TestCase):
+    """
+    Test the export of the recommendations in export.py.
+    """
+
+    def test_export_recommendations(self):
+        """
+        Checks that the function export_recommendations(file, index, df) writes the
+        same rows to csv and JSON lines files.
+        """
+        titles_path = os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_TEST)
+        recs_path = os.path.join(PATH_TO_DATA_PROC, NF_DICT_RECOMMENDATIONS)
+        movies_df = nf.reading_movie_title_csv(titles_path)
+        dict_recommendations = nf.recommendation_for_movies(recs_path)
+        exported = []
+        for ext in [CSV_EXT, '.jsonl']:
+            file_path = os.path.join(CURRENT_DIR, TEST_FILE_OUT+ext)
+            n_rows = app.export.export_recommendations(file_path, dict_recommendations,
+                                                       movies_df, k=5, chunk_size=7)
+            self.assertEqual(n_rows, 5 * len(dict_recommendations))
+            if ext == CSV_EXT:
+                exported.append(pd.read_csv(file_path))
+            else:
+                exported.append(pd.read_json(file_path, lines=True))
+            os.remove(file_path)
+        self.assertEqual(len(exported[0]), n_rows)
+        self.assertEqual(exported[0]['recommended_id'].tolist(),
+                         exported[1]['recommended_id'].tolist())
+
+    def test_export_empty(self):
+        """
+        Checks that the function export_recommendations(file, index, df, ids) writes
+        an empty file with the exported columns, in every format, when there is no
+        movie to export.
+        """
+        titles_path = os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_TEST)
+        recs_path = os.path.join(PATH_TO_DATA_PROC, NF_DICT_RECOMMENDATIONS)
+        movies_df = nf.reading_movie_title_csv(titles_path)
+        dict_recommendations = nf.recommendation_for_movies(recs_path)
+        extensions = [CSV_EXT, '.jsonl']
+        if importlib.util.find_spec('pyarrow') is not None:
+            extensions.append('.parquet')
+        for ext in extensions:
+            file_path = os.path.join(CURRENT_DIR, TEST_FILE_OUT+ext)
+            n_rows = app.export.export_recommendations(file_path, dict_recommendations,
+                                                       movies_df, [-1])
+            self.assertEqual(n_rows, 0)
+            self.assertTrue(os.path.exists(file_path))
+            if ext == CSV_EXT:
+                self.assertEqual(pd.read_csv(file_path).columns.tolist(), nf.EXPORT_COLS)
+            elif ext == '.parquet':
+                exported = pd.read_parquet(file_path)
+                self.assertEqual(exported.columns.tolist(), nf.EXPORT_COLS)
+                self.assertEqual(len(exported), 0)
+            else:
+                self.assertEqual(os.path.getsize(file_path), 0)
+            os.remove(file_path)
+
+    def test_export_unknown_ids(self):
+        """
+        Checks that the function export_recommendations(file, index, df, ids) skips
+        the unknown movie ids, and keeps the previous file when the export fails.
+        """
+        titles_path = os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_TEST)
+        recs_path = os.path.join(PATH_TO_DATA_PROC, NF_DICT_RECOMMENDATIONS)
+        movies_df = nf.reading_movie_title_csv(titles_path)
+        dict_recommendations = nf.recommendation_for_movies(recs_path)
+        movie_id = next(iter(dict_recommendations))
+        file_path = os.path.join(CURRENT_DIR, TEST_FILE_OUT+CSV_EXT)
+        n_rows = app.export.export_recommendations(file_path, dict_recommendations,
+                                                   movies_df, [movie_id, -1], k=5)
+        self.assertEqual(n_rows, 5)
+        self.assertEqual(pd.read_csv(file_path)['movie_id'].unique().tolist(), [movie_id])
+        # A movie without recommendations makes the export fail after it started.
+        with self.assertRaises(TypeError):
+            app.export.export_recommendations(file_path, {movie_id: None}, movies_df,
+                                              [movie_id])
+        self.assertEqual(len(pd.read_csv(file_path)), 5)
+        self.assertFalse(os.path.exists(file_path + app.export.TMP_EXT))
+        os.remove(file_path)
+
+
+class TestApi(unittest.TestCase):
+    """
+    Test the JSON API in api.py, on the data of the test files.
+    """
+
+    def setUp(self):
+        file_path = os.path.join(PATH_TO_DATA_TESTS, NF_RATINGS_TEST)
+        hf.save_file(hf.get_recommendation_index(hf.read_ratings([file_path])),
+                     CURRENT_DIR, TEST_FILE_OUT, IDX_EXT)
+        self.index_path = os.path.join(CURRENT_DIR, TEST_FILE_OUT+IDX_EXT)
+        registry = DataRegistry()
+        registry.register('dict_rec', nf.recommendation_for_movies, self.index_path)
+        registry.register('imdb_df', imdb.load_data,
+                          os.path.join(PATH_TO_DATA_TESTS, IMDB_TEST))
+        registry.register('facet_index', lambda: imdb.build_facet_index(registry.imdb_df))
+        registry.register('fuzzy_titles', lambda: nf.build_fuzzy_title_index(
+            nf.reading_movie_title_csv(os.path.join(PATH_TO_DATA_TESTS, MOVIE_TITLES_TEST))))
+        self.data = app.api.DATA
+        app.api.DATA = registry
+        self.client = app.app.app.server.test_client()
+
+    def tearDown(self):
+        app.api.DATA = self.data
+        os.remove(self.index_path)
+
+    def test_similar(self):
+        """
+        Checks that GET /api/similar/<id> gives the k most similar movies, and an
+        error for an unknown movie or an invalid k.
+        """
+        response = self.client.get('/api/similar/1?k=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['ids'], [3])
+        self.assertEqual(self.client.get('/api/similar/4').status_code, 404)
+        self.assertEqual(self.client.get('/api/similar/1?k=0').status_code, 400)
+
+    def test_similar_batch(self):
+        """
+        Checks that POST /api/similar gives the similar movies of every known movie,
+        lists the unknown ones, and rejects booleans as movie ids or k.
+        """
+        response = self.client.post('/api/similar', json={'movie_ids': [1, 2, 4], 'k': 2})
+        body = response.get_json()
+        self.assertEqual(sorted(body['results']), ['1', '2'])
+        self.assertEqual(body['results']['1']['ids'], [3, 2])
+        self.assertEqual(body['missing'], [4])
+        self.assertEqual(self.client.post('/api/similar', json={}).status_code, 400)
+        self.assertEqual(self.client.post('/api/similar',
+                                          json={'movie_ids': [True]}).status_code, 400)
+        self.assertEqual(self.client.post('/api/similar', json={'movie_ids': [1],
+                                                               'k': True}).status_code, 400)
+
+    def test_top(self):
+        """
+        Checks that GET /api/top gives the titles of filter_facets, in order.
+        """
+        imdb_df = imdb.load_data(os.path.join(PATH_TO_DATA_TESTS, IMDB_TEST))
+        expected = imdb.filter_top10(imdb.filter_type(imdb_df, 'movie'))
+        response = self.client.get('/api/top?type=movie')
+        titles = [row['title'] for row in response.get_json()['results']]
+        self.assertEqual(titles, expected['primaryTitle'].tolist())
+        self.assertEqual(self.client.get('/api/top?year=x').status_code, 400)
+
+    def test_resolve(self):
+        """
+        Checks that GET and POST /api/resolve give the movie ids of approximate
+        titles, and an error for an empty title.
+        """
+        response = self.client.get('/api/resolve?title=rickie%20martin%20one%20nite')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.get_json()['results']], [61])
+        response = self.client.post('/api/resolve', json={'titles': ['dinosaur planet',
+                                                                    'xqzv'], 'k': 2})
+        results = response.get_json()['results']
+        self.assertEqual(results[0][0]['id'], 1)
+        self.assertEqual(results[1], [])
+        self.assertEqual(self.client.get('/api/resolve?title=%20').status_code, 400)
+        self.assertEqual(self.client.post('/api/resolve', json={'titles': 'x'}).status_code,
+                         400)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,117 @@
+"""
+This module warms up the web-app after a deploy: it renders, in a background thread of
+each server process, the responses that the first users are the most likely to ask
+for, so that they are served from the caches instead of paying the cold cost. These
+are the layouts, the title search indexes, the recommendations of the most rated
+movies and of the default selection, and the figures of every (type, genre, year)
+facet of the second tab for the latest years.
+"""
+import threading
+import time
+from itertools import islice
+
+from app import metrics
+from app import netflix_service as nmr
+from app.app import DATA, recommendation_response, filter_response
+from app.data.formats import TYPE_FILTER
+from app.web import choice_based_recommendation, filter_based_recommendation
+
+WARMUP_MOVIES = 100
+WARMUP_YEARS = 10
+# Position of the movie selected by default in the first tab.
+DEFAULT_MOVIE_ROW = 61
+WARMUP_TIMES = {}
+
+metrics.register_gauge('warmup_seconds', 'Time taken by each warm-up stage.',
+                       lambda: dict(WARMUP_TIMES))
+
+
+def get_warmup_movie_ids(n_movies):
+    """
+    It returns the movies whose recommendations are warmed up
+    Args:
+        n_movies: number of most rated movies
+    Returns: List of indexed movie ids: the default selection, then the most rated
+    movies, or the first movies of a former recommendation dictionary
+    """
+    default_ids = nmr.get_movie_ids(DATA.movies_df,
+                                    DATA.movies_df['Display'].iloc[DEFAULT_MOVIE_ROW],
+                                    DATA.title_index)
+    most_rated = getattr(DATA.dict_rec, 'most_rated', None)
+    if most_rated is not None:
+        popular_ids = most_rated(n_movies)
+    else:
+        popular_ids = list(islice(DATA.dict_rec, n_movies))
+    movie_ids = dict.fromkeys(default_ids + popular_ids)
+    return [movie_id for movie_id in movie_ids if movie_id in DATA.dict_rec]
+
+
+def get_warmup_facets(n_years):
+    """
+    It returns the facets of the second tab that are warmed up
+    Args:
+        n_years: number of latest years
+    Returns: List of (type, genre, year), where a genre or a year of None stands for
+    the filter being unchecked
+    """
+    year_max = int(DATA.imdb_df['startYear'].max())
+    years = [None] + list(range(year_max, year_max - n_years, -1))
+    genres = [None] + sorted(DATA.genres)
+    return [(title_type, genre, year)
+            for title_type in TYPE_FILTER for genre in genres for year in years]
+
+
+def warm_up(n_movies=WARMUP_MOVIES, n_years=WARMUP_YEARS):
+    """
+    It renders and caches the layouts, the title search indexes, the recommendations
+    of the most rated movies and the figures of the facets of the latest years
+    Args:
+        n_movies: number of most rated movies
+        n_years: number of latest years
+    Returns: Time taken in seconds
+    """
+    start = time.perf_counter()
+    choice_based_recommendation.choice_based_recommendation_layout()
+    filter_based_recommendation.tab2_layout()
+    DATA.get('title_search')
+    DATA.get('fuzzy_titles')
+    movie_ids = get_warmup_movie_ids(n_movies)
+    for movie_id in movie_ids:
+        recommendation_response((movie_id,))
+    WARMUP_TIMES['recommendations'] = time.perf_counter() - start
+
+    facets_start = time.perf_counter()
+    facets = get_warmup_facets(n_years)
+    for title_type, genre, year in facets:
+        filter_response(title_type, genre, year)
+    WARMUP_TIMES['facets'] = time.perf_counter() - facets_start
+    WARMUP_TIMES['total'] = time.perf_counter() - start
+    print('Done warming up %d recommendations and %d facets in %.2fs'
+          % (len(movie_ids), len(facets), WARMUP_TIMES['total']))
+    return WARMUP_TIMES['total']
+
+
+def run_warm_up(n_movies, n_years):
+    """
+    It runs the warm-up, reporting a failure instead of raising it, as nothing
+    waits for the warm-up thread
+    """
+    try:
+        warm_up(n_movies, n_years)
+    except Exception as error:  # pylint: disable=broad-except
+        print('Warm-up failed: %r' % error)
+
+
+def start_warm_up(n_movies=WARMUP_MOVIES, n_years=WARMUP_YEARS):
+    """
+    It starts the warm-up in a daemon thread, so that the server is ready without
+    waiting for it
+    Args:
+        n_movies: number of most rated movies
+        n_years: number of latest years
+    Returns: The started thread
+    """
+    thread = threading.Thread(target=run_warm_up, args=(n_movies, n_years),
+                              name='warm-up', daemon=True)
+    thread.start()
+    return thread
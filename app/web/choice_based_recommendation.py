@@ -1,10 +1,12 @@
 """ This is dash layout file for Personal Choice based Recommendation.
     It is being called in app.py
 """
+from functools import lru_cache
 import dash_html_components as html
 import dash_core_components as dcc
-from app.app import MOVIES_DF
+from app.app import DATA
 from app import netflix_service as nmr
+from app.metrics import timed
 
 COLORS = {
     'background': 'white',
@@ -12,49 +14,63 @@ COLORS = {
     'text': 'black'
 }
 
-CHOICE_BASED_RECOMMENDATION_LAYOUT = html.Div(
-    style={'backgroundColor': COLORS['background']}, children=[
-        html.Div(className='div-user-controls',
-                 children=[
-                     html.H4(children='Enter a movie you have loved watching: ',
-                             style={
-                                 'textAlign': 'left',
-                                 'color': COLORS['text']
-                             }),
-                     html.Div(
-                         className='div-for-dropdown-and-table',
-                         children=[
-                             dcc.Dropdown(id='movie_list_input',
-                                          options=nmr.get_options(MOVIES_DF['Display'].unique()),
-                                          value=[MOVIES_DF['Display'].iloc[61]],
-                                          searchable=True,
-                                          placeholder="Select a movie"
-                                          ),
-                         ],
-                         style={'width': '50%', 'text': 'black', 'font': 'Times New Roman',
-                                'background': COLORS['background1']}
+
+@lru_cache(maxsize=None)
+def choice_based_recommendation_layout():
+    """
+    It builds the layout of the choice based recommendation tab. The movies are
+    loaded on the first call and the layout is then reused
+    Returns: Html div of the tab
+    """
+    default_movie = DATA.movies_df['Display'].iloc[61]
+    return html.Div(
+        style={'backgroundColor': COLORS['background']}, children=[
+            html.Div(className='div-user-controls',
+                     children=[
+                         html.H4(children='Enter the movies you have loved watching: ',
+                                 style={
+                                     'textAlign': 'left',
+                                     'color': COLORS['text']
+                                 }),
+                         html.Div(
+                             className='div-for-dropdown-and-table',
+                             children=[
+                                 # The options are searched on the server as
+                                 # the user types, see app.update_movie_options.
+                                 dcc.Dropdown(id='movie_list_input',
+                                              options=nmr.get_options([default_movie]),
+                                              value=[default_movie],
+                                              multi=True,
+                                              searchable=True,
+                                              placeholder="Type to search one or more "
+                                                          "movies"
+                                              ),
+                             ],
+                             style={'width': '50%', 'text': 'black', 'font': 'Times New Roman',
+                                    'background': COLORS['background1']}
+                         ),
+                         html.Div(children=[html.H1("\n \n")]),
+                         html.Div(id='after_input_text',
+                                  children=[html.P("\n\nWe believe based on your liking "
+                                                   "for the above movies, the following "
+                                                   "10 movies will interest you the most:")],
+                                  style={'text-orientation': 'left'}
+                                  )
+                     ]
                      ),
-                     html.Div(children=[html.H1("\n \n")]),
-                     html.Div(id='after_input_text',
-                              children=[html.P("\n\nWe believe based on your liking "
-                                               "for the above movie, the following "
-                                               "10 movies will interest you the most:")],
-                              style={'text-orientation': 'left'}
-                              )
-                 ]
-                 ),
-        html.Div(id='output',
-                 className='row',
-                 children=[html.Div(id='my-table',
-                                    className='five columns'),
-                           html.Div(dcc.Graph(id='my-scatter-plot'),
-                                    className='seven columns')
-                           ]
-                 )
-    ]
-)
+            html.Div(id='output',
+                     className='row',
+                     children=[html.Div(id='my-table',
+                                        className='five columns'),
+                               html.Div(dcc.Graph(id='my-scatter-plot'),
+                                        className='seven columns')
+                               ]
+                     )
+        ]
+    )
 
 
+@timed('generate_table')
 def generate_table(dataframe, max_rows=10):
     """
     It generates a html table which is used in choice_based_recommendation.py file
@@ -68,13 +84,14 @@ def generate_table(dataframe, max_rows=10):
         html.Thead(
             html.Tr([html.Th(col) for col in dataframe.columns])
         ),
+        # Rows are read column-wise once, instead of one cell lookup at a time.
         html.Tbody([
-            html.Tr([
-                html.Td(dataframe.iloc[i][col]) for col in dataframe.columns
-            ]) for i in range(min(len(dataframe), max_rows))
+            html.Tr([html.Td(value) for value in row])
+            for row in dataframe.head(max_rows).itertuples(index=False, name=None)
         ])
     ])
 
+@timed('choice_based_recommendation.update_figure')
 def update_figure(movie_list):
     return {
         'data': [{'x': movie_list['Movie Title'], 'y': movie_list['Match%'], 'type': 'bar'}],
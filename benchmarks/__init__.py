@@ -0,0 +1,4 @@
+"""
+Benchmarks of the preprocessing and serving hot paths, on synthetic data.
+Run them from the project root with: python -m benchmarks.run
+"""
@@ -0,0 +1,270 @@
+"""
+This module runs the benchmarks of the preprocessing and serving hot paths on
+synthetic data, and writes the wall time and peak traced memory of each one to a
+JSON file, so that the results of two versions can be compared:
+    python -m benchmarks.run --ratings 1M --output results.json
+The timed runs and the memory run are separate, because tracing the allocations
+slows down the code.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import app.app
+import app.data.helper_functions as hf
+from app import imdb_service
+from app import netflix_service as nmr
+from app.data_registry import DataRegistry
+from benchmarks import synthetic
+
+SCALE_SUFFIXES = {'K': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9}
+N_QUERIES = 100
+TAB = '\t'
+NAS = ['\\N']
+RATINGS_FILE = 'combined_data.txt'
+TITLES_FILE = 'movie_titles.csv'
+IMDB_TITLES_FILE = 'title.basics.tsv'
+IMDB_RATINGS_FILE = 'title.ratings.tsv'
+IMDB_FILE = 'imdb_df'
+INDEX_FILE = 'recommendations'
+PKL_EXT = '.pkl'
+CSV_EXT = '.csv'
+IDX_EXT = '.idx'
+DASH_UPDATE_URL = '/_dash-update-component'
+TAB2_OUTPUT = {'id': 'graph-with-slider', 'property': 'figure'}
+
+
+def parse_count(value):
+    """
+    Parses a count such as 100000, 1M or 2.5K.
+    Parameters:
+        value = String with the count.
+    Returns: The count as an int.
+    """
+    value = value.strip().upper()
+    if value and value[-1] in SCALE_SUFFIXES:
+        return int(float(value[:-1]) * SCALE_SUFFIXES[value[-1]])
+    return int(value)
+
+
+def measure(func, repeat):
+    """
+    Times a function and measures the peak of the memory it allocates.
+    Parameters:
+        func = Function without arguments.
+        repeat = Number of timed runs.
+    Returns: Dictionary with the best and mean time of the runs in seconds,
+    and the peak traced memory in MB of one more run.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'best_s': min(times), 'mean_s': sum(times) / len(times), 'repeat': repeat,
+            'peak_mb': peak / 2 ** 20}
+
+
+def generate_data(directory, args):
+    """
+    Generates the synthetic datasets and the processed files the app reads.
+    Parameters:
+        directory = Directory where the files are written.
+        args = Parsed command line arguments.
+    Returns: Dictionary with the paths and the dataframes used by the benchmarks.
+    """
+    paths = {name: os.path.join(directory, file_name) for name, file_name in [
+        ('ratings', RATINGS_FILE), ('titles', TITLES_FILE),
+        ('imdb_titles', IMDB_TITLES_FILE), ('imdb_ratings', IMDB_RATINGS_FILE)]}
+    synthetic.write_netflix_ratings(paths['ratings'], args.ratings, args.movies, args.users,
+                                    args.seed)
+    synthetic.get_movie_titles(args.movies, args.seed).to_csv(paths['titles'], index=False)
+    synthetic.write_imdb_files(paths['imdb_titles'], paths['imdb_ratings'], args.titles,
+                               args.seed)
+
+    data = {'paths': paths}
+    data['df_netflix'] = hf.read_ratings([paths['ratings']])
+    data['df_imdb_titles'] = pd.read_csv(paths['imdb_titles'], sep=TAB, na_values=NAS)
+    data['df_imdb_ratings'] = pd.read_csv(paths['imdb_ratings'], sep=TAB, na_values=NAS)
+    df_imdb = hf.clean_imdb_data(data['df_imdb_titles'], data['df_imdb_ratings'])
+    data['genres_vocab'] = hf.get_genre_vocabulary(hf.get_unique_genres(df_imdb))
+    df_imdb = hf.set_imdb_dtypes(hf.add_genre_mask(df_imdb, data['genres_vocab']))
+    hf.save_file(df_imdb, directory, IMDB_FILE, PKL_EXT)
+    hf.save_file(df_imdb, directory, IMDB_FILE, CSV_EXT)
+    hf.save_file(hf.get_recommendation_index(data['df_netflix'], args.workers), directory,
+                 INDEX_FILE, IDX_EXT)
+    paths['imdb_pkl'] = os.path.join(directory, IMDB_FILE + PKL_EXT)
+    paths['imdb_csv'] = os.path.join(directory, IMDB_FILE + CSV_EXT)
+    paths['index'] = os.path.join(directory, INDEX_FILE + IDX_EXT)
+    return data
+
+
+def get_tab2_request(selected_filters, selected_year, selected_type, selected_genre):
+    """
+    Builds the request that the browser sends to the callback of the second tab.
+    Returns: Dictionary with the JSON body of the request
+    """
+    inputs = [('filter-checklist', selected_filters), ('year-slider', selected_year),
+              ('title-type', selected_type), ('genre-dropdown', selected_genre)]
+    return {'output': TAB2_OUTPUT['id'] + '.' + TAB2_OUTPUT['property'],
+            'outputs': TAB2_OUTPUT,
+            'inputs': [{'id': component, 'property': 'value', 'value': value}
+                       for component, value in inputs],
+            'changedPropIds': ['filter-checklist.value']}
+
+
+def get_benchmarks(data, args):
+    """
+    Builds the benchmarked functions.
+    Parameters:
+        data = Dictionary from generate_data.
+        args = Parsed command line arguments.
+    Returns: List of (name, function without arguments).
+    """
+    paths = data['paths']
+    rng = random.Random(args.seed)
+    movies_df = nmr.reading_movie_title_csv(paths['titles'])
+    dict_rec = nmr.recommendation_for_movies(paths['index'])
+    title_index = nmr.build_title_index(movies_df)
+    indexed = movies_df[movies_df['Sno'].isin(dict_rec.keys())]['Display'].tolist()
+    selected_movies = [rng.choice(indexed) for _ in range(N_QUERIES)]
+
+    # The filters of the second tab, sent to the callback of app.py through the
+    # Dash endpoint of the Flask server.
+    registry = DataRegistry()
+    registry.register('imdb_df', imdb_service.load_data, paths['imdb_pkl'])
+    registry.register('genre_vocab', lambda: data['genres_vocab'])
+    registry.register('facet_index', lambda: imdb_service.build_facet_index(
+        registry.imdb_df, genres_vocab=registry.genre_vocab))
+    filters = [get_tab2_request(rng.choice([[], ['Genre'], ['Year'], ['Genre', 'Year']]),
+                                rng.randint(synthetic.FIRST_YEAR, synthetic.LAST_YEAR),
+                                rng.choice(hf.TYPE_FILTER), rng.choice(data['genres_vocab']))
+               for _ in range(N_QUERIES)]
+    registry.preload()
+    client = app.app.app.server.test_client()
+
+    def recommend_movies():
+        for selected_movie in selected_movies:
+            nmr.userchoice_based_movie_recommendation(selected_movie, movies_df, dict_rec,
+                                                      title_index)
+
+    def filter_chain():
+        app_data = app.app.DATA
+        app.app.DATA = registry
+        # Measures the rendering, not the response cache.
+        app.app.RESPONSES.clear()
+        try:
+            for body in filters:
+                response = client.post(DASH_UPDATE_URL, json=body)
+                if response.status_code != 200:
+                    raise RuntimeError('Callback failed: %s' % response.status_code)
+        finally:
+            app.app.DATA = app_data
+
+    return [
+        ('parse_data', lambda: hf.parse_data(paths['ratings'])),
+        ('read_ratings', lambda: hf.read_ratings([paths['ratings']])),
+        ('get_recommended_movies',
+         lambda: hf.get_recommended_movies(data['df_netflix'], args.workers)),
+        ('clean_imdb_data',
+         lambda: hf.clean_imdb_data(data['df_imdb_titles'], data['df_imdb_ratings'])),
+        ('read_and_clean_imdb_data',
+         lambda: hf.clean_imdb_data(hf.read_imdb_titles(paths['imdb_titles']),
+                                    hf.read_imdb_ratings(paths['imdb_ratings']))),
+        ('load_data_pkl', lambda: imdb_service.load_data(paths['imdb_pkl'])),
+        ('load_data_csv', lambda: imdb_service.load_data(paths['imdb_csv'])),
+        ('build_facet_index', lambda: imdb_service.build_facet_index(
+            registry.imdb_df, genres_vocab=data['genres_vocab'])),
+        ('userchoice_based_movie_recommendation_x%d' % N_QUERIES, recommend_movies),
+        ('update_figure_tab2_x%d' % N_QUERIES, filter_chain)]
+
+
+def get_version():
+    """
+    Returns: The git commit of the benchmarked code, or None outside a git checkout
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """
+    Runs the benchmarks and writes their results.
+    Parameters:
+        args = Parsed command line arguments.
+    Returns: Dictionary with the environment, the parameters and the results.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        data = generate_data(directory, args)
+        results = {}
+        for name, func in get_benchmarks(data, args):
+            base_name = name.split('_x')[0]
+            if (args.only and base_name not in args.only) or base_name in args.skip:
+                continue
+            results[name] = measure(func, args.repeat)
+            print('%-45s %9.3fs %9.1f MB' % (name, results[name]['best_s'],
+                                             results[name]['peak_mb']))
+    finally:
+        shutil.rmtree(directory)
+    report = {'version': get_version(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': sys.version.split()[0], 'numpy': np.__version__,
+              'pandas': pd.__version__, 'machine': platform.platform(),
+              'params': {name: value for name, value in vars(args).items()
+                         if name != 'output'},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print('Results written to', args.output)
+    return report
+
+
+def get_parser():
+    """
+    Returns: Parser of the command line arguments
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ratings', type=parse_count, default=10 ** 6,
+                        help='number of Netflix ratings, e.g. 1M, 10M or 100M')
+    parser.add_argument('--movies', type=parse_count, default=17770,
+                        help='number of Netflix movies')
+    parser.add_argument('--users', type=parse_count, default=480189,
+                        help='number of Netflix users')
+    parser.add_argument('--titles', type=parse_count, default=10 ** 6,
+                        help='number of IMDb titles')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes used to compute the similarities')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--only', nargs='+', default=[], metavar='NAME',
+                        help='only run these benchmarks')
+    parser.add_argument('--skip', nargs='+', default=[], metavar='NAME',
+                        help='do not run these benchmarks, e.g. parse_data at 100M')
+    parser.add_argument('--output', help='JSON file where the results are written')
+    return parser
+
+
+if __name__ == '__main__':
+    run(get_parser().parse_args())
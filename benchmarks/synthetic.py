@@ -0,0 +1,121 @@
+"""
+This module generates synthetic datasets in the formats of the Netflix Prize and IMDb
+files, at any scale, for the benchmarks.
+"""
+import numpy as np
+import pandas as pd
+
+TAB = '\t'
+NA_REP = '\\N'
+FIRST_DAY = np.datetime64('1999-11-11')
+LAST_DAY = np.datetime64('2005-12-31')
+POPULARITY_EXPONENT = 0.8
+MOVIES_PER_CHUNK = 1000
+TITLE_TYPES = ['movie', 'tvSeries', 'short', 'tvEpisode', 'video']
+TITLE_TYPE_WEIGHTS = [0.3, 0.1, 0.2, 0.3, 0.1]
+GENRES = ['Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime',
+          'Documentary', 'Drama', 'Family', 'Fantasy', 'History', 'Horror', 'Music',
+          'Musical', 'Mystery', 'News', 'Romance', 'Sci-Fi', 'Short', 'Sport',
+          'Thriller', 'War', 'Western']
+FIRST_YEAR = 1900
+LAST_YEAR = 2020
+MISSING_RATE = 0.05
+RATED_RATE = 0.8
+
+
+def get_movie_counts(n_ratings, n_movies, rng):
+    """
+    Draws the number of ratings of every movie, with a long tail of
+    unpopular movies as in the Netflix data.
+    Parameters:
+        n_ratings = Total number of ratings.
+        n_movies = Number of movies.
+        rng = NumPy random generator.
+    Returns: Array with the number of ratings of each movie.
+    """
+    popularity = 1 / np.arange(1, n_movies + 1) ** POPULARITY_EXPONENT
+    rng.shuffle(popularity)
+    return rng.multinomial(n_ratings, popularity / popularity.sum())
+
+
+def write_netflix_ratings(file_path, n_ratings, n_movies, n_users, seed=0):
+    """
+    Writes a ratings file in the format of the Netflix combined_data files,
+    generating MOVIES_PER_CHUNK movies at a time.
+    Parameters:
+        file_path = Path of the file to write.
+        n_ratings = Total number of ratings.
+        n_movies = Number of movies.
+        n_users = Number of users.
+        seed = Seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    counts = get_movie_counts(n_ratings, n_movies, rng)
+    n_days = int((LAST_DAY - FIRST_DAY).astype(int)) + 1
+    with open(file_path, 'w') as file:
+        for start in range(0, n_movies, MOVIES_PER_CHUNK):
+            chunk_counts = counts[start:start + MOVIES_PER_CHUNK]
+            size = int(chunk_counts.sum())
+            lines = pd.DataFrame({
+                'user_id': rng.integers(1, n_users + 1, size),
+                'rating': rng.integers(1, 6, size),
+                'rating_date': (FIRST_DAY + rng.integers(0, n_days, size)).astype(str)
+            }).to_csv(header=False, index=False).split('\n')
+            offset = 0
+            for movie, count in enumerate(chunk_counts.tolist(), start + 1):
+                file.write('%d:\n' % movie)
+                if count:
+                    file.write('\n'.join(lines[offset:offset + count]) + '\n')
+                offset += count
+
+
+def get_movie_titles(n_movies, seed=0):
+    """
+    Generates the processed movie titles, as stored by format_movie_titles.
+    Parameters:
+        n_movies = Number of movies.
+        seed = Seed of the random generator.
+    Returns: Dataframe with the columns Sno, Year, Final_title and Display.
+    """
+    rng = np.random.default_rng(seed)
+    years = rng.integers(FIRST_YEAR, LAST_YEAR + 1, n_movies).astype(str)
+    titles = pd.Series(np.arange(1, n_movies + 1)).map('Movie {}'.format)
+    return pd.DataFrame({'Sno': np.arange(1, n_movies + 1), 'Year': years,
+                         'Final_title': titles, 'Display': titles + ' - ' + years})
+
+
+def write_imdb_files(titles_path, ratings_path, n_titles, seed=0):
+    """
+    Writes the title basics and title ratings files in the IMDb tsv format,
+    with missing values written as \\N.
+    Parameters:
+        titles_path = Path of the title basics file to write.
+        ratings_path = Path of the title ratings file to write.
+        n_titles = Number of titles.
+        seed = Seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    tconst = pd.Series(np.arange(1, n_titles + 1)).map('tt{:07d}'.format)
+    n_genres = rng.integers(1, 4, n_titles)
+    genre_ids = rng.integers(0, len(GENRES), (n_titles, 3))
+    genres = [','.join(sorted(set(np.array(GENRES)[ids[:count]])))
+              for ids, count in zip(genre_ids, n_genres)]
+    years = pd.Series(rng.integers(FIRST_YEAR, LAST_YEAR + 1, n_titles), dtype='Int64')
+    years[rng.random(n_titles) < MISSING_RATE] = pd.NA
+    titles = pd.DataFrame({
+        'tconst': tconst,
+        'titleType': rng.choice(TITLE_TYPES, n_titles, p=TITLE_TYPE_WEIGHTS),
+        'primaryTitle': tconst.map('Title {}'.format),
+        'originalTitle': tconst.map('Title {}'.format),
+        'isAdult': 0,
+        'startYear': years,
+        'endYear': pd.Series(pd.NA, index=tconst.index, dtype='Int64'),
+        'runtimeMinutes': rng.integers(1, 200, n_titles),
+        'genres': genres})
+    titles.to_csv(titles_path, sep=TAB, index=False, na_rep=NA_REP)
+    rated = rng.random(n_titles) < RATED_RATE
+    pd.DataFrame({
+        'tconst': tconst[rated],
+        'averageRating': np.round(rng.uniform(1, 10, int(rated.sum())), 1),
+        'numVotes': rng.integers(5, 100000, int(rated.sum()))
+    }).to_csv(ratings_path, sep=TAB, index=False)
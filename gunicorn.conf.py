@@ -0,0 +1,19 @@
+"""
+This is the gunicorn configuration, read from the working directory.
+The warm-up is started in each worker once it has loaded the app, not when run.py is
+imported: with --preload, run.py is imported by the master, whose warm-up thread and
+caches would not be inherited by the forked workers, and which could fork while the
+thread holds the locks of the data registry or of the response cache.
+Set WARMUP=0 to turn it off.
+"""
+import os
+
+
+def post_worker_init(worker):  # pylint: disable=unused-argument
+    """
+    It starts the warm-up of the caches of a worker
+    """
+    if os.environ.get('WARMUP', '1') != '0':
+        # Imported here, as the master must not load the app when it is not preloaded.
+        from app.warmup import start_warm_up
+        start_warm_up()
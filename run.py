@@ -1,9 +1,29 @@
 """
-This code runs the dash setup for hosting the web-app
+This code runs the dash setup for hosting the web-app.
+Set PRELOAD_DATA=1 to load the data at startup instead of on first use; with
+gunicorn --preload the data is then loaded once in the master process and shared
+copy-on-write by the forked workers.
+The popular responses are warmed up in a background thread at startup; set
+WARMUP=0 to turn it off. Under gunicorn, the warm-up is started in each worker by
+gunicorn.conf.py instead.
 """
-from app.app import app
+import os
+import sys
+
+from app.app import app, DATA
+from app.warmup import start_warm_up
 
 server = app.server
 
+if os.environ.get('PRELOAD_DATA'):
+    DATA.preload()
+
+# The debug reloader imports this module in a watcher process that serves nothing.
+IS_RELOADER_WATCHER = __name__ == '__main__' and not os.environ.get('WERKZEUG_RUN_MAIN')
+# Gunicorn may import this module in its master (--preload), before forking the workers.
+IS_GUNICORN = 'gunicorn' in sys.modules
+if os.environ.get('WARMUP', '1') != '0' and not IS_RELOADER_WATCHER and not IS_GUNICORN:
+    start_warm_up()
+
 if __name__ == '__main__':
     app.run_server(debug=True)